@@ -6,8 +6,6 @@ from flask_jwt_extended import jwt_required
 from flask_jwt_extended import get_jwt
 
 from services.auth import AuthService
-from services.utils import get_token_from_header
-from core import config
 
 auth_router = Blueprint('auth_router', __name__)
 
@@ -47,6 +45,8 @@ def login_user(service: AuthService = AuthService()):
             description: Access and refresh tokens
             schema:
               $ref: '#/definitions/Tokens'
+          429:
+            description: Too many login attempts, see Retry-After header
         """
     data = request.form
 
@@ -54,6 +54,7 @@ def login_user(service: AuthService = AuthService()):
         login=data['username'],
         password=data['password'],
         user_agent=request.user_agent.string,
+        ip=request.remote_addr,
     )
 
     return response, HTTPStatus.OK
@@ -80,16 +81,44 @@ def logout_user(service: AuthService = AuthService()):
               name: message
               type: string
         """
-    jti = get_jwt()['jti']
+    payload_data = get_jwt()
 
     response = service.logout_user(
-        jti=jti,
-        time=config.JWT_ACCESS_TOKEN_EXPIRES,
+        jti=payload_data['jti'],
+        expires_at=payload_data['exp'],
+        sub=payload_data['sub'],
+        session_id=payload_data.get('sid'),
     )
 
     return response, HTTPStatus.OK
 
 
+@auth_router.route('/api/v1/logout/all', methods=('POST',))
+@jwt_required()
+def logout_all(service: AuthService = AuthService()):
+    """Выход пользователя со всех устройств. Отзывает все его токены и сессии.
+        ---
+        tags:
+          - Auth
+
+        parameters:
+          - in: header
+            name: access_token
+            type: string
+            required: true
+
+        responses:
+          200:
+            description: All sessions are closed
+            schema:
+              name: message
+              type: string
+        """
+    response = service.logout_all(sub=get_jwt()['sub'])
+
+    return response, HTTPStatus.OK
+
+
 @auth_router.route('/api/v1/refresh', methods=('POST',))
 @jwt_required(refresh=True)
 def refresh_tokens(service: AuthService = AuthService()):
@@ -115,12 +144,10 @@ def refresh_tokens(service: AuthService = AuthService()):
               $ref: '#/definitions/Tokens'
         """
     payload_data = get_jwt()
-    old_refresh_token = get_token_from_header(request)
 
     response = service.refresh_tokens(
         sub=payload_data['sub'],
-        additional_claims={'roles': payload_data['roles']},
-        refresh_token=old_refresh_token,
+        refresh_payload=payload_data,
     )
 
     return response, HTTPStatus.OK
@@ -7,6 +7,7 @@ from flask.globals import request
 from pydantic.error_wrappers import ValidationError
 from flask_jwt_extended import jwt_required
 
+from schemas.pagination import PaginationParamsSchema
 from schemas.roles import CreateRoleSchema
 from schemas.roles import UpdateRoleSchema
 from services.roles import RoleService
@@ -28,6 +29,25 @@ def get_roles(service: RoleService = RoleService()):
             name: access_token
             type: string
             required: true
+          - in: query
+            name: cursor
+            type: string
+            required: false
+            description: Курсор следующей страницы (next_cursor из предыдущего ответа)
+          - in: query
+            name: limit
+            type: integer
+            required: false
+          - in: query
+            name: stream
+            type: boolean
+            required: false
+            description: Отдавать ответ потоком (chunked), допускает больший limit
+          - in: query
+            name: with_total
+            type: boolean
+            required: false
+            description: Добавить в ответ примерное общее количество записей
 
         definitions:
           Role:
@@ -49,7 +69,18 @@ def get_roles(service: RoleService = RoleService()):
               items:
                 $ref: '#/definitions/Role'
         """
-    return service.list_all(), HTTPStatus.OK
+    try:
+        params = PaginationParamsSchema(**request.args)
+    except ValidationError as err:
+        abort_error(json.loads(err.json()))
+
+    response = service.list_all(
+        cursor=params.cursor,
+        limit=params.limit,
+        with_total=params.with_total,
+        stream=params.stream,
+    )
+    return response, HTTPStatus.OK
 
 
 @role_router.route('/api/v1/roles', methods=('POST', ))
@@ -7,7 +7,9 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from pydantic.error_wrappers import ValidationError
 
 from services.users import UserService
-from schemas.users import CreateUserSchema, ChangePasswordSchema
+from schemas.users import CreateUserSchema, ChangePasswordSchema, ListUsersParamsSchema
+from schemas.pagination import PaginationParamsSchema
+from schemas.roles import BulkRolesSchema
 from services.utils import abort_error
 
 user_router = Blueprint('user_router', __name__)
@@ -17,6 +19,7 @@ user_router = Blueprint('user_router', __name__)
 @jwt_required()
 def get_users(service: UserService = UserService()):
     """Получение всех юзеров.
+        Без параметров отдается полное представление с ролями.
         ---
         tags:
           - Users
@@ -26,6 +29,35 @@ def get_users(service: UserService = UserService()):
             name: access_token
             type: string
             required: true
+          - in: query
+            name: fields
+            type: string
+            required: false
+            description: Поля через запятую (id, login, email), id отдается всегда
+          - in: query
+            name: include
+            type: string
+            required: false
+            description: Связи через запятую (roles)
+          - in: query
+            name: cursor
+            type: string
+            required: false
+            description: Курсор следующей страницы (next_cursor из предыдущего ответа)
+          - in: query
+            name: limit
+            type: integer
+            required: false
+          - in: query
+            name: stream
+            type: boolean
+            required: false
+            description: Отдавать ответ потоком (chunked), допускает больший limit
+          - in: query
+            name: with_total
+            type: boolean
+            required: false
+            description: Добавить в ответ примерное общее количество записей
 
         definitions:
           User:
@@ -67,7 +99,20 @@ def get_users(service: UserService = UserService()):
               items:
                 $ref: '#/definitions/User'
         """
-    return service.list_all(), HTTPStatus.OK
+    try:
+        params = ListUsersParamsSchema(**request.args)
+    except ValidationError as err:
+        abort_error(json.loads(err.json()))
+
+    response = service.list_all(
+        fields=params.fields,
+        include=params.include,
+        cursor=params.cursor,
+        limit=params.limit,
+        with_total=params.with_total,
+        stream=params.stream,
+    )
+    return response, HTTPStatus.OK
 
 
 @user_router.route('/api/v1/users', methods=('POST', ))
@@ -163,6 +208,25 @@ def get_login_history_of_user(user_id, service: UserService = UserService()):
             name: user_id
             type: string
             required: true
+          - in: query
+            name: cursor
+            type: string
+            required: false
+            description: Курсор следующей страницы (next_cursor из предыдущего ответа)
+          - in: query
+            name: limit
+            type: integer
+            required: false
+          - in: query
+            name: stream
+            type: boolean
+            required: false
+            description: Отдавать ответ потоком (chunked), допускает больший limit
+          - in: query
+            name: with_total
+            type: boolean
+            required: false
+            description: Добавить в ответ примерное общее количество записей
 
         responses:
           200:
@@ -173,7 +237,19 @@ def get_login_history_of_user(user_id, service: UserService = UserService()):
     if get_jwt_identity() != str(user_id):
         abort_error('Получить информацию о истории входа может только ее владелец.')
 
-    return service.get_login_history_of_user(user_id), HTTPStatus.OK
+    try:
+        params = PaginationParamsSchema(**request.args)
+    except ValidationError as err:
+        abort_error(json.loads(err.json()))
+
+    response = service.get_login_history_of_user(
+        user_id,
+        cursor=params.cursor,
+        limit=params.limit,
+        with_total=params.with_total,
+        stream=params.stream,
+    )
+    return response, HTTPStatus.OK
 
 
 @user_router.route('/api/v1/users/<uuid:role_id>/roles', methods=('POST', ))
@@ -248,3 +324,92 @@ def delete_role_from_user(role_id: UUID, service: UserService = UserService()):
     )
 
     return response, HTTPStatus.OK
+
+
+@user_router.route('/api/v1/users/roles/bulk', methods=('POST', ))
+@jwt_required()
+def bulk_assign_roles(service: UserService = UserService()):
+    """Массовое назначение ролей: список пар или роль всем пользователям по условию.
+        ---
+        tags:
+          - Users
+
+        parameters:
+          - in: header
+            name: access_token
+            type: string
+            required: true
+
+          - in: body
+            name: body
+            required: true
+            schema:
+              $ref: '#/definitions/BulkRoles'
+
+        definitions:
+          BulkRoles:
+            properties:
+              pairs:
+                type: array
+                items:
+                  properties:
+                    user_id:
+                      type: string
+                    role_id:
+                      type: string
+              role_id:
+                type: string
+                description: Роль для всех пользователей из users
+              users:
+                properties:
+                  login_prefix:
+                    type: string
+                  email_domain:
+                    type: string
+                  has_role_id:
+                    type: string
+                  all_users:
+                    type: boolean
+
+        responses:
+          200:
+            description: Количество изменений и результат по каждой паре
+        """
+    try:
+        data = BulkRolesSchema(**(request.get_json(silent=True) or {}))
+    except ValidationError as err:
+        abort_error(json.loads(err.json()))
+
+    return service.bulk_assign_roles(data), HTTPStatus.OK
+
+
+@user_router.route('/api/v1/users/roles/bulk', methods=('DELETE', ))
+@jwt_required()
+def bulk_revoke_roles(service: UserService = UserService()):
+    """Массовый отзыв ролей: список пар или роль у всех пользователей по условию.
+        ---
+        tags:
+          - Users
+
+        parameters:
+          - in: header
+            name: access_token
+            type: string
+            required: true
+
+          - in: body
+            name: body
+            required: true
+            schema:
+              $ref: '#/definitions/BulkRoles'
+
+        responses:
+          200:
+            description: Количество изменений и результат по каждой паре
+        """
+    try:
+        data = BulkRolesSchema(**(request.get_json(silent=True) or {}))
+    except ValidationError as err:
+        abort_error(json.loads(err.json()))
+
+    return service.bulk_revoke_roles(data), HTTPStatus.OK
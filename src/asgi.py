@@ -0,0 +1,306 @@
+"""Асинхронный режим: ASGI приложение для uvicorn.
+
+Логин, логаут (с одного или всех устройств), refresh, регистрация, смена пароля и история входов обрабатываются
+асинхронными сервисами: ожидание postgres, redis и пула хеширования не занимает
+поток, и один процесс держит тысячи соединений. Остальные запросы, а также
+варианты, которых нет в асинхронных сервисах (stream, with_total, multipart формы),
+передаются flask приложению через WsgiToAsgi.
+
+Запуск из каталога src: uvicorn asgi:application --workers 4 --port 4000
+"""
+import re
+import time
+import json as std_json
+from http import HTTPStatus
+from typing import Optional
+from urllib.parse import parse_qsl
+from uuid import UUID
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import json
+from flask_jwt_extended import decode_token
+from jwt.exceptions import ExpiredSignatureError
+from jwt.exceptions import InvalidTokenError
+from pydantic import ValidationError
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException
+
+from base.low_level import AsyncCacheRedis
+from base.revocation import issued_at_ms
+from base.revocation import revoked_tokens_filter
+from main import app as flask_app
+from metrics import REQUEST_LATENCY
+from schemas.pagination import PaginationParamsSchema
+from schemas.users import ChangePasswordSchema
+from schemas.users import CreateUserSchema
+from services.auth import AsyncAuthService
+from services.users import AsyncUserService
+from services.utils import abort_error
+
+FORM_CONTENT_TYPE = 'application/x-www-form-urlencoded'
+
+
+class Delegate(Exception):
+    """Запрос нужно отдать синхронному flask приложению."""
+
+
+class AsyncRequest:
+    """Минимальный запрос поверх ASGI scope с уже прочитанным телом."""
+
+    def __init__(self, scope: dict, body: bytes, path_params: dict):
+        self.scope = scope
+        self.body = body
+        self.path_params = path_params
+        self.method = scope['method']
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        self.args = MultiDict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+
+    @property
+    def form(self) -> MultiDict:
+        if self.body and not self.headers.get('content-type', '').startswith(FORM_CONTENT_TYPE):
+            raise Delegate
+        return MultiDict(parse_qsl(self.body.decode()))
+
+    @property
+    def user_agent(self) -> str:
+        return self.headers.get('user-agent', '')
+
+    @property
+    def client_ip(self) -> Optional[str]:
+        client = self.scope.get('client')
+        return client[0] if client else None
+
+
+class JwtError(Exception):
+
+    def __init__(self, message: str, status: int):
+        self.message = message
+        self.status = status
+
+
+async def get_jwt(request: AsyncRequest, refresh: bool = False, cache=AsyncCacheRedis()) -> dict:
+    """Проверка токена как в jwt_required(): подпись, тип токена, отзыв всех токенов пользователя и логаут."""
+    header = request.headers.get('authorization', '')
+    if not header.startswith('Bearer '):
+        raise JwtError('Missing Authorization Header', HTTPStatus.UNAUTHORIZED)
+
+    try:
+        payload = decode_token(header.removeprefix('Bearer '))
+    except ExpiredSignatureError:
+        raise JwtError('Token has expired', HTTPStatus.UNAUTHORIZED)
+    except InvalidTokenError as error:
+        raise JwtError(str(error), HTTPStatus.UNPROCESSABLE_ENTITY)
+
+    if refresh and payload['type'] != 'refresh':
+        raise JwtError('Only refresh tokens are allowed', HTTPStatus.UNPROCESSABLE_ENTITY)
+    if not refresh and payload['type'] == 'refresh':
+        raise JwtError('Only non-refresh tokens are allowed', HTTPStatus.UNPROCESSABLE_ENTITY)
+
+    revoked = revoked_tokens_filter.check_user_locally(payload['sub'], issued_at_ms(payload))
+    if revoked is None:
+        stamp = await cache.get_by_key(revoked_tokens_filter.not_before_key(payload['sub']))
+        revoked = stamp is not None and issued_at_ms(payload) < int(stamp)
+    if revoked:
+        raise JwtError('Token has been revoked', HTTPStatus.UNAUTHORIZED)
+
+    if revoked_tokens_filter.might_be_revoked(payload['jti']):
+        if await cache.get_by_key(payload['jti']) is not None:
+            raise JwtError('Token has been revoked', HTTPStatus.UNAUTHORIZED)
+        revoked_tokens_filter.record_false_positive()
+
+    return payload
+
+
+def validate(schema, data: MultiDict):
+    try:
+        return schema(**data)
+    except ValidationError as err:
+        abort_error(std_json.loads(err.json()))
+
+
+async def login_user(request: AsyncRequest, service=AsyncAuthService()):
+    data = request.form
+    response = await service.login_user(
+        login=data['username'],
+        password=data['password'],
+        user_agent=request.user_agent,
+        ip=request.client_ip,
+    )
+    return response, HTTPStatus.OK
+
+
+async def logout_user(request: AsyncRequest, service=AsyncAuthService()):
+    payload = await get_jwt(request)
+    response = await service.logout_user(
+        jti=payload['jti'],
+        expires_at=payload['exp'],
+        sub=payload['sub'],
+        session_id=payload.get('sid'),
+    )
+    return response, HTTPStatus.OK
+
+
+async def logout_all(request: AsyncRequest, service=AsyncAuthService()):
+    payload = await get_jwt(request)
+    response = await service.logout_all(sub=payload['sub'])
+    return response, HTTPStatus.OK
+
+
+async def refresh_tokens(request: AsyncRequest, service=AsyncAuthService()):
+    payload = await get_jwt(request, refresh=True)
+    response = await service.refresh_tokens(sub=payload['sub'], refresh_payload=payload)
+    return response, HTTPStatus.OK
+
+
+async def create_user(request: AsyncRequest, service=AsyncUserService()):
+    data = validate(CreateUserSchema, request.form)
+    return await service.create(data), HTTPStatus.CREATED
+
+
+async def change_user_password(request: AsyncRequest, service=AsyncUserService()):
+    await get_jwt(request)
+    data = validate(ChangePasswordSchema, request.form)
+    response = await service.change_user_password(request.path_params['user_id'], data)
+    return response, HTTPStatus.OK
+
+
+async def get_login_history_of_user(request: AsyncRequest, service=AsyncUserService()):
+    payload = await get_jwt(request)
+    user_id = request.path_params['user_id']
+    if payload['sub'] != str(user_id):
+        abort_error('Получить информацию о истории входа может только ее владелец.')
+
+    params = validate(PaginationParamsSchema, request.args)
+    if params.stream or params.with_total:
+        raise Delegate
+
+    response = await service.get_login_history_of_user(user_id, cursor=params.cursor, limit=params.limit)
+    return response, HTTPStatus.OK
+
+
+UUID_PATTERN = '[0-9a-fA-F-]{32,36}'
+
+# Метод, правило flask (для метрик, как у синхронного приложения), шаблон пути и обработчик
+ROUTES = [
+    ('POST', '/api/v1/login', '/api/v1/login', login_user),
+    ('POST', '/api/v1/logout', '/api/v1/logout', logout_user),
+    ('POST', '/api/v1/logout/all', '/api/v1/logout/all', logout_all),
+    ('POST', '/api/v1/refresh', '/api/v1/refresh', refresh_tokens),
+    ('POST', '/api/v1/users', '/api/v1/users', create_user),
+    (
+        'POST',
+        '/api/v1/users/<uuid:user_id>/new-password',
+        f'/api/v1/users/(?P<user_id>{UUID_PATTERN})/new-password',
+        change_user_password,
+    ),
+    (
+        'GET',
+        '/api/v1/users/<uuid:user_id>/login-history',
+        f'/api/v1/users/(?P<user_id>{UUID_PATTERN})/login-history',
+        get_login_history_of_user,
+    ),
+]
+COMPILED_ROUTES = [(method, rule, re.compile(f'{pattern}/?'), handler) for method, rule, pattern, handler in ROUTES]
+
+
+def match_route(method: str, path: str):
+    for route_method, rule, pattern, handler in COMPILED_ROUTES:
+        matched = pattern.fullmatch(path)
+        if route_method == method and matched:
+            try:
+                return rule, handler, {name: UUID(value) for name, value in matched.groupdict().items()}
+            except ValueError:
+                return None
+    return None
+
+
+async def read_body(receive) -> bytes:
+    body, more_body = b'', True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return body
+
+
+def replay(body: bytes, receive):
+    """receive для flask: сначала уже прочитанное тело, затем исходный канал (disconnect)."""
+    sent = False
+
+    async def inner():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        return await receive()
+
+    return inner
+
+
+async def send_response(
+        send, status: int, body: bytes, content_type: str = 'application/json', headers: tuple = (),
+) -> None:
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', content_type.encode()),
+            (b'content-length', str(len(body)).encode()),
+            *headers,
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class AuthApplication:
+    """ASGI приложение: асинхронные обработчики горячих путей и flask для всего остального."""
+
+    def __init__(self, app=flask_app):
+        self.app = app
+        self.wsgi = WsgiToAsgi(app)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        route = match_route(scope['method'], scope['path'])
+        headers = dict(scope['headers'])
+        # Без X-Request-Id запрос обрабатывает flask со своей проверкой заголовка
+        if route is None or b'x-request-id' not in headers:
+            return await self.wsgi(scope, receive, send)
+
+        rule, handler, path_params = route
+        body = await read_body(receive)
+        request = AsyncRequest(scope, body, path_params)
+        started = time.perf_counter()
+
+        extra_headers = ()
+        with self.app.app_context():
+            try:
+                response, status = await handler(request)
+                payload = json.dumps(response).encode()
+            except Delegate:
+                return await self.wsgi(scope, replay(body, receive), send)
+            except JwtError as error:
+                status, payload = error.status, json.dumps({'msg': error.message}).encode()
+            except HTTPException as error:
+                error_response = error.get_response()
+                status, payload = error_response.status_code, error_response.get_data()
+                if 'Retry-After' in error_response.headers:
+                    extra_headers = ((b'retry-after', error_response.headers['Retry-After'].encode()),)
+
+        await send_response(send, status, payload, headers=extra_headers)
+        REQUEST_LATENCY.labels(scope['method'], rule, status).observe(time.perf_counter() - started)
+
+    @staticmethod
+    async def lifespan(receive, send) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+application = AuthApplication()
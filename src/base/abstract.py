@@ -1,4 +1,9 @@
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Iterator, Optional, Union
+
+# Связи для загрузки: список имен (selectin) или словарь {имя: 'selectin' | 'joined' | 'subquery'}
+Relations = Optional[Union[list, dict]]
 
 
 class AbstractTokenizer(ABC):
@@ -13,7 +18,35 @@ class AbstractTokenizer(ABC):
         pass
 
     @abstractmethod
-    def verify_refresh_token_in_redis(self, *args, **kwargs):
+    def revoke_session(self, *args, **kwargs):
+        pass
+
+    @abstractmethod
+    def revoke_all_sessions(self, *args, **kwargs):
+        pass
+
+
+class AbstractSessionStore(ABC):
+    """Абстрактный класс хранилища сессий (устройств) пользователя.
+        Для каждой сессии хранится только хеш jti текущего refresh токена.
+    """
+
+    @abstractmethod
+    def create(self, user_id, session_id: str, refresh_jti: str, user_agent: str = '') -> None:
+        """Добавляет сессию. Если сессий больше лимита, удаляются самые старые."""
+        pass
+
+    @abstractmethod
+    def rotate(self, user_id, session_id: str, refresh_jti: str, new_refresh_jti: str) -> bool:
+        """Атомарно заменяет refresh токен сессии, если предъявлен текущий. False - токен не действителен."""
+        pass
+
+    @abstractmethod
+    def revoke(self, user_id, session_id: str, pipe=None) -> None:
+        pass
+
+    @abstractmethod
+    def revoke_all(self, user_id, pipe=None) -> None:
         pass
 
 
@@ -28,6 +61,46 @@ class AbstractCache(ABC):
     def get_by_key(self, key, err_text=None):
         pass
 
+    @abstractmethod
+    def delete(self, *keys, err_text=None) -> None:
+        """Удаление ключей за один запрос."""
+        pass
+
+    @abstractmethod
+    def mget(self, keys: list, err_text=None) -> list:
+        """Получение значений нескольких ключей за один запрос."""
+        pass
+
+    @abstractmethod
+    def pipeline(self, transaction: bool = False, err_text=None):
+        """Контекстный менеджер для отправки нескольких команд за один запрос."""
+        pass
+
+
+class AbstractAsyncCache(ABC):
+    """Абстрактный класс для работы с кешем из асинхронного кода."""
+
+    @abstractmethod
+    async def set_with_expiry(self, key, value, time, err_text=None) -> None:
+        pass
+
+    @abstractmethod
+    async def get_by_key(self, key, err_text=None):
+        pass
+
+    @abstractmethod
+    async def delete(self, *keys, err_text=None) -> None:
+        pass
+
+    @abstractmethod
+    async def mget(self, keys: list, err_text=None) -> list:
+        pass
+
+    @abstractmethod
+    def pipeline(self, transaction: bool = False, err_text=None):
+        """Асинхронный контекстный менеджер: команды копятся и уходят одним запросом при execute()."""
+        pass
+
 
 class AbstractORM(ABC):
     """Абстрактный класс для работы с ORM."""
@@ -37,9 +110,47 @@ class AbstractORM(ABC):
         """Инициализация подключения к БД."""
         pass
 
+    @contextmanager
+    def using_primary(self):
+        """Чтения внутри блока идут на мастер. Без реплик ничего не меняет."""
+        yield self
+
+    @abstractmethod
+    def get_all(self, model, fields: Optional[list] = None, relations: Relations = None):
+        """Получение всех записей.
+            fields - загружаемые колонки, relations - загружаемые связи (None - как задано в модели),
+            незапрошенные связи при этом не загружаются совсем.
+        """
+        pass
+
+    @abstractmethod
+    def get_page(
+            self,
+            model,
+            ordering: tuple,
+            limit: int,
+            after: Optional[dict] = None,
+            filter_: Optional[dict] = None,
+            fields: Optional[list] = None,
+            relations: Relations = None,
+    ) -> tuple[list, bool]:
+        """Получение страницы записей keyset пагинацией.
+            ordering - колонки ключа ('-' в начале для убывания, направление у всех одно),
+            after - значения ключа последней записи предыдущей страницы.
+            Возвращает записи и признак наличия следующей страницы.
+        """
+        pass
+
     @abstractmethod
-    def get_all(self, model):
-        """Получение всех записей."""
+    def iter_page(self, model, ordering: tuple, limit: int, **kwargs) -> Iterator:
+        """Та же страница, что и в get_page (limit + 1 запись), но записи отдаются
+            потоком с серверного курсора, не загружаясь в память целиком.
+        """
+        pass
+
+    @abstractmethod
+    def count(self, model, filter_: Optional[dict] = None) -> int:
+        """Количество записей по фильтру."""
         pass
 
     @abstractmethod
@@ -47,11 +158,26 @@ class AbstractORM(ABC):
         """Получение всех записей по фильтру."""
         pass
 
+    @abstractmethod
+    def get_one_by_filter(self, model, filter_: dict, relations: Relations = None):
+        """Получение одной записи по фильтру вместе с нужными связями."""
+        pass
+
+    @abstractmethod
+    def get_related_values(self, model, relation: str, column: str, filter_: dict) -> list:
+        """Значения колонки связанных записей одним запросом (например, имена ролей пользователя)."""
+        pass
+
     @abstractmethod
     def get_by_id(self, model, id_):
         """Получение записи по id."""
         pass
 
+    @abstractmethod
+    def update_by_filter(self, model, filter_: dict, values: dict):
+        """Обновление полей записей по фильтру без загрузки объектов."""
+        pass
+
     @abstractmethod
     def add_obj(self, obj, schema=None):
         """Добавление объекта в БД."""
@@ -71,3 +197,83 @@ class AbstractORM(ABC):
     def remove_from_many_to_many(self, *args, **kwargs):
         """Удаление айдишников из m2m таблицы."""
         pass
+
+    @abstractmethod
+    def bulk_add_to_many_to_many(self, m2m_table, rows: list[dict]) -> list[dict]:
+        """Добавление многих пар одним INSERT ... ON CONFLICT DO NOTHING.
+            Пары с несуществующими айдишниками пропускаются. Возвращает добавленные пары.
+        """
+        pass
+
+    @abstractmethod
+    def bulk_remove_from_many_to_many(self, m2m_table, rows: list[dict]) -> list[dict]:
+        """Удаление многих пар одним DELETE ... USING. Возвращает удаленные пары."""
+        pass
+
+    @abstractmethod
+    def add_to_many_to_many_by_filter(self, m2m_table, model, criteria: list, column_name: str, values_: dict) -> list:
+        """Связывает все записи model, подходящие под criteria, с фиксированными values_ одним запросом.
+            Возвращает айдишники записей, для которых связь добавлена.
+        """
+        pass
+
+    @abstractmethod
+    def remove_from_many_to_many_by_filter(
+            self, m2m_table, model, criteria: list, column_name: str, values_: dict,
+    ) -> list:
+        """Удаляет связи записей model, подходящих под criteria, одним запросом. Возвращает их айдишники."""
+        pass
+
+    @abstractmethod
+    def get_existing_ids(self, model, ids: list) -> set:
+        """Айдишники из списка, для которых есть записи."""
+        pass
+
+    @abstractmethod
+    def bulk_insert_ignore_conflicts(self, model, rows: list[dict], returning: str) -> list:
+        """Вставка пачки записей одним INSERT ... ON CONFLICT DO NOTHING.
+            Возвращает значения колонки returning для вставленных записей.
+        """
+        pass
+
+
+class AbstractAsyncORM(ABC):
+    """Абстрактный класс для работы с ORM из асинхронного кода.
+        Содержит только операции, нужные асинхронным сервисам. Связи не подгружаются
+        лениво, поэтому все нужные связи передаются в relations.
+    """
+
+    @abstractmethod
+    def __init__(self, session_factory):
+        """Каждая операция открывает свою сессию: одну AsyncSession нельзя делить между задачами."""
+        pass
+
+    @abstractmethod
+    async def get_page(
+            self,
+            model,
+            ordering: tuple,
+            limit: int,
+            after: Optional[dict] = None,
+            filter_: Optional[dict] = None,
+            fields: Optional[list] = None,
+            relations: Relations = None,
+    ) -> tuple[list, bool]:
+        """Страница записей keyset пагинацией, как в AbstractORM.get_page."""
+        pass
+
+    @abstractmethod
+    async def get_one_by_filter(self, model, filter_: dict, relations: Relations = None):
+        pass
+
+    @abstractmethod
+    async def get_related_values(self, model, relation: str, column: str, filter_: dict) -> list:
+        pass
+
+    @abstractmethod
+    async def update_by_filter(self, model, filter_: dict, values: dict):
+        pass
+
+    @abstractmethod
+    async def add_obj(self, obj, schema=None):
+        pass
@@ -8,7 +8,6 @@ from .low_level import JwtTokenizer
 class BaseAuthService(CacheRedisMixin, SqlalchemyORMMixin):
     """Базовый класс для аутентификации."""
 
-    @trace
     def __init__(self, tokenizer: AbstractTokenizer = JwtTokenizer()):
         super().__init__()
         self.tokenizer = tokenizer
@@ -0,0 +1,227 @@
+import os
+import time
+import asyncio
+import threading
+import multiprocessing
+from http import HTTPStatus
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from functools import lru_cache
+from functools import partial
+from typing import Optional
+
+from passlib.context import CryptContext
+
+from core import config
+from metrics import PASSWORD_HASHING_LATENCY
+from services.utils import abort_error
+
+
+@lru_cache(maxsize=8)
+def get_crypt_context(rounds: int) -> CryptContext:
+    """Политика хеширования: хеши с другим числом раундов считаются устаревшими."""
+    return CryptContext(
+        schemes=['pbkdf2_sha256'],
+        pbkdf2_sha256__default_rounds=rounds,
+        pbkdf2_sha256__min_rounds=rounds,
+        pbkdf2_sha256__max_rounds=rounds,
+    )
+
+
+def _call(rounds: int, method: str, *args):
+    """Выполняется в процессе пула: вызывает метод политики хеширования."""
+    return getattr(get_crypt_context(rounds), method)(*args)
+
+
+class PasswordHashingExecutor:
+    """Хеширование и проверка паролей в отдельном пуле процессов.
+
+    pbkdf2 нагружает CPU на десятки миллисекунд, поэтому вынесен из потока запроса.
+    Очередь ограничена: если она заполнена, запрос сразу получает 503,
+    а не ждет, блокируя воркер.
+    """
+
+    def __init__(
+            self,
+            rounds: int = config.PASSWORD_HASH_ROUNDS,
+            workers: int = config.HASHING_WORKERS,
+            queue_size: int = config.HASHING_QUEUE_SIZE,
+            timeout: float = config.HASHING_TIMEOUT,
+    ):
+        self.rounds = rounds
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.counters = {'completed': 0, 'rejected': 0, 'timeouts': 0}
+        self._in_flight = 0
+        self._slots = threading.BoundedSemaphore(workers + queue_size) if workers else None
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """Пул создается лениво и заново в каждом процессе (в том числе после fork)."""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    context = multiprocessing.get_context('forkserver')
+                    context.set_forkserver_preload(['passlib.context', 'passlib.hash'])
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                    self._pid = os.getpid()
+        return self._pool
+
+    def _release(self, _future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def _run(self, method: str, *args):
+        with PASSWORD_HASHING_LATENCY.labels(method).time():
+            if not self.workers:
+                result = _call(self.rounds, method, *args)
+            else:
+                try:
+                    result = self._submit(method, *args).result(timeout=self.timeout)
+                except FutureTimeoutError:
+                    self._abort_timeout()
+
+        self.counters['completed'] += 1
+        return result
+
+    async def _run_async(self, method: str, *args):
+        """То же, что _run, но ожидание результата не блокирует event loop."""
+        with PASSWORD_HASHING_LATENCY.labels(method).time():
+            if not self.workers:
+                # Без пула процессов считаем в потоке, чтобы не останавливать остальные запросы
+                call = partial(_call, self.rounds, method, *args)
+                result = await asyncio.get_running_loop().run_in_executor(None, call)
+            else:
+                try:
+                    result = await asyncio.wait_for(asyncio.wrap_future(self._submit(method, *args)), self.timeout)
+                except asyncio.TimeoutError:
+                    self._abort_timeout()
+
+        self.counters['completed'] += 1
+        return result
+
+    def _submit(self, method: str, *args) -> Future:
+        """Ставит задачу в пул или сразу отвечает 503, если очередь заполнена."""
+        if not self._slots.acquire(blocking=False):
+            self.counters['rejected'] += 1
+            abort_error('Сервис перегружен, повторите попытку позже.', HTTPStatus.SERVICE_UNAVAILABLE)
+
+        try:
+            future = self._get_pool().submit(_call, self.rounds, method, *args)
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_flight += 1
+        # Слот освобождается по факту завершения задачи, а не по таймауту ожидания
+        future.add_done_callback(self._release)
+        return future
+
+    def _abort_timeout(self):
+        self.counters['timeouts'] += 1
+        abort_error('Превышено время проверки пароля.', HTTPStatus.SERVICE_UNAVAILABLE)
+
+    def hash(self, password: str) -> str:
+        return self._run('hash', password)
+
+    def verify(self, password: str, password_hash: str) -> bool:
+        return self._run('verify', password, password_hash)
+
+    def verify_and_update(self, password: str, password_hash: str) -> tuple[bool, Optional[str]]:
+        """Проверяет пароль и, если хеш устарел по политике, возвращает новый хеш."""
+        return self._run('verify_and_update', password, password_hash)
+
+    async def hash_async(self, password: str) -> str:
+        return await self._run_async('hash', password)
+
+    async def verify_and_update_async(self, password: str, password_hash: str) -> tuple[bool, Optional[str]]:
+        return await self._run_async('verify_and_update', password, password_hash)
+
+    def hash_many(self, passwords: list[str]) -> list[str]:
+        """Хеширует пачку паролей на всех процессах пула. Для офлайн задач (импорт),
+            поэтому ограничение очереди и таймаут запросов здесь не применяются.
+        """
+        if not self.workers:
+            return [_call(self.rounds, 'hash', password) for password in passwords]
+
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        hashes = list(self._get_pool().map(partial(_call, self.rounds, 'hash'), passwords, chunksize=chunksize))
+        self.counters['completed'] += len(hashes)
+        return hashes
+
+    def identify(self, password_hash: str) -> bool:
+        """Проверяет, что строка - хеш в формате текущей политики (число раундов может отличаться)."""
+        return get_crypt_context(self.rounds).identify(password_hash, required=False) is not None
+
+    def shutdown(self) -> None:
+        """Дожидается задач в работе и останавливает пул процессов, если он создан в этом процессе."""
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.shutdown(wait=True)
+            self._pool, self._pid = None, None
+
+    def stats(self) -> dict:
+        """Метрики пула: задачи в работе, глубина очереди и счетчики."""
+        in_flight = self._in_flight
+        return {
+            **self.counters,
+            'workers': self.workers,
+            'queue_size': self.queue_size,
+            'in_flight': in_flight,
+            'queue_depth': max(0, in_flight - self.workers),
+        }
+
+
+def _measure_verify(rounds: int, samples: int) -> list[float]:
+    """Время проверки пароля в мс на текущей машине."""
+    context = get_crypt_context(rounds)
+    password_hash = context.hash('calibration-Password1')
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        context.verify('calibration-Password1', password_hash)
+        timings.append((time.perf_counter() - started) * 1000)
+    return sorted(timings)
+
+
+def _percentile(timings: list[float], percentile: float) -> float:
+    index = min(len(timings) - 1, max(0, round(percentile / 100 * len(timings)) - 1))
+    return timings[index]
+
+
+def calibrate_rounds(
+        budget_ms: float = config.PASSWORD_HASH_BUDGET_MS,
+        percentile: float = 99,
+        samples: int = 50,
+        probe_rounds: int = 10000,
+) -> dict:
+    """Подбирает число раундов pbkdf2, при котором перцентиль времени verify укладывается в бюджет.
+        Сначала оценивает стоимость одного раунда, затем уменьшает кандидата, пока замер не уложится.
+    """
+    probe = _percentile(_measure_verify(probe_rounds, samples), percentile)
+    rounds = max(1000, int(probe_rounds * budget_ms / probe))
+
+    while True:
+        timings = _measure_verify(rounds, samples)
+        latency = _percentile(timings, percentile)
+        if latency <= budget_ms or rounds <= 1000:
+            break
+        rounds = max(1000, int(rounds * budget_ms / latency * 0.95))
+
+    return {
+        'rounds': rounds,
+        'budget_ms': budget_ms,
+        'percentile': percentile,
+        'latency_ms': round(latency, 2),
+        'median_ms': round(_percentile(timings, 50), 2),
+        'current_rounds': config.PASSWORD_HASH_ROUNDS,
+    }
+
+
+password_hasher = PasswordHashingExecutor()
@@ -0,0 +1,121 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from flask_jwt_extended import JWTManager
+from flask_jwt_extended.config import config as jwt_config
+
+from core import config
+
+
+class VerifiedTokenCache:
+    """LRU кеш claims уже проверенных токенов, ключ - дайджест токена.
+
+    Запись живет до exp токена и вытесняется по числу записей и по оценке
+    занимаемой памяти. Проверка отзыва токена (blocklist) выполняется
+    на каждом запросе независимо от кеша, отозванные токены дополнительно
+    удаляются из кеша по jti.
+    """
+
+    def __init__(
+            self,
+            enabled: bool = config.VERIFIED_JWT_CACHE_ENABLED,
+            max_entries: int = config.VERIFIED_JWT_CACHE_MAX_ENTRIES,
+            max_bytes: int = config.VERIFIED_JWT_CACHE_MAX_BYTES,
+    ):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.counters = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'revoked': 0}
+        self._entries = OrderedDict()
+        self._digests_by_jti = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(encoded_token: str) -> bytes:
+        return hashlib.blake2b(encoded_token.encode(), digest_size=16).digest()
+
+    @staticmethod
+    def _estimate_size(encoded_token: str) -> int:
+        # Дайджест, декодированные claims (по размеру сопоставимы с токеном) и служебные структуры
+        return 16 + len(encoded_token) * 2 + 200
+
+    def _remove(self, digest: bytes) -> None:
+        claims, _, size = self._entries.pop(digest)
+        self._digests_by_jti.pop(claims.get('jti'), None)
+        self._bytes -= size
+
+    def get(self, encoded_token: str, leeway: float = 0) -> Optional[dict]:
+        digest = self._digest(encoded_token)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+            if entry[1] + leeway <= time.time():
+                self._remove(digest)
+                self.counters['expired'] += 1
+                self.counters['misses'] += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.counters['hits'] += 1
+            return dict(entry[0])
+
+    def put(self, encoded_token: str, claims: dict) -> None:
+        if 'exp' not in claims:
+            return
+
+        digest = self._digest(encoded_token)
+        size = self._estimate_size(encoded_token)
+        with self._lock:
+            if digest in self._entries:
+                self._remove(digest)
+            self._entries[digest] = (dict(claims), claims['exp'], size)
+            self._digests_by_jti[claims.get('jti')] = digest
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.counters['evictions'] += 1
+
+    def evict_jti(self, jti: str) -> None:
+        """Удаляет из кеша отозванный токен."""
+        with self._lock:
+            digest = self._digests_by_jti.get(jti)
+            if digest is not None and digest in self._entries:
+                self._remove(digest)
+                self.counters['revoked'] += 1
+
+    def stats(self) -> dict:
+        requests = self.counters['hits'] + self.counters['misses']
+        return {
+            **self.counters,
+            'enabled': self.enabled,
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'hit_rate': self.counters['hits'] / requests if requests else 0.0,
+        }
+
+
+verified_token_cache = VerifiedTokenCache()
+
+
+class CachingJWTManager(JWTManager):
+    """JWTManager, который не проверяет подпись повторно для токенов из кеша."""
+
+    def __init__(self, app=None, token_cache: VerifiedTokenCache = verified_token_cache):
+        self.token_cache = token_cache
+        super().__init__(app)
+
+    def _decode_jwt_from_config(self, encoded_token, csrf_value=None, allow_expired=False):
+        # csrf и просроченные токены проверяем всегда полностью
+        if not self.token_cache.enabled or csrf_value is not None or allow_expired:
+            return super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+
+        claims = self.token_cache.get(encoded_token, jwt_config.leeway)
+        if claims is None:
+            claims = super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+            self.token_cache.put(encoded_token, claims)
+        return claims
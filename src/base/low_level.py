@@ -1,26 +1,58 @@
-from typing import Union
+import time
+import uuid
+from typing import Iterator, Optional, Union
 from datetime import timedelta
+from contextlib import asynccontextmanager
+from contextlib import contextmanager
 
 from redis.exceptions import RedisError
 from flask_jwt_extended.utils import create_access_token
 from flask_jwt_extended.utils import create_refresh_token
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy import delete
+from sqlalchemy import update
+from sqlalchemy import tuple_
+from sqlalchemy import cast
+from sqlalchemy import column
+from sqlalchemy import literal
+from sqlalchemy import select
+from sqlalchemy import values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import load_only
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import noload
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import subqueryload
 
+from db.redis_db import get_async_client
 from db.redis_db import redis_db
 from db.postgres import db_session
+from db.replicas import RoutingSession
+from db.postgres import get_async_session_factory
 from core import config
+from metrics import CACHE_LATENCY
+from metrics import ORM_LATENCY
+from metrics import observe_methods
 from tracing import trace
+from tracing import TraceLevel
 from services.utils import abort_error
+from schemas.serializers import compile_serializer
 from .abstract import AbstractTokenizer
+from .abstract import AbstractAsyncCache
+from .abstract import AbstractAsyncORM
 from .abstract import AbstractCache
 from .abstract import AbstractORM
+from .abstract import AbstractSessionStore
+from .abstract import Relations
+from .sessions import async_session_store
+from .sessions import session_store
 
 
+@observe_methods(CACHE_LATENCY)
 class CacheRedis(AbstractCache):
     """Класс для работы с redis."""
 
-    @trace
+    @trace(level=TraceLevel.LOW_LEVEL)
     def set_with_expiry(
             self,
             key,
@@ -39,10 +71,8 @@ class CacheRedis(AbstractCache):
             )
         except RedisError:
             abort_error(err_text)
-        finally:
-            redis_db.close()
 
-    @trace
+    @trace(level=TraceLevel.LOW_LEVEL)
     def get_by_key(self, key, err_text='Ошибка получения кеша.'):
         """Получение значения в redis по ключу.
             В случае чего выкидывает http ошибку.
@@ -51,82 +81,330 @@ class CacheRedis(AbstractCache):
             return redis_db.get(name=key)
         except RedisError:
             abort_error(err_text)
-        finally:
-            redis_db.close()
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    def delete(self, *keys, err_text='Ошибка удаления из кеша.') -> None:
+        """Удаление ключей из redis за один запрос."""
+        try:
+            redis_db.delete(*keys)
+        except RedisError:
+            abort_error(err_text)
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    def mget(self, keys: list, err_text='Ошибка получения кеша.') -> list:
+        """Получение значений нескольких ключей за один запрос в redis."""
+        try:
+            return redis_db.mget(keys)
+        except RedisError:
+            abort_error(err_text)
+
+    @contextmanager
+    def pipeline(self, transaction: bool = False, err_text='Ошибка работы с кешем.'):
+        """Отдает pipeline redis, команды которого уходят одним запросом при вызове execute().
+            В случае чего выкидывает http ошибку.
+        """
+        try:
+            with redis_db.pipeline(transaction=transaction) as pipe:
+                yield pipe
+        except RedisError:
+            abort_error(err_text)
+
+
+@observe_methods(CACHE_LATENCY)
+class AsyncCacheRedis(AbstractAsyncCache):
+    """Класс для работы с redis из асинхронного кода (redis.asyncio)."""
+
+    def __init__(self, client_factory=get_async_client):
+        self.client_factory = client_factory
+        self._client = None
+
+    @property
+    def client(self):
+        # Клиент создается при первом обращении, уже внутри event loop
+        if self._client is None:
+            self._client = self.client_factory()
+        return self._client
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    async def set_with_expiry(
+            self,
+            key,
+            value,
+            time: Union[float, timedelta],
+            err_text='Ошибка записи в кеш',
+    ) -> None:
+        try:
+            await self.client.setex(name=key, value=value, time=time)
+        except RedisError:
+            abort_error(err_text)
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    async def get_by_key(self, key, err_text='Ошибка получения кеша.'):
+        try:
+            return await self.client.get(name=key)
+        except RedisError:
+            abort_error(err_text)
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    async def delete(self, *keys, err_text='Ошибка удаления из кеша.') -> None:
+        try:
+            await self.client.delete(*keys)
+        except RedisError:
+            abort_error(err_text)
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    async def mget(self, keys: list, err_text='Ошибка получения кеша.') -> list:
+        try:
+            return await self.client.mget(keys)
+        except RedisError:
+            abort_error(err_text)
+
+    @asynccontextmanager
+    async def pipeline(self, transaction: bool = False, err_text='Ошибка работы с кешем.'):
+        """Отдает pipeline redis.asyncio: команды копятся синхронно, уходят при await execute()."""
+        try:
+            async with self.client.pipeline(transaction=transaction) as pipe:
+                yield pipe
+        except RedisError:
+            abort_error(err_text)
+
+
+def _encode_tokens(identity, additional_claims: dict, session_id: str) -> tuple[dict, str]:
+    """Пара токенов сессии. jti refresh токена задается заранее, чтобы сохранить его хеш без декодирования.
+        iat_ms - время выдачи в миллисекундах для сравнения с отметкой not-before (iat только в секундах).
+    """
+    refresh_jti = str(uuid.uuid4())
+    claims = {**additional_claims, 'sid': session_id, 'iat_ms': int(time.time() * 1000)}
+    tokens = {
+        'access_token': create_access_token(identity, additional_claims=claims),
+        'refresh_token': create_refresh_token(identity, additional_claims={**claims, 'jti': refresh_jti}),
+    }
+    return tokens, refresh_jti
 
 
 class JwtTokenizer(AbstractTokenizer):
-    """Класс для работы с jwt токенами."""
-
-    @trace
-    def __init__(self, cache_db: AbstractCache = CacheRedis()):
-        self.cache_db = cache_db
-
-    @trace
-    def get_tokens(self, identity: str, additional_claims: dict) -> dict:
-        """Получение access и refresh токенов для юзера."""
-        tokens = {
-            'access_token': create_access_token(identity, additional_claims=additional_claims),
-            'refresh_token': create_refresh_token(identity, additional_claims=additional_claims),
-        }
-        # Записываем refresh токен в кеш, чтобы поддерживать одноразовость
-        self.cache_db.set_with_expiry(
-            key=str(identity),
-            value=tokens['refresh_token'],
-            time=config.JWT_REFRESH_TOKEN_EXPIRES,
-        )
+    """Класс для работы с jwt токенами. Каждый логин - отдельная сессия (устройство) пользователя."""
 
+    def __init__(self, sessions: AbstractSessionStore = session_store):
+        self.sessions = sessions
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    def get_tokens(self, identity: str, additional_claims: dict, user_agent: str = '') -> dict:
+        """Получение access и refresh токенов для новой сессии юзера."""
+        session_id = uuid.uuid4().hex
+        tokens, refresh_jti = _encode_tokens(identity, additional_claims, session_id)
+        self.sessions.create(identity, session_id, refresh_jti, user_agent)
         return tokens
 
-    @trace
-    def refresh_tokens(self, sub: str, refresh_token: str, additional_claims: dict):
-        """Проверят присутствие refresh токена в redis'е, а потом возвращает новые токены."""
-        is_verified = self.verify_refresh_token_in_redis(sub, refresh_token)
+    @trace(level=TraceLevel.LOW_LEVEL)
+    def refresh_tokens(self, sub: str, refresh_payload: dict, additional_claims: dict):
+        """Выдает новую пару токенов той же сессии. Refresh токен одноразовый:
+            сессия переключается на новый токен, только если предъявлен ее текущий.
+        """
+        session_id = refresh_payload.get('sid')
+        if session_id:
+            tokens, refresh_jti = _encode_tokens(sub, additional_claims, session_id)
+            if self.sessions.rotate(sub, session_id, refresh_payload['jti'], refresh_jti):
+                return tokens
+
+        abort_error('Токен невалиден.')
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    def revoke_session(self, sub: str, session_id: str, pipe=None) -> None:
+        if session_id:
+            self.sessions.revoke(sub, session_id, pipe)
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    def revoke_all_sessions(self, sub: str, pipe=None) -> None:
+        self.sessions.revoke_all(sub, pipe)
+
+
+class AsyncJwtTokenizer(AbstractTokenizer):
+    """JwtTokenizer для асинхронного кода: те же токены и сессии через AsyncSessionStore."""
 
-        if is_verified:
-            return self.get_tokens(sub, additional_claims)
+    def __init__(self, sessions: AbstractSessionStore = async_session_store):
+        self.sessions = sessions
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    async def get_tokens(self, identity: str, additional_claims: dict, user_agent: str = '') -> dict:
+        session_id = uuid.uuid4().hex
+        tokens, refresh_jti = _encode_tokens(identity, additional_claims, session_id)
+        await self.sessions.create(identity, session_id, refresh_jti, user_agent)
+        return tokens
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    async def refresh_tokens(self, sub: str, refresh_payload: dict, additional_claims: dict):
+        session_id = refresh_payload.get('sid')
+        if session_id:
+            tokens, refresh_jti = _encode_tokens(sub, additional_claims, session_id)
+            if await self.sessions.rotate(sub, session_id, refresh_payload['jti'], refresh_jti):
+                return tokens
 
         abort_error('Токен невалиден.')
 
-    @trace
-    def verify_refresh_token_in_redis(self, key: str, refresh_token: str):
-        """Проверят нахождение refresh токена в redis'е"""
-        err_text = 'Ошибка проверки токена'
-        return self.cache_db.get_by_key(key, err_text) == refresh_token.encode()
+    @trace(level=TraceLevel.LOW_LEVEL)
+    async def revoke_session(self, sub: str, session_id: str, pipe=None) -> None:
+        if session_id:
+            await self.sessions.revoke(sub, session_id, pipe)
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    async def revoke_all_sessions(self, sub: str, pipe=None) -> None:
+        await self.sessions.revoke_all(sub, pipe)
 
 
+@observe_methods(ORM_LATENCY)
 class SqlalchemyORM(AbstractORM):
     """Класс для работы с ORM sqlalchemy"""
 
-    @trace
+    loading_strategies = {
+        'selectin': selectinload,
+        'joined': joinedload,
+        'subquery': subqueryload,
+    }
+
     def __init__(self, session=db_session):
         self.session = session
 
-    @trace
-    def get_all(self, model):
-        return model.query.all()
+    @staticmethod
+    def _load_options(model, fields: Optional[list] = None, relations: Relations = None) -> list:
+        options = []
+        if fields is not None:
+            options.append(load_only(*[getattr(model, field) for field in fields]))
+        if relations is not None:
+            # Запрошенные связи грузим выбранной стратегией, остальные не грузим вообще
+            if not isinstance(relations, dict):
+                relations = dict.fromkeys(relations, 'selectin')
+            options.extend(
+                SqlalchemyORM.loading_strategies[strategy](getattr(model, relation))
+                for relation, strategy in relations.items()
+            )
+            options.append(noload('*'))
+        return options
+
+    def _build_query(self, model, fields: Optional[list] = None, relations: Relations = None):
+        return self.session.query(model).options(*self._load_options(model, fields, relations))
+
+    def _routing_session(self) -> Optional[RoutingSession]:
+        """Сессия текущего потока, если она распределяет чтения по репликам."""
+        session = self.session() if callable(self.session) else self.session
+        if isinstance(session, RoutingSession) and session.replicas and session.replicas.replicas:
+            return session
+        return None
 
-    @trace
+    @contextmanager
+    def using_primary(self):
+        session = self._routing_session()
+        if session is None:
+            yield self
+            return
+        with session.using_primary():
+            yield self
+
+    def _first(self, query):
+        """Первая запись запроса. Чтение идет на реплику, и если записи там нет,
+            она могла еще не доехать (например, логин сразу после регистрации):
+            тогда запрос повторяется на мастере.
+        """
+        obj = query.first()
+        session = self._routing_session()
+        if obj is None and session is not None:
+            with session.using_primary():
+                obj = query.first()
+        return obj
+
+    @staticmethod
+    def _keyset_clauses(model, ordering: tuple, after: Optional[dict] = None) -> tuple[list, list]:
+        """Условия и сортировка страницы keyset пагинации."""
+        names = [name.lstrip('-') for name in ordering]
+        columns = [getattr(model, name) for name in names]
+        descending = ordering[0].startswith('-')
+
+        criteria = []
+        if after is not None:
+            # Keyset: сравниваем кортеж колонок сортировки с ключом последней отданной записи
+            key, last_key = tuple_(*columns), tuple_(*[after[name] for name in names])
+            criteria.append(key < last_key if descending else key > last_key)
+
+        return criteria, [column.desc() if descending else column.asc() for column in columns]
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    def get_all(self, model, fields: Optional[list] = None, relations: Relations = None):
+        return self._build_query(model, fields, relations).all()
+
+    def _build_page_query(
+            self,
+            model,
+            ordering: tuple,
+            limit: int,
+            after: Optional[dict] = None,
+            filter_: Optional[dict] = None,
+            fields: Optional[list] = None,
+            relations: Relations = None,
+    ):
+        """Запрос страницы на limit + 1 запись: лишняя запись означает, что есть следующая страница."""
+        query = self._build_query(model, fields, relations)
+        if filter_:
+            query = query.filter_by(**filter_)
+
+        criteria, order_by = self._keyset_clauses(model, ordering, after)
+        return query.filter(*criteria).order_by(*order_by).limit(limit + 1)
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    def get_page(self, model, ordering: tuple, limit: int, **kwargs) -> tuple[list, bool]:
+        objects = self._build_page_query(model, ordering, limit, **kwargs).all()
+        return objects[:limit], len(objects) > limit
+
+    def iter_page(self, model, ordering: tuple, limit: int, **kwargs) -> Iterator:
+        # Серверный курсор: строки приходят из БД пачками по STREAM_CHUNK_SIZE
+        query = self._build_page_query(model, ordering, limit, **kwargs).yield_per(config.STREAM_CHUNK_SIZE)
+        try:
+            yield from query
+        finally:
+            self.session.close()
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    def count(self, model, filter_: Optional[dict] = None) -> int:
+        return self.session.query(model).filter_by(**(filter_ or {})).count()
+
+    @trace(level=TraceLevel.LOW_LEVEL)
     def get_all_by_filter(self, model, filter_: dict):
-        return model.query.filter_by(**filter_).all()
+        return self.session.query(model).filter_by(**filter_).all()
 
-    @trace
+    @trace(level=TraceLevel.LOW_LEVEL)
+    def get_one_by_filter(self, model, filter_: dict, relations: Relations = None):
+        return self._first(self._build_query(model, relations=relations).filter_by(**filter_))
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    def get_related_values(self, model, relation: str, column: str, filter_: dict) -> list:
+        related_model = getattr(model, relation).property.mapper.class_
+        query = self.session.query(getattr(related_model, column)).select_from(model).join(getattr(model, relation))
+        query = query.filter(*[getattr(model, key) == value for key, value in filter_.items()])
+        return [value for value, in query]
+
+    @trace(level=TraceLevel.LOW_LEVEL)
     def get_by_id(self, model, id_):
-        return model.query.filter_by(id=id_).first()
+        return self._first(self.session.query(model).filter_by(id=id_))
 
-    @trace
+    @trace(level=TraceLevel.LOW_LEVEL)
+    def update_by_filter(self, model, filter_: dict, values: dict):
+        # Сессию не закрываем: вызывающий код продолжает работать с загруженными объектами
+        statement = update(model).filter_by(**filter_).values(**values).execution_options(synchronize_session=False)
+        self.session.execute(statement)
+        self.session.commit()
+
+    @trace(level=TraceLevel.LOW_LEVEL)
     def add_obj(self, obj, schema=None):
         try:
             self.session.add(obj)
             self.session.commit()
             if schema:
-                return schema.from_orm(obj).dict()
+                return compile_serializer(schema)(obj)
         except IntegrityError:
             abort_error('Ошибка записи в БД.')
         finally:
             self.session.close()
 
-    @trace
+    @trace(level=TraceLevel.LOW_LEVEL)
     def delete_obj(self, obj):
         try:
             self.session.delete(obj)
@@ -134,16 +412,16 @@ class SqlalchemyORM(AbstractORM):
         finally:
             self.session.close()
 
-    @trace
+    @trace(level=TraceLevel.LOW_LEVEL)
     def add_to_many_to_many(self, m2m_table, ids: dict):
         try:
-            statement = m2m_table.insert().values(**ids)
+            statement = pg_insert(m2m_table).values(**ids).on_conflict_do_nothing()
             self.session.execute(statement)
             self.session.commit()
         finally:
             self.session.close()
 
-    @trace
+    @trace(level=TraceLevel.LOW_LEVEL)
     def remove_from_many_to_many(self, m2m_table, first_id: tuple, second_id: tuple):
         try:
             attr_first_id = getattr(m2m_table.c, first_id[0])
@@ -156,3 +434,177 @@ class SqlalchemyORM(AbstractORM):
             self.session.commit()
         finally:
             self.session.close()
+
+    @staticmethod
+    def _values_source(m2m_table, rows: list[dict]):
+        """VALUES (...) с парами айдишников, типы колонок берутся из внешних ключей m2m таблицы."""
+        names = list(rows[0])
+        targets = {name: next(iter(m2m_table.c[name].foreign_keys)).column for name in names}
+        source = values(
+            *[column(name, targets[name].type) for name in names],
+            name='source',
+        ).data([tuple(row[name] for name in names) for row in rows])
+        # Параметры в VALUES postgres считает текстом, поэтому явно приводим к типу колонок
+        typed = {name: cast(source.c[name], targets[name].type) for name in names}
+        return source, typed, targets
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    def bulk_add_to_many_to_many(self, m2m_table, rows: list[dict]) -> list[dict]:
+        try:
+            source, typed, targets = self._values_source(m2m_table, rows)
+            # Соединение с целевыми таблицами отбрасывает пары с несуществующими айдишниками
+            query = select(*[value.label(name) for name, value in typed.items()]).select_from(source)
+            for name, target in targets.items():
+                query = query.join(target.table, target == typed[name])
+
+            statement = (
+                pg_insert(m2m_table)
+                .from_select(list(typed), query)
+                .on_conflict_do_nothing()
+                .returning(*[m2m_table.c[name] for name in typed])
+            )
+            inserted = [dict(row._mapping) for row in self.session.execute(statement)]
+            self.session.commit()
+            return inserted
+        finally:
+            self.session.close()
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    def bulk_remove_from_many_to_many(self, m2m_table, rows: list[dict]) -> list[dict]:
+        try:
+            _, typed, _ = self._values_source(m2m_table, rows)
+            statement = (
+                delete(m2m_table)
+                .where(*[m2m_table.c[name] == value for name, value in typed.items()])
+                .returning(*[m2m_table.c[name] for name in typed])
+            )
+            deleted = [dict(row._mapping) for row in self.session.execute(statement)]
+            self.session.commit()
+            return deleted
+        finally:
+            self.session.close()
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    def add_to_many_to_many_by_filter(self, m2m_table, model, criteria: list, column_name: str, values_: dict) -> list:
+        try:
+            fixed = [cast(literal(value), m2m_table.c[name].type).label(name) for name, value in values_.items()]
+            query = select(model.id.label(column_name), *fixed).where(*criteria)
+            statement = (
+                pg_insert(m2m_table)
+                .from_select([column_name, *values_], query)
+                .on_conflict_do_nothing()
+                .returning(m2m_table.c[column_name])
+            )
+            inserted = [value for value, in self.session.execute(statement)]
+            self.session.commit()
+            return inserted
+        finally:
+            self.session.close()
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    def remove_from_many_to_many_by_filter(
+            self, m2m_table, model, criteria: list, column_name: str, values_: dict,
+    ) -> list:
+        try:
+            statement = (
+                delete(m2m_table)
+                .where(
+                    m2m_table.c[column_name] == model.id,
+                    *[m2m_table.c[name] == value for name, value in values_.items()],
+                    *criteria,
+                )
+                .returning(m2m_table.c[column_name])
+            )
+            deleted = [value for value, in self.session.execute(statement)]
+            self.session.commit()
+            return deleted
+        finally:
+            self.session.close()
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    def get_existing_ids(self, model, ids: list) -> set:
+        return {id_ for id_, in self.session.query(model.id).filter(model.id.in_(ids))}
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    def bulk_insert_ignore_conflicts(self, model, rows: list[dict], returning: str) -> list:
+        try:
+            statement = (
+                pg_insert(model.__table__)
+                .values(rows)
+                .on_conflict_do_nothing()
+                .returning(getattr(model.__table__.c, returning))
+            )
+            inserted = [value for value, in self.session.execute(statement)]
+            self.session.commit()
+            return inserted
+        finally:
+            self.session.close()
+
+
+@observe_methods(ORM_LATENCY)
+class AsyncSqlalchemyORM(AbstractAsyncORM):
+    """Класс для работы с БД через AsyncSession sqlalchemy.
+        Запросы строятся теми же вспомогательными методами, что и в SqlalchemyORM.
+    """
+
+    def __init__(self, session_factory=None):
+        self.session_factory = session_factory
+
+    def _session(self):
+        if self.session_factory is None:
+            self.session_factory = get_async_session_factory()
+        return self.session_factory()
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    async def get_page(
+            self,
+            model,
+            ordering: tuple,
+            limit: int,
+            after: Optional[dict] = None,
+            filter_: Optional[dict] = None,
+            fields: Optional[list] = None,
+            relations: Relations = None,
+    ) -> tuple[list, bool]:
+        statement = select(model).options(*SqlalchemyORM._load_options(model, fields, relations))
+        if filter_:
+            statement = statement.filter_by(**filter_)
+        criteria, order_by = SqlalchemyORM._keyset_clauses(model, ordering, after)
+        statement = statement.filter(*criteria).order_by(*order_by).limit(limit + 1)
+
+        async with self._session() as session:
+            objects = (await session.execute(statement)).scalars().all()
+        return objects[:limit], len(objects) > limit
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    async def get_one_by_filter(self, model, filter_: dict, relations: Relations = None):
+        statement = select(model).options(*SqlalchemyORM._load_options(model, relations=relations))
+        async with self._session() as session:
+            return (await session.execute(statement.filter_by(**filter_).limit(1))).scalars().first()
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    async def get_related_values(self, model, relation: str, column: str, filter_: dict) -> list:
+        related_model = getattr(model, relation).property.mapper.class_
+        statement = select(getattr(related_model, column)).select_from(model).join(getattr(model, relation))
+        statement = statement.filter(*[getattr(model, key) == value for key, value in filter_.items()])
+        async with self._session() as session:
+            return list((await session.execute(statement)).scalars())
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    async def update_by_filter(self, model, filter_: dict, values: dict):
+        statement = update(model).filter_by(**filter_).values(**values).execution_options(synchronize_session=False)
+        async with self._session() as session:
+            await session.execute(statement)
+            await session.commit()
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    async def add_obj(self, obj, schema=None):
+        async with self._session() as session:
+            try:
+                session.add(obj)
+                await session.commit()
+            except IntegrityError:
+                abort_error('Ошибка записи в БД.')
+            if schema:
+                # Сериализация в greenlet сессии: незагруженные связи догружаются как в синхронном коде
+                return await session.run_sync(lambda _: compile_serializer(schema)(obj))
@@ -0,0 +1,334 @@
+import os
+import math
+import time
+import hashlib
+import logging
+import threading
+from datetime import timedelta
+from typing import Optional
+
+from redis.exceptions import RedisError
+
+from db.redis_db import redis_db
+from core import config
+from services.utils import abort_error
+from .abstract import AbstractCache
+from .jwt_cache import VerifiedTokenCache
+from .jwt_cache import verified_token_cache
+from .low_level import CacheRedis
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationalBloomFilter:
+    """Bloom фильтр с поколениями по времени.
+
+    Каждое поколение хранит элементы, добавленные за один интервал `bucket`.
+    Поколение удаляется целиком, когда все его элементы старше `lifetime`,
+    поэтому фильтр не растет бесконечно и не требует удаления отдельных элементов.
+    """
+
+    def __init__(self, capacity: int, error_rate: float, bucket: timedelta, lifetime: timedelta):
+        self.bucket_seconds = bucket.total_seconds()
+        self.lifetime_seconds = lifetime.total_seconds()
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._generations: dict[int, bytearray] = {}
+        self._lock = threading.Lock()
+
+    def _indexes(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def _purge(self, now: float) -> None:
+        """Удаляет поколения, все элементы которых уже протухли."""
+        expired = [
+            number for number in self._generations
+            if (number + 1) * self.bucket_seconds + self.lifetime_seconds < now
+        ]
+        for number in expired:
+            del self._generations[number]
+
+    def add(self, item: str, timestamp: Optional[float] = None) -> None:
+        """Добавляет элемент в поколение, соответствующее времени его добавления."""
+        now = time.time()
+        timestamp = now if timestamp is None else timestamp
+        number = int(timestamp // self.bucket_seconds)
+
+        with self._lock:
+            self._purge(now)
+            if (number + 1) * self.bucket_seconds + self.lifetime_seconds < now:
+                return
+            generation = self._generations.setdefault(number, bytearray(math.ceil(self.size / 8)))
+            for index in self._indexes(item):
+                generation[index >> 3] |= 1 << (index & 7)
+
+    def __contains__(self, item: str) -> bool:
+        indexes = self._indexes(item)
+        with self._lock:
+            self._purge(time.time())
+            generations = list(self._generations.values())
+
+        return any(
+            all(generation[index >> 3] & (1 << (index & 7)) for index in indexes)
+            for generation in generations
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generations.clear()
+
+
+class RevokedTokensFilter:
+    """Локальный для воркера фильтр отозванных access токенов.
+
+    Отвечает "точно не отозван" без похода в redis. Воркеры синхронизируются
+    через redis stream: при логауте jti пишется в поток, а фоновый поток
+    каждого воркера читает его и пополняет свой фильтр. Пока фильтр не
+    синхронизирован, все проверки идут в redis.
+
+    Кроме отдельных jti, отзываются сразу все токены пользователя: в redis
+    пишется отметка not-before в миллисекундах, и токены, выданные раньше нее
+    (см. issued_at_ms), недействительны.
+    Отметки тоже рассылаются через поток, синхронизированный воркер хранит
+    все действующие отметки в словаре и проверяет их без redis.
+    """
+    not_before_prefix = 'not_before_ms'
+    follow_max_backoff = 30
+
+    def __init__(
+            self,
+            redis=redis_db,
+            stream: str = config.REVOCATION_STREAM,
+            enabled: bool = config.REVOCATION_FILTER_ENABLED,
+            capacity: int = config.REVOCATION_FILTER_CAPACITY,
+            error_rate: float = config.REVOCATION_FILTER_ERROR_RATE,
+            bucket: timedelta = config.REVOCATION_FILTER_BUCKET,
+            lifetime: timedelta = config.JWT_ACCESS_TOKEN_EXPIRES,
+    ):
+        self.redis = redis
+        self.stream = stream
+        self.enabled = enabled
+        self.lifetime = lifetime
+        self.bloom = GenerationalBloomFilter(capacity, error_rate, bucket, lifetime)
+        self.counters = {'hits': 0, 'misses': 0, 'false_positives': 0, 'bypassed': 0}
+        self._not_before: dict[str, int] = {}
+        self._synced = threading.Event()
+        self._last_id = '0-0'
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    @staticmethod
+    def _entry_timestamp(entry_id) -> float:
+        if isinstance(entry_id, bytes):
+            entry_id = entry_id.decode()
+        return int(entry_id.split('-')[0]) / 1000
+
+    def _apply(self, entries) -> None:
+        for entry_id, fields in entries:
+            jti = fields.get(b'jti') or fields.get('jti')
+            if jti is not None:
+                self.bloom.add(jti.decode() if isinstance(jti, bytes) else jti, self._entry_timestamp(entry_id))
+            sub = fields.get(b'sub') or fields.get('sub')
+            if sub is not None:
+                stamp = fields.get(b'nbf_ms') or fields.get('nbf_ms')
+                # Записи, сделанные до перехода на миллисекунды
+                stamp = int(stamp) if stamp is not None else int(fields.get(b'nbf') or fields['nbf']) * 1000
+                self._set_not_before(sub.decode() if isinstance(sub, bytes) else sub, stamp)
+            self._last_id = entry_id
+
+    def _set_not_before(self, sub: str, stamp: int) -> None:
+        """Запоминает отметку пользователя и забывает те, после которых истекли все токены."""
+        self._not_before[sub] = max(stamp, self._not_before.get(sub, 0))
+        oldest = (time.time() - self.lifetime.total_seconds()) * 1000
+        for expired in [user for user, value in self._not_before.items() if value < oldest]:
+            del self._not_before[expired]
+
+    def _bootstrap(self) -> None:
+        """Загружает в фильтр все jti, отозванные за время жизни access токена."""
+        self.bloom.clear()
+        self._not_before.clear()
+        start = f'{int((time.time() - self.lifetime.total_seconds()) * 1000)}-0'
+        self._last_id = start
+        while True:
+            entries = self.redis.xrange(self.stream, min=start, max='+', count=1000)
+            self._apply(entries)
+            if len(entries) < 1000:
+                break
+            start = '(' + (entries[-1][0].decode() if isinstance(entries[-1][0], bytes) else entries[-1][0])
+
+    def _follow(self) -> None:
+        """Фоновый цикл синхронизации. При любой ошибке (redis, битая запись в потоке)
+            фильтр отключается и проверки идут в redis, пока повторная загрузка не пройдет.
+            Повторы - с экспоненциальной задержкой до follow_max_backoff секунд.
+        """
+        backoff = 1
+        while True:
+            try:
+                if not self._synced.is_set():
+                    self._bootstrap()
+                    self._synced.set()
+                    backoff = 1
+                for _, entries in self.redis.xread({self.stream: self._last_id}, count=1000, block=1000) or ():
+                    self._apply(entries)
+            except Exception:
+                self._synced.clear()
+                logger.exception('Revoked tokens filter sync failed, retrying in %s s', backoff)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.follow_max_backoff)
+
+    def _ensure_started(self) -> None:
+        """Запускает синхронизацию один раз в каждом процессе (в том числе после fork)."""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._synced.clear()
+            threading.Thread(target=self._follow, name='revoked-tokens-filter', daemon=True).start()
+            self._pid = os.getpid()
+
+    def revoke(self, jti: str, pipe=None, err_text='Ошибка записи в кеш') -> None:
+        """Добавляет jti в локальный фильтр и рассылает его остальным воркерам.
+            Если передан pipeline, запись в поток добавляется в него и уходит вместе с остальными командами.
+        """
+        if not self.enabled:
+            return
+
+        self.bloom.add(jti)
+        min_id = int((time.time() - self.lifetime.total_seconds()) * 1000)
+        if pipe is not None:
+            pipe.xadd(self.stream, {'jti': jti}, minid=min_id, approximate=True)
+            return
+
+        try:
+            self.redis.xadd(self.stream, {'jti': jti}, minid=min_id, approximate=True)
+        except RedisError:
+            abort_error(err_text)
+
+    def not_before_key(self, sub) -> str:
+        return f'{self.not_before_prefix}:{sub}'
+
+    def revoke_user(self, sub, pipe=None, err_text='Ошибка записи в кеш') -> int:
+        """Отзывает все выданные до этого момента токены пользователя.
+            Отметка живет в redis столько, сколько access токен: refresh токены
+            пользователя при этом отзываются вместе с его сессиями.
+            Возвращает отметку в миллисекундах.
+        """
+        stamp = int(time.time() * 1000)
+        lifetime = int(self.lifetime.total_seconds())
+        if self.enabled:
+            self._set_not_before(str(sub), stamp)
+
+        try:
+            if pipe is None:
+                with self.redis.pipeline(transaction=False) as own_pipe:
+                    self._add_not_before(own_pipe, str(sub), stamp, lifetime)
+                    own_pipe.execute()
+            else:
+                self._add_not_before(pipe, str(sub), stamp, lifetime)
+        except RedisError:
+            abort_error(err_text)
+        return stamp
+
+    def _add_not_before(self, pipe, sub: str, stamp: int, lifetime: int) -> None:
+        pipe.setex(self.not_before_key(sub), lifetime, stamp)
+        if self.enabled:
+            min_id = int((time.time() - lifetime) * 1000)
+            pipe.xadd(self.stream, {'sub': sub, 'nbf_ms': stamp}, minid=min_id, approximate=True)
+
+    def check_user_locally(self, sub: str, issued_at_ms: int) -> Optional[bool]:
+        """True - токен выдан до отметки not-before пользователя, False - после.
+            None - фильтр не синхронизирован, отметку нужно прочитать из redis по not_before_key().
+        """
+        if not self.enabled:
+            return None
+
+        self._ensure_started()
+        if not self._synced.is_set():
+            return None
+        return issued_at_ms < self._not_before.get(sub, 0)
+
+    def is_user_revoked(self, sub: str, issued_at_ms: int, err_text='Ошибка чтения из кеша') -> bool:
+        """Проверка отметки not-before: из локального словаря, а если он не готов - из redis."""
+        revoked = self.check_user_locally(sub, issued_at_ms)
+        if revoked is not None:
+            return revoked
+
+        try:
+            stamp = self.redis.get(self.not_before_key(sub))
+        except RedisError:
+            abort_error(err_text)
+        return stamp is not None and issued_at_ms < int(stamp)
+
+    def might_be_revoked(self, jti: str) -> bool:
+        """False означает, что токен точно не отзывался и redis можно не спрашивать."""
+        if not self.enabled:
+            return True
+
+        self._ensure_started()
+        if not self._synced.is_set():
+            self.counters['bypassed'] += 1
+            return True
+
+        if jti in self.bloom:
+            self.counters['hits'] += 1
+            return True
+
+        self.counters['misses'] += 1
+        return False
+
+    def record_false_positive(self) -> None:
+        """Фиксирует срабатывание фильтра, которое redis не подтвердил."""
+        if self._synced.is_set():
+            self.counters['false_positives'] += 1
+
+    def stats(self) -> dict:
+        """Счетчики фильтра и доля ложноположительных срабатываний."""
+        hits = self.counters['hits']
+        return {
+            **self.counters,
+            'synced': self._synced.is_set(),
+            'generations': len(self.bloom._generations),
+            'revoked_users': len(self._not_before),
+            'false_positive_rate': self.counters['false_positives'] / hits if hits else 0.0,
+        }
+
+
+revoked_tokens_filter = RevokedTokensFilter()
+
+
+def issued_at_ms(jwt_payload: dict) -> int:
+    """Время выдачи токена в миллисекундах. У токенов без iat_ms берется начало секунды iat,
+        поэтому отзыв в ту же секунду их тоже отклоняет.
+    """
+    return jwt_payload.get('iat_ms', jwt_payload['iat'] * 1000)
+
+
+def check_if_token_was_in_logout_request(
+        jwt_header: dict,
+        jwt_payload: dict,
+        revoked_tokens: RevokedTokensFilter = revoked_tokens_filter,
+        cache_db: AbstractCache = CacheRedis(),
+        token_cache: VerifiedTokenCache = verified_token_cache,
+) -> bool:
+    """Загрузчик blocklist для flask_jwt_extended, регистрируется в main.
+        Проверяет, не отозваны ли все токены пользователя и был ли токен в запросе на логаут.
+        В redis идем только если локальный фильтр не исключил отзыв токена.
+    """
+    if revoked_tokens.is_user_revoked(jwt_payload['sub'], issued_at_ms(jwt_payload)):
+        token_cache.evict_jti(jwt_payload['jti'])
+        return True
+
+    if not revoked_tokens.might_be_revoked(jwt_payload['jti']):
+        return False
+
+    token_in_redis = cache_db.get_by_key(jwt_payload['jti'])
+    if token_in_redis is None:
+        revoked_tokens.record_false_positive()
+        return False
+
+    token_cache.evict_jti(jwt_payload['jti'])
+    return True
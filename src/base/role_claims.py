@@ -0,0 +1,249 @@
+import json
+import math
+import time
+import threading
+from collections import OrderedDict
+
+from core import config
+from db.postgres import primary_session
+from models.users import User
+from tracing import trace
+from tracing import TraceLevel
+from .abstract import AbstractAsyncCache
+from .abstract import AbstractAsyncORM
+from .abstract import AbstractCache
+from .abstract import AbstractORM
+from .low_level import AsyncCacheRedis
+from .low_level import AsyncSqlalchemyORM
+from .low_level import CacheRedis
+from .low_level import SqlalchemyORM
+
+# Заполнение кеша из БД: роли пишутся, только если версия ролей пользователя
+# не изменилась с тех пор, как ее прочитали перед запросом в БД. Иначе роли
+# успели изменить, и прочитанное из БД уже устарело.
+FILL_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+# Сброс: версия ролей - время сброса по часам redis в мс (и всегда больше прежней),
+# чтобы по ней можно было судить, не было ли сброса после чтения ролей.
+INVALIDATE_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+for i = 1, #KEYS, 2 do
+    local version = math.max(now, tonumber(redis.call('GET', KEYS[i + 1]) or '0') + 1)
+    redis.call('SET', KEYS[i + 1], string.format('%d', version), 'EX', ARGV[1])
+    redis.call('DEL', KEYS[i])
+end
+return 1
+"""
+
+# Запись ролей, прочитанных без предварительного чтения версии (вместе с пользователем
+# при логине): роли пишутся, только если за ARGV[1] мс до текущего момента сброса не было
+# и в кеше еще ничего нет.
+REMEMBER_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+if tonumber(redis.call('GET', KEYS[2]) or '0') >= now - tonumber(ARGV[1]) then
+    return 0
+end
+return redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3], 'NX') and 1 or 0
+"""
+
+
+class RoleClaimsCache:
+    """Кеш имен ролей пользователя для claims в токенах.
+
+    Роли хранятся в redis (ключ на пользователя) и дополнительно несколько секунд
+    в памяти воркера. Пути записи в m2m таблицу и изменения ролей сбрасывают кеш,
+    поэтому refresh не ходит в БД и видит актуальные роли. Логин читает роли тем же
+    запросом, что и пользователя, и кладет их в кеш через remember().
+    Локальный кеш других воркеров может отставать не дольше ROLE_CLAIMS_LOCAL_TTL.
+    Роли читаются с мастера: отставание реплики иначе попало бы в кеш на весь ttl.
+
+    Сброс увеличивает версию ролей пользователя, а значение из БД попадает в кеш,
+    только если версия не изменилась за время чтения. Поэтому сброс, пришедший
+    между чтением из БД и записью в кеш, не оставляет в кеше старые роли.
+    """
+    key_prefix = 'user_roles'
+    # Запас на путь команды от воркера до redis при записи ролей, прочитанных вместе с пользователем
+    remember_margin = 1.0
+
+    def __init__(
+            self,
+            cache_db: AbstractCache = CacheRedis(),
+            orm: AbstractORM = SqlalchemyORM(primary_session),
+            ttl=config.ROLE_CLAIMS_CACHE_TTL,
+            local_ttl: float = config.ROLE_CLAIMS_LOCAL_TTL,
+            local_size: int = config.ROLE_CLAIMS_LOCAL_SIZE,
+    ):
+        self.cache_db = cache_db
+        self.orm = orm
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.local_size = local_size
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, user_id) -> str:
+        return f'{self.key_prefix}:{user_id}'
+
+    def _version_key(self, user_id) -> str:
+        return f'{self.key_prefix}_version:{user_id}'
+
+    def _ttl_seconds(self) -> int:
+        return int(self.ttl.total_seconds()) if hasattr(self.ttl, 'total_seconds') else int(self.ttl)
+
+    def _fill_args(self, user_id, version, roles: list) -> tuple:
+        """Аргументы eval для FILL_SCRIPT."""
+        version = version.decode() if isinstance(version, bytes) else str(version or 0)
+        return (
+            FILL_SCRIPT, 2, self._key(user_id), self._version_key(user_id),
+            version, json.dumps(roles), self._ttl_seconds(),
+        )
+
+    def _remember_args(self, user_id, roles: list, read_started: float) -> tuple:
+        """Аргументы eval для REMEMBER_SCRIPT. read_started - time.monotonic() перед чтением ролей из БД."""
+        age_ms = math.ceil((time.monotonic() - read_started + self.remember_margin) * 1000)
+        return (
+            REMEMBER_SCRIPT, 2, self._key(user_id), self._version_key(user_id),
+            age_ms, json.dumps(roles), self._ttl_seconds(),
+        )
+
+    def _invalidate_args(self, user_ids) -> tuple:
+        """Аргументы eval для INVALIDATE_SCRIPT."""
+        keys = [key for user_id in user_ids for key in (self._key(user_id), self._version_key(user_id))]
+        return (INVALIDATE_SCRIPT, len(keys), *keys, self._ttl_seconds())
+
+    def _drop_local(self, user_ids) -> None:
+        with self._lock:
+            for user_id in user_ids:
+                self._local.pop(str(user_id), None)
+
+    def _get_local(self, user_id):
+        with self._lock:
+            entry = self._local.get(str(user_id))
+            if entry is None:
+                return None
+            expires_at, roles = entry
+            if expires_at < time.monotonic():
+                del self._local[str(user_id)]
+                return None
+            return roles
+
+    def _set_local(self, user_id, roles: list) -> None:
+        with self._lock:
+            self._local[str(user_id)] = (time.monotonic() + self.local_ttl, roles)
+            self._local.move_to_end(str(user_id))
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    def get_roles(self, user_id) -> list[str]:
+        """Имена ролей пользователя: локальный кеш -> redis -> БД."""
+        roles = self._get_local(user_id)
+        if roles is not None:
+            return roles
+
+        cached, version = self.cache_db.mget([self._key(user_id), self._version_key(user_id)])
+        if cached is not None:
+            roles = json.loads(cached)
+        else:
+            roles = sorted(self.orm.get_related_values(User, 'roles', 'name', {'id': user_id}))
+            with self.cache_db.pipeline() as pipe:
+                pipe.eval(*self._fill_args(user_id, version, roles))
+                filled, = pipe.execute()
+            if not filled:
+                return roles
+
+        self._set_local(user_id, roles)
+        return roles
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    def remember(self, user_id, roles: list[str], read_started: float) -> None:
+        """Кладет в кеш роли, уже прочитанные из БД вместе с пользователем, без отдельного запроса.
+            Роли не пишутся, если кеш уже заполнен или роли сбрасывали после read_started.
+        """
+        if self._get_local(user_id) is not None:
+            return
+
+        with self.cache_db.pipeline() as pipe:
+            pipe.eval(*self._remember_args(user_id, roles, read_started))
+            stored, = pipe.execute()
+        if stored:
+            self._set_local(user_id, roles)
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    def invalidate(self, *user_ids) -> None:
+        """Сбрасывает кеш ролей пользователей одним скриптом в redis."""
+        if not user_ids:
+            return
+
+        self._drop_local(user_ids)
+        with self.cache_db.pipeline() as pipe:
+            pipe.eval(*self._invalidate_args(user_ids))
+            pipe.execute()
+
+
+class AsyncRoleClaimsCache(RoleClaimsCache):
+    """RoleClaimsCache для асинхронного кода с теми же ключами в redis.
+        Локальный кеш у него свой, поэтому после сброса из синхронного кода
+        он, как и кеш других воркеров, отстает не дольше ROLE_CLAIMS_LOCAL_TTL.
+    """
+
+    def __init__(
+            self,
+            cache_db: AbstractAsyncCache = AsyncCacheRedis(),
+            orm: AbstractAsyncORM = AsyncSqlalchemyORM(),
+            **kwargs,
+    ):
+        super().__init__(cache_db, orm, **kwargs)
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    async def get_roles(self, user_id) -> list[str]:
+        roles = self._get_local(user_id)
+        if roles is not None:
+            return roles
+
+        cached, version = await self.cache_db.mget([self._key(user_id), self._version_key(user_id)])
+        if cached is not None:
+            roles = json.loads(cached)
+        else:
+            roles = sorted(await self.orm.get_related_values(User, 'roles', 'name', {'id': user_id}))
+            async with self.cache_db.pipeline() as pipe:
+                pipe.eval(*self._fill_args(user_id, version, roles))
+                filled, = await pipe.execute()
+            if not filled:
+                return roles
+
+        self._set_local(user_id, roles)
+        return roles
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    async def remember(self, user_id, roles: list[str], read_started: float) -> None:
+        if self._get_local(user_id) is not None:
+            return
+
+        async with self.cache_db.pipeline() as pipe:
+            pipe.eval(*self._remember_args(user_id, roles, read_started))
+            stored, = await pipe.execute()
+        if stored:
+            self._set_local(user_id, roles)
+
+    @trace(level=TraceLevel.LOW_LEVEL)
+    async def invalidate(self, *user_ids) -> None:
+        if not user_ids:
+            return
+
+        self._drop_local(user_ids)
+        async with self.cache_db.pipeline() as pipe:
+            pipe.eval(*self._invalidate_args(user_ids))
+            await pipe.execute()
+
+
+role_claims_cache = RoleClaimsCache()
+async_role_claims_cache = AsyncRoleClaimsCache()
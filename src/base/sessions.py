@@ -0,0 +1,203 @@
+import time
+import hashlib
+from datetime import timedelta
+
+from redis.exceptions import RedisError
+
+from core import config
+from db.redis_db import get_async_client
+from db.redis_db import redis_db
+from services.utils import abort_error
+from .abstract import AbstractSessionStore
+
+# Значение поля сессии: "<digest>:<expires_at>:<created_at>:<user_agent>"
+
+# Добавляет сессию и, если их больше лимита, удаляет протухшие, а затем самые старые
+CREATE_SCRIPT = """
+local key, session_id, now, limit = KEYS[1], ARGV[1], tonumber(ARGV[4]), tonumber(ARGV[5])
+redis.call('HSET', key, session_id, ARGV[2])
+redis.call('EXPIRE', key, ARGV[3])
+
+local count = redis.call('HLEN', key)
+if count <= limit then
+    return 0
+end
+
+local entries, alive, removed = redis.call('HGETALL', key), {}, 0
+for index = 1, #entries, 2 do
+    local field = entries[index]
+    local expires_at, created_at = string.match(entries[index + 1], '^%x+:(%d+):(%d+):')
+    if tonumber(expires_at) <= now then
+        redis.call('HDEL', key, field)
+        removed = removed + 1
+    elseif field ~= session_id then
+        table.insert(alive, {field, tonumber(created_at)})
+    end
+end
+
+table.sort(alive, function(first, second) return first[2] < second[2] end)
+local index = 1
+while count - removed > limit and index <= #alive do
+    redis.call('HDEL', key, alive[index][1])
+    removed = removed + 1
+    index = index + 1
+end
+return removed
+"""
+
+# Меняет digest сессии, только если предъявлен текущий и сессия не протухла
+ROTATE_SCRIPT = """
+local value = redis.call('HGET', KEYS[1], ARGV[1])
+if not value then
+    return 0
+end
+
+local digest, expires_at, rest = string.match(value, '^(%x+):(%d+):(.*)$')
+if digest ~= ARGV[2] or tonumber(expires_at) <= tonumber(ARGV[6]) then
+    return 0
+end
+
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[3] .. ':' .. ARGV[4] .. ':' .. rest)
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+return 1
+"""
+
+
+class SessionStore(AbstractSessionStore):
+    """Сессии пользователя в одном hash redis: поле - id сессии (устройства).
+
+    Вместо refresh токена (~400 байт) хранится 16 байтовый blake2b его jti,
+    поэтому проверка, отзыв одной сессии и отзыв всех - одна команда redis,
+    а у пользователя может быть несколько устройств одновременно.
+    """
+    key_prefix = 'sessions'
+
+    def __init__(
+            self,
+            redis=redis_db,
+            max_per_user: int = config.SESSIONS_MAX_PER_USER,
+            lifetime: timedelta = config.JWT_REFRESH_TOKEN_EXPIRES,
+    ):
+        self.redis = redis
+        self.max_per_user = max_per_user
+        self.lifetime_seconds = int(lifetime.total_seconds())
+        self._create_script = self.redis.register_script(CREATE_SCRIPT)
+        self._rotate_script = self.redis.register_script(ROTATE_SCRIPT)
+
+    def _key(self, user_id) -> str:
+        return f'{self.key_prefix}:{user_id}'
+
+    @staticmethod
+    def digest(refresh_jti: str) -> str:
+        return hashlib.blake2b(refresh_jti.encode(), digest_size=16).hexdigest()
+
+    def _create_args(self, session_id: str, refresh_jti: str, user_agent: str) -> list:
+        now = int(time.time())
+        # user agent - последнее поле значения, поэтому ':' в нем не мешает разбору
+        value = f'{self.digest(refresh_jti)}:{now + self.lifetime_seconds}:{now}:{user_agent[:128]}'
+        return [session_id, value, self.lifetime_seconds, now, self.max_per_user]
+
+    def _rotate_args(self, session_id: str, refresh_jti: str, new_refresh_jti: str) -> list:
+        now = int(time.time())
+        return [
+            session_id,
+            self.digest(refresh_jti),
+            self.digest(new_refresh_jti),
+            now + self.lifetime_seconds,
+            self.lifetime_seconds,
+            now,
+        ]
+
+    def create(self, user_id, session_id: str, refresh_jti: str, user_agent: str = '') -> None:
+        try:
+            self._create_script(keys=[self._key(user_id)], args=self._create_args(session_id, refresh_jti, user_agent))
+        except RedisError:
+            abort_error('Ошибка записи в кеш')
+
+    def rotate(self, user_id, session_id: str, refresh_jti: str, new_refresh_jti: str) -> bool:
+        try:
+            return bool(self._rotate_script(
+                keys=[self._key(user_id)],
+                args=self._rotate_args(session_id, refresh_jti, new_refresh_jti),
+            ))
+        except RedisError:
+            abort_error('Ошибка проверки токена')
+
+    def revoke(self, user_id, session_id: str, pipe=None) -> None:
+        """Удаляет одну сессию. Если передан pipeline, команда уходит вместе с остальными."""
+        if pipe is not None:
+            pipe.hdel(self._key(user_id), session_id)
+            return
+        try:
+            self.redis.hdel(self._key(user_id), session_id)
+        except RedisError:
+            abort_error('Ошибка удаления из кеша.')
+
+    def revoke_all(self, user_id, pipe=None) -> None:
+        """Удаляет все сессии пользователя."""
+        if pipe is not None:
+            pipe.delete(self._key(user_id))
+            return
+        try:
+            self.redis.delete(self._key(user_id))
+        except RedisError:
+            abort_error('Ошибка удаления из кеша.')
+
+
+class AsyncSessionStore(SessionStore):
+    """SessionStore для асинхронного кода, работает с теми же ключами через redis.asyncio."""
+
+    def __init__(self, redis=None, **kwargs):
+        self._redis = redis
+        self._kwargs = kwargs
+        self._initialized = False
+
+    def _ensure_client(self) -> None:
+        # Клиент и скрипты создаются при первом обращении, уже внутри event loop
+        if not self._initialized:
+            super().__init__(self._redis or get_async_client(), **self._kwargs)
+            self._initialized = True
+
+    async def create(self, user_id, session_id: str, refresh_jti: str, user_agent: str = '') -> None:
+        self._ensure_client()
+        try:
+            await self._create_script(
+                keys=[self._key(user_id)],
+                args=self._create_args(session_id, refresh_jti, user_agent),
+            )
+        except RedisError:
+            abort_error('Ошибка записи в кеш')
+
+    async def rotate(self, user_id, session_id: str, refresh_jti: str, new_refresh_jti: str) -> bool:
+        self._ensure_client()
+        try:
+            return bool(await self._rotate_script(
+                keys=[self._key(user_id)],
+                args=self._rotate_args(session_id, refresh_jti, new_refresh_jti),
+            ))
+        except RedisError:
+            abort_error('Ошибка проверки токена')
+
+    async def revoke(self, user_id, session_id: str, pipe=None) -> None:
+        self._ensure_client()
+        if pipe is not None:
+            pipe.hdel(self._key(user_id), session_id)
+            return
+        try:
+            await self.redis.hdel(self._key(user_id), session_id)
+        except RedisError:
+            abort_error('Ошибка удаления из кеша.')
+
+    async def revoke_all(self, user_id, pipe=None) -> None:
+        self._ensure_client()
+        if pipe is not None:
+            pipe.delete(self._key(user_id))
+            return
+        try:
+            await self.redis.delete(self._key(user_id))
+        except RedisError:
+            abort_error('Ошибка удаления из кеша.')
+
+
+session_store = SessionStore()
+async_session_store = AsyncSessionStore()
@@ -0,0 +1,177 @@
+import time
+import hashlib
+from http import HTTPStatus
+from typing import Optional
+
+from redis.exceptions import RedisError
+
+from core import config
+from db.redis_db import get_async_client
+from db.redis_db import redis_db
+from metrics import LOGIN_ATTEMPTS
+from metrics import LOGIN_THROTTLED
+from services.utils import abort_error
+
+# Скользящее окно считается по двум соседним фиксированным окнам: счетчик
+# предыдущего берется с весом оставшейся в нем доли времени. Для каждого окна
+# передаются ключи текущего и предыдущего счетчика, в ARGV - лимит, длина окна
+# и сколько секунд прошло от начала текущего. Если превышено хотя бы одно окно,
+# счетчики не увеличиваются и возвращается номер окна и время до разблокировки.
+CHECK_SCRIPT = """
+local blocked, retry_after = 0, 0
+for index = 1, #KEYS / 2 do
+    local limit = tonumber(ARGV[index * 3 - 2])
+    local window = tonumber(ARGV[index * 3 - 1])
+    local elapsed = tonumber(ARGV[index * 3])
+    local current = tonumber(redis.call('GET', KEYS[index * 2 - 1]) or '0')
+    local previous = tonumber(redis.call('GET', KEYS[index * 2]) or '0')
+
+    if previous * (1 - elapsed / window) + current >= limit then
+        local wait
+        if current >= limit then
+            wait = window - elapsed + window * (1 - limit / current)
+        else
+            wait = window * (1 - (limit - current) / previous) - elapsed
+        end
+        if blocked == 0 or wait > retry_after then
+            blocked, retry_after = index, wait
+        end
+    end
+end
+
+if blocked > 0 then
+    return {blocked, math.max(1, math.ceil(retry_after))}
+end
+
+for index = 1, #KEYS / 2 do
+    redis.call('INCR', KEYS[index * 2 - 1])
+    redis.call('EXPIRE', KEYS[index * 2 - 1], tonumber(ARGV[index * 3 - 1]) * 2)
+end
+return {0, 0}
+"""
+
+
+class LoginThrottle:
+    """Ограничение попыток входа: по логину, по IP и общее на весь кластер.
+
+    Все окна проверяются и увеличиваются одним lua скриптом за один запрос в redis,
+    до обращения к БД и проверки пароля. При недоступности redis вход не блокируется:
+    ограничитель защищает от перебора, но не должен сам останавливать логин.
+    """
+    key_prefix = 'login_throttle'
+
+    def __init__(
+            self,
+            redis=redis_db,
+            enabled: bool = config.LOGIN_THROTTLE_ENABLED,
+            limits: Optional[dict] = None,
+    ):
+        self.redis = redis
+        self.enabled = enabled
+        # Окно: (лимит попыток, длина в секундах), лимит 0 отключает окно
+        self.limits = limits if limits is not None else {
+            'login': (config.LOGIN_THROTTLE_LOGIN_LIMIT, config.LOGIN_THROTTLE_LOGIN_WINDOW),
+            'ip': (config.LOGIN_THROTTLE_IP_LIMIT, config.LOGIN_THROTTLE_IP_WINDOW),
+            'global': (config.LOGIN_THROTTLE_GLOBAL_LIMIT, config.LOGIN_THROTTLE_GLOBAL_WINDOW),
+        }
+        self.counters = {'allowed': 0, 'throttled': 0, 'errors': 0}
+        self._script = self.redis.register_script(CHECK_SCRIPT)
+
+    @staticmethod
+    def _login_digest(login: str) -> str:
+        # Длина ключа не зависит от присланного логина
+        return hashlib.blake2b(login.encode(), digest_size=16).hexdigest()
+
+    def _script_args(self, login: str, ip: Optional[str]) -> tuple[list, list, list]:
+        """Области проверки, ключи счетчиков и ARGV скрипта для включенных окон."""
+        now = time.time()
+        identities = {'login': self._login_digest(login), 'ip': ip, 'global': 'all'}
+        scopes, keys, args = [], [], []
+        for scope, (limit, window) in self.limits.items():
+            identity = identities[scope]
+            if limit <= 0 or identity is None:
+                continue
+            number = int(now // window)
+            scopes.append(scope)
+            keys.extend([
+                f'{self.key_prefix}:{scope}:{identity}:{number}',
+                f'{self.key_prefix}:{scope}:{identity}:{number - 1}',
+            ])
+            args.extend([limit, window, now - number * window])
+        return scopes, keys, args
+
+    def _apply_result(self, scopes: list, result) -> None:
+        blocked, retry_after = int(result[0]), int(result[1])
+        if not blocked:
+            self.counters['allowed'] += 1
+            return
+
+        self.counters['throttled'] += 1
+        LOGIN_THROTTLED.labels(scopes[blocked - 1]).inc()
+        LOGIN_ATTEMPTS.labels('throttled').inc()
+        abort_error(
+            'Слишком много попыток входа, повторите позже.',
+            HTTPStatus.TOO_MANY_REQUESTS,
+            headers={'Retry-After': str(retry_after)},
+        )
+
+    def check(self, login: str, ip: Optional[str]) -> None:
+        """Учитывает попытку входа или отвечает 429 с Retry-After, если лимит исчерпан."""
+        if not self.enabled:
+            return
+
+        scopes, keys, args = self._script_args(login, ip)
+        if not scopes:
+            return
+        try:
+            result = self._script(keys=keys, args=args)
+        except RedisError:
+            self.counters['errors'] += 1
+            return
+        self._apply_result(scopes, result)
+
+    def stats(self) -> dict:
+        checks = self.counters['allowed'] + self.counters['throttled']
+        return {
+            **self.counters,
+            'throttled_rate': self.counters['throttled'] / checks if checks else 0.0,
+        }
+
+
+class AsyncLoginThrottle(LoginThrottle):
+    """LoginThrottle для асинхронного кода, считает в тех же ключах через redis.asyncio."""
+
+    def __init__(self, redis=None, **kwargs):
+        self._redis = redis
+        self._kwargs = kwargs
+        self._initialized = False
+
+    def _ensure_client(self) -> None:
+        # Клиент и скрипт создаются при первом обращении, уже внутри event loop
+        if not self._initialized:
+            super().__init__(self._redis or get_async_client(), **self._kwargs)
+            self._initialized = True
+
+    async def check(self, login: str, ip: Optional[str]) -> None:
+        self._ensure_client()
+        if not self.enabled:
+            return
+
+        scopes, keys, args = self._script_args(login, ip)
+        if not scopes:
+            return
+        try:
+            result = await self._script(keys=keys, args=args)
+        except RedisError:
+            self.counters['errors'] += 1
+            return
+        self._apply_result(scopes, result)
+
+    def stats(self) -> dict:
+        if not self._initialized:
+            return {}
+        return super().stats()
+
+
+login_throttle = LoginThrottle()
+async_login_throttle = AsyncLoginThrottle()
@@ -0,0 +1,278 @@
+"""Микробенчмарки компонентов пути логина и проверки токена.
+
+Сеть и БД заменены in-memory реализациями из benchmarks.backends.
+Запуск из каталога src:
+
+    python -m benchmarks.auth --output baseline.json
+    python -m benchmarks.auth --compare baseline.json --threshold 0.1
+
+В режиме сравнения код возврата 1, если медиана какого-либо замера выросла больше порога.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime
+from datetime import timedelta
+from types import SimpleNamespace
+
+from flask import Flask
+from flask_jwt_extended import JWTManager
+from flask_jwt_extended import decode_token
+from opentelemetry import trace as otel_trace
+from opentelemetry.sdk.trace import TracerProvider
+
+from base.hashing import PasswordHashingExecutor
+from base.hashing import get_crypt_context
+from base.low_level import JwtTokenizer
+from base.jwt_cache import VerifiedTokenCache
+from base.revocation import RevokedTokensFilter
+from base.revocation import check_if_token_was_in_logout_request
+from benchmarks.backends import InMemoryORM
+from benchmarks.backends import InMemoryRedis
+from benchmarks.backends import InMemorySessionStore
+from benchmarks.serializers import make_rows
+from core import config
+from models.users import User
+from schemas.users import UserSchema
+from services.mixins import ValidateUserMixin
+from services.utils import JsonResponse
+from tracing import trace
+
+PASSWORD = 'Benchmark-Password1'
+
+
+def measure(function, repeat: int, min_time: float) -> dict:
+    """Время одного вызова в микросекундах. Число вызовов в серии подбирается так,
+        чтобы серия длилась не меньше min_time, результат - лучшая и медианная серии.
+    """
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        number *= 2
+
+    timings = [elapsed / number]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter() - started) / number)
+
+    median = statistics.median(timings)
+    return {
+        'number': number,
+        'repeat': repeat,
+        'best_us': round(min(timings) * 1e6, 3),
+        'median_us': round(median * 1e6, 3),
+        'ops_per_second': round(1 / median, 1),
+    }
+
+
+def create_app() -> Flask:
+    """Минимальное приложение с настройками jwt из core.config."""
+    app = Flask(__name__)
+    app.config.from_object(config)
+    app.config['JWT_SECRET_KEY'] = config.JWT_SECRET_KEY or 'benchmark-secret'
+    JWTManager(app)
+    return app
+
+
+class _UserValidator(ValidateUserMixin):
+
+    def __init__(self, orm, hasher):
+        self.orm = orm
+        self.password_hasher = hasher
+
+
+def bench_passwords(args) -> dict:
+    context = get_crypt_context(config.PASSWORD_HASH_ROUNDS)
+    password_hash = context.hash(PASSWORD)
+
+    orm = InMemoryORM({
+        User: [
+            SimpleNamespace(id=uuid.uuid4(), login=f'user_login_{index}', password=password_hash)
+            for index in range(args.rows)
+        ],
+    })
+    validator = _UserValidator(orm, PasswordHashingExecutor(workers=0))
+    last_login = f'user_login_{args.rows - 1}'
+
+    return {
+        'pbkdf2_verify': measure(lambda: context.verify(PASSWORD, password_hash), args.repeat, args.min_time),
+        'validate_user': measure(
+            lambda: validator._get_validated_user({'login': last_login}, PASSWORD, relations=[]),
+            args.repeat,
+            args.min_time,
+        ),
+    }
+
+
+def wait_until_synced(revoked: RevokedTokensFilter, timeout: float = 10) -> None:
+    """Первая проверка запускает синхронизацию фильтра, замеры начинаются после ее окончания."""
+    deadline = time.monotonic() + timeout
+    revoked.might_be_revoked('')
+    while not revoked.stats()['synced']:
+        if time.monotonic() > deadline:
+            raise RuntimeError('Фильтр отозванных токенов не синхронизировался')
+        time.sleep(0.01)
+
+
+def bench_tokens(args) -> dict:
+    app = create_app()
+    tokenizer = JwtTokenizer(InMemorySessionStore())
+    claims = {'roles': ['admin', 'subscriber', 'user']}
+    identity = str(uuid.uuid4())
+
+    # Фильтр наполнен так же, как у воркера в проде: отозванные за время жизни access токена jti
+    redis = InMemoryRedis()
+    revoked = RevokedTokensFilter(redis=redis)
+    for _ in range(args.rows):
+        jti = str(uuid.uuid4())
+        redis.setex(jti, timedelta(hours=1), '')
+        revoked.revoke(jti)
+    wait_until_synced(revoked)
+
+    def check_blocklist(token: str) -> bool:
+        payload = decode_token(token)
+        return check_if_token_was_in_logout_request(
+            {}, payload, revoked_tokens=revoked, cache_db=redis.cache, token_cache=VerifiedTokenCache(),
+        )
+
+    with app.app_context():
+        access_token = tokenizer.get_tokens(identity, claims)['access_token']
+        return {
+            'jwt_encode_pair': measure(lambda: tokenizer.get_tokens(identity, claims), args.repeat, args.min_time),
+            'jwt_decode': measure(lambda: decode_token(access_token), args.repeat, args.min_time),
+            'jwt_decode_blocklist': measure(lambda: check_blocklist(access_token), args.repeat, args.min_time),
+        }
+
+
+def bench_serialization(args) -> dict:
+    rows = make_rows(args.rows)[UserSchema]
+    dicts = [UserSchema.from_orm(row).dict() for row in rows]
+    for item in dicts:
+        item['id'] = str(item['id'])
+        for role in item['roles']:
+            role['id'] = str(role['id'])
+
+    return {
+        f'user_schema_from_orm_{args.rows}': measure(
+            lambda: [UserSchema.from_orm(row).dict() for row in rows], args.repeat, args.min_time,
+        ),
+        f'json_response_{args.rows}': measure(lambda: JsonResponse(dicts), args.repeat, args.min_time),
+    }
+
+
+def bench_tracing(args) -> dict:
+    def noop():
+        return None
+
+    level = config.TRACING_LEVEL
+    try:
+        config.TRACING_LEVEL = 'off'
+        disabled = trace(noop)
+        config.TRACING_LEVEL = 'low_level'
+        enabled = trace(noop)
+    finally:
+        config.TRACING_LEVEL = level
+
+    otel_trace.set_tracer_provider(TracerProvider())
+    results = {
+        'call_plain': measure(noop, args.repeat, args.min_time),
+        'trace_disabled': measure(disabled, args.repeat, args.min_time),
+        'trace_unsampled': measure(enabled, args.repeat, args.min_time),
+    }
+    with otel_trace.get_tracer(__name__).start_as_current_span('benchmark'):
+        results['trace_sampled'] = measure(enabled, args.repeat, args.min_time)
+    return results
+
+
+SUITES = {
+    'passwords': bench_passwords,
+    'tokens': bench_tokens,
+    'serialization': bench_serialization,
+    'tracing': bench_tracing,
+}
+
+
+def run(args) -> dict:
+    results = {}
+    for name in args.suites:
+        results.update(SUITES[name](args))
+    return {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'rows': args.rows,
+            'password_hash_rounds': config.PASSWORD_HASH_ROUNDS,
+        },
+        'results': results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[dict]:
+    """Сравнивает медианы с baseline. Замер - регрессия, если стал медленнее больше чем на threshold."""
+    rows = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        ratio = result['median_us'] / before['median_us']
+        rows.append({
+            'name': name,
+            'baseline_us': before['median_us'],
+            'current_us': result['median_us'],
+            'ratio': round(ratio, 3),
+            'regression': ratio > 1 + threshold,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--suites', nargs='+', choices=SUITES, default=list(SUITES))
+    parser.add_argument('--rows', type=int, default=1000, help='Строк в сериализации и записей в in-memory БД')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.1, help='Минимальная длительность серии, сек')
+    parser.add_argument('--output', help='Записать результат в JSON файл')
+    parser.add_argument('--compare', help='JSON файл baseline для сравнения')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Допустимое замедление, доля')
+    args = parser.parse_args()
+
+    current = run(args)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(current, file, indent=2)
+
+    if not args.compare:
+        print(f"{'benchmark':<32}{'median us':>14}{'best us':>14}{'ops/s':>14}")
+        for name, result in current['results'].items():
+            print(
+                f"{name:<32}{result['median_us']:>14,.2f}{result['best_us']:>14,.2f}"
+                f"{result['ops_per_second']:>14,.0f}"
+            )
+        return
+
+    with open(args.compare) as file:
+        rows = compare(current, json.load(file), args.threshold)
+
+    print(f"{'benchmark':<32}{'baseline us':>14}{'current us':>14}{'ratio':>8}")
+    for row in rows:
+        mark = '  REGRESSION' if row['regression'] else ''
+        print(f"{row['name']:<32}{row['baseline_us']:>14,.2f}{row['current_us']:>14,.2f}{row['ratio']:>8.2f}{mark}")
+
+    if any(row['regression'] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
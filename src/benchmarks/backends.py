@@ -0,0 +1,305 @@
+"""In-memory замены redis, БД и хранилища сессий для бенчмарков.
+
+Убирают сеть и БД из замеров, чтобы числа отражали стоимость самого кода.
+"""
+import time
+import threading
+from contextlib import contextmanager
+from time import monotonic
+from typing import Iterator, Optional
+
+from sqlalchemy.orm.evaluator import EvaluatorCompiler
+
+from base.abstract import AbstractCache
+from base.abstract import AbstractORM
+from base.abstract import AbstractSessionStore
+from base.abstract import Relations
+from schemas.serializers import compile_serializer
+from services.utils import abort_error
+
+
+class InMemoryPipeline:
+    """Накапливает команды и выполняет их на InMemoryCache при execute()."""
+
+    def __init__(self, cache: 'InMemoryCache'):
+        self.cache = cache
+        self.commands = []
+
+    def setex(self, name, time, value):
+        self.commands.append(lambda: self.cache.set_with_expiry(name, value, time))
+
+    def get(self, name):
+        self.commands.append(lambda: self.cache.get_by_key(name))
+
+    def delete(self, *names):
+        self.commands.append(lambda: self.cache.delete(*names))
+
+    def xadd(self, name, fields, **kwargs):
+        self.commands.append(lambda: None)
+
+    def execute(self) -> list:
+        results = [command() for command in self.commands]
+        self.commands = []
+        return results
+
+
+class InMemoryCache(AbstractCache):
+    """Кеш на словаре. Значения хранятся в bytes, как их отдает redis."""
+
+    def __init__(self):
+        self.data: dict[str, tuple[bytes, float]] = {}
+
+    def set_with_expiry(self, key, value, time, err_text=None) -> None:
+        seconds = time.total_seconds() if hasattr(time, 'total_seconds') else time
+        if not isinstance(value, bytes):
+            value = str(value).encode()
+        self.data[str(key)] = (value, monotonic() + seconds)
+
+    def get_by_key(self, key, err_text=None):
+        item = self.data.get(str(key))
+        if item is None or item[1] < monotonic():
+            return None
+        return item[0]
+
+    def delete(self, *keys, err_text=None) -> None:
+        for key in keys:
+            self.data.pop(str(key), None)
+
+    def mget(self, keys: list, err_text=None) -> list:
+        return [self.get_by_key(key) for key in keys]
+
+    @contextmanager
+    def pipeline(self, transaction: bool = False, err_text=None):
+        yield InMemoryPipeline(self)
+
+
+class InMemoryRedis:
+    """Команды redis, которые использует RevokedTokensFilter: строки с истечением и поток.
+        xread с block ждет новых записей, а не опрашивает поток в цикле.
+    """
+
+    def __init__(self):
+        self.cache = InMemoryCache()
+        self.streams: dict[str, list[tuple[str, dict]]] = {}
+        self._appended = threading.Condition()
+        self._sequence = 0
+
+    @staticmethod
+    def _parse_id(entry_id: str) -> tuple[int, int]:
+        milliseconds, _, sequence = entry_id.lstrip('(').partition('-')
+        return int(milliseconds), int(sequence or 0)
+
+    def get(self, name):
+        return self.cache.get_by_key(name)
+
+    def setex(self, name, time, value):
+        self.cache.set_with_expiry(name, value, time)
+
+    def xadd(self, name, fields, **kwargs) -> str:
+        with self._appended:
+            self._sequence += 1
+            entry_id = f'{int(time.time() * 1000)}-{self._sequence}'
+            self.streams.setdefault(name, []).append((entry_id, fields))
+            self._appended.notify_all()
+        return entry_id
+
+    def xrange(self, name, min='-', max='+', count=None) -> list:
+        exclusive, bound = min.startswith('('), (0, 0) if min == '-' else self._parse_id(min)
+        entries = [
+            (entry_id, fields) for entry_id, fields in self.streams.get(name, [])
+            if self._parse_id(entry_id) > bound or (not exclusive and self._parse_id(entry_id) == bound)
+        ]
+        return entries[:count]
+
+    def xread(self, streams: dict, count=None, block=None) -> list:
+        with self._appended:
+            self._appended.wait_for(
+                lambda: any(self.xrange(name, f'({last_id}') for name, last_id in streams.items()),
+                timeout=None if block is None else block / 1000,
+            )
+            return [
+                (name, entries) for name, last_id in streams.items()
+                if (entries := self.xrange(name, f'({last_id}', count=count))
+            ]
+
+
+class InMemoryORM(AbstractORM):
+    """Объекты в словаре {модель: [объекты]}, строки m2m таблиц - {таблица: [словари]}.
+
+    Связи объектов (например, User.roles) не синхронизируются с m2m таблицами:
+    как и в SqlalchemyORM без загрузки связей, это разные представления данных.
+    Условия criteria вычисляются в Python (EvaluatorCompiler SQLAlchemy), поэтому
+    поддерживаются только сравнения колонок, а для остальных будет UnevaluatableError.
+    """
+
+    def __init__(self, session: Optional[dict] = None):
+        self.session = session if session is not None else {}
+
+    def _rows(self, model) -> list:
+        return self.session.setdefault(model, [])
+
+    def _filter(self, model, filter_: dict) -> Iterator:
+        return (obj for obj in self._rows(model) if all(getattr(obj, key) == value for key, value in filter_.items()))
+
+    def _matching(self, model, criteria: list) -> list:
+        compiler = EvaluatorCompiler(model)
+        predicates = [compiler.process(criterion) for criterion in criteria]
+        return [obj for obj in self._rows(model) if all(predicate(obj) for predicate in predicates)]
+
+    @staticmethod
+    def _apply_defaults(model, obj) -> None:
+        """Значения по умолчанию колонок, которые SQLAlchemy подставил бы при flush."""
+        for column in model.__table__.columns:
+            if getattr(obj, column.key, None) is None and column.default is not None:
+                default = column.default.arg
+                setattr(obj, column.key, default(None) if column.default.is_callable else default)
+
+    @staticmethod
+    def _unique_columns(model) -> list:
+        return [column.key for column in model.__table__.columns if column.unique or column.primary_key]
+
+    def _conflicts(self, model, values: dict) -> bool:
+        return any(
+            getattr(obj, key, None) == values.get(key)
+            for obj in self._rows(model) for key in self._unique_columns(model)
+            if values.get(key) is not None
+        )
+
+    def _target_exists(self, m2m_table, name: str, value) -> bool:
+        """Есть ли запись, на которую ссылается внешний ключ колонки m2m таблицы."""
+        target = next(iter(m2m_table.c[name].foreign_keys)).column
+        return any(
+            getattr(obj, target.key) == value
+            for model, objects in self.session.items() if getattr(model, '__table__', None) is target.table
+            for obj in objects
+        )
+
+    @staticmethod
+    def _sort_key(ordering: tuple):
+        names = [name.lstrip('-') for name in ordering]
+        return lambda obj: tuple(getattr(obj, name) for name in names)
+
+    def get_all(self, model, fields: Optional[list] = None, relations: Relations = None):
+        return list(self._rows(model))
+
+    def get_page(
+            self,
+            model,
+            ordering: tuple,
+            limit: int,
+            after: Optional[dict] = None,
+            filter_: Optional[dict] = None,
+            fields: Optional[list] = None,
+            relations: Relations = None,
+    ) -> tuple[list, bool]:
+        key, descending = self._sort_key(ordering), ordering[0].startswith('-')
+        objects = sorted(self._filter(model, filter_ or {}), key=key, reverse=descending)
+        if after is not None:
+            last_key = tuple(after[name.lstrip('-')] for name in ordering)
+            objects = [obj for obj in objects if (key(obj) < last_key if descending else key(obj) > last_key)]
+        return objects[:limit], len(objects) > limit
+
+    def iter_page(self, model, ordering: tuple, limit: int, **kwargs) -> Iterator:
+        objects, _ = self.get_page(model, ordering, limit + 1, **kwargs)
+        return iter(objects)
+
+    def count(self, model, filter_: Optional[dict] = None) -> int:
+        return sum(1 for _ in self._filter(model, filter_ or {}))
+
+    def get_all_by_filter(self, model, filter_: dict):
+        return list(self._filter(model, filter_))
+
+    def get_one_by_filter(self, model, filter_: dict, relations: Relations = None):
+        return next(self._filter(model, filter_), None)
+
+    def get_related_values(self, model, relation: str, column: str, filter_: dict) -> list:
+        return [getattr(related, column) for obj in self._filter(model, filter_) for related in getattr(obj, relation)]
+
+    def get_by_id(self, model, id_):
+        return self.get_one_by_filter(model, {'id': id_})
+
+    def update_by_filter(self, model, filter_: dict, values: dict):
+        for obj in self._filter(model, filter_):
+            for key, value in values.items():
+                setattr(obj, key, value)
+
+    def add_obj(self, obj, schema=None):
+        model = type(obj)
+        self._apply_defaults(model, obj)
+        if self._conflicts(model, {key: getattr(obj, key) for key in self._unique_columns(model)}):
+            abort_error('Ошибка записи в БД.')
+        self._rows(model).append(obj)
+        if schema:
+            return compile_serializer(schema)(obj)
+
+    def delete_obj(self, obj):
+        self._rows(type(obj)).remove(obj)
+
+    def add_to_many_to_many(self, m2m_table, ids: dict):
+        if ids not in self._rows(m2m_table):
+            self._rows(m2m_table).append(dict(ids))
+
+    def remove_from_many_to_many(self, m2m_table, first_id: tuple, second_id: tuple):
+        self.bulk_remove_from_many_to_many(m2m_table, [dict([first_id, second_id])])
+
+    def bulk_add_to_many_to_many(self, m2m_table, rows: list[dict]) -> list[dict]:
+        inserted = []
+        for row in rows:
+            if row in self._rows(m2m_table):
+                continue
+            if all(self._target_exists(m2m_table, name, value) for name, value in row.items()):
+                self._rows(m2m_table).append(dict(row))
+                inserted.append(dict(row))
+        return inserted
+
+    def bulk_remove_from_many_to_many(self, m2m_table, rows: list[dict]) -> list[dict]:
+        deleted = [row for row in self._rows(m2m_table) if row in rows]
+        self.session[m2m_table] = [row for row in self._rows(m2m_table) if row not in rows]
+        return deleted
+
+    def add_to_many_to_many_by_filter(self, m2m_table, model, criteria: list, column_name: str, values_: dict) -> list:
+        rows = [{column_name: obj.id, **values_} for obj in self._matching(model, criteria)]
+        return [row[column_name] for row in self.bulk_add_to_many_to_many(m2m_table, rows)]
+
+    def remove_from_many_to_many_by_filter(
+            self, m2m_table, model, criteria: list, column_name: str, values_: dict,
+    ) -> list:
+        rows = [{column_name: obj.id, **values_} for obj in self._matching(model, criteria)]
+        return [row[column_name] for row in self.bulk_remove_from_many_to_many(m2m_table, rows)]
+
+    def get_existing_ids(self, model, ids: list) -> set:
+        return {obj.id for obj in self._rows(model) if obj.id in ids}
+
+    def bulk_insert_ignore_conflicts(self, model, rows: list[dict], returning: str) -> list:
+        inserted = []
+        for row in rows:
+            if not self._conflicts(model, row):
+                obj = model(**row)
+                self._apply_defaults(model, obj)
+                self._rows(model).append(obj)
+                inserted.append(getattr(obj, returning))
+        return inserted
+
+
+class InMemorySessionStore(AbstractSessionStore):
+    """Сессии на словаре: (пользователь, сессия) -> jti текущего refresh токена."""
+
+    def __init__(self):
+        self.sessions: dict[tuple[str, str], str] = {}
+
+    def create(self, user_id, session_id: str, refresh_jti: str, user_agent: str = '') -> None:
+        self.sessions[(str(user_id), session_id)] = refresh_jti
+
+    def rotate(self, user_id, session_id: str, refresh_jti: str, new_refresh_jti: str) -> bool:
+        key = (str(user_id), session_id)
+        if self.sessions.get(key) != refresh_jti:
+            return False
+        self.sessions[key] = new_refresh_jti
+        return True
+
+    def revoke(self, user_id, session_id: str, pipe=None) -> None:
+        self.sessions.pop((str(user_id), session_id), None)
+
+    def revoke_all(self, user_id, pipe=None) -> None:
+        for key in [key for key in self.sessions if key[0] == str(user_id)]:
+            del self.sessions[key]
@@ -0,0 +1,83 @@
+"""Микробенчмарк сериализации: pydantic from_orm().dict() против скомпилированных сериализаторов.
+
+Запуск из каталога src: python -m benchmarks.serializers --rows 10000
+"""
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+
+from schemas.roles import RoleSchema
+from schemas.serializers import compile_json_encoder
+from schemas.serializers import compile_serializer
+from schemas.users import LoginHistorySchema
+from schemas.users import UserSchema
+
+
+def make_rows(count: int) -> dict:
+    """Строки, похожие на объекты ORM: только атрибуты, без сессии."""
+    roles = [SimpleNamespace(id=uuid.uuid4(), name=f'role_{i}') for i in range(3)]
+    return {
+        RoleSchema: roles * (count // len(roles)),
+        UserSchema: [
+            SimpleNamespace(id=uuid.uuid4(), login=f'user_login_{i}', email=f'user{i}@mail.ru', roles=roles)
+            for i in range(count)
+        ],
+        LoginHistorySchema: [
+            SimpleNamespace(user_agent='Mozilla/5.0 (X11; Linux x86_64)', auth_datetime=datetime.now())
+            for _ in range(count)
+        ],
+    }
+
+
+def rows_per_second(function, rows: list, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(rows)
+        best = min(best, time.perf_counter() - started)
+    return len(rows) / best
+
+
+def run(count: int, repeat: int) -> list[dict]:
+    results = []
+    for schema, rows in make_rows(count).items():
+        serialize = compile_serializer(schema)
+        encode = compile_json_encoder(schema)
+        assert serialize(rows[0]) == schema.from_orm(rows[0]).dict()
+
+        results.append({
+            'schema': schema.__name__,
+            'from_orm_dict': rows_per_second(
+                lambda items: [schema.from_orm(obj).dict() for obj in items], rows, repeat,
+            ),
+            'compiled_dict': rows_per_second(lambda items: [serialize(obj) for obj in items], rows, repeat),
+            'compiled_json': rows_per_second(lambda items: [encode(obj) for obj in items], rows, repeat),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+    args = parser.parse_args()
+
+    results = run(args.rows, args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'schema':<20}{'from_orm rows/s':>18}{'compiled rows/s':>18}{'json rows/s':>18}{'speedup':>10}")
+    for result in results:
+        print(
+            f"{result['schema']:<20}{result['from_orm_dict']:>18,.0f}{result['compiled_dict']:>18,.0f}"
+            f"{result['compiled_json']:>18,.0f}{result['compiled_dict'] / result['from_orm_dict']:>9.1f}x"
+        )
+
+
+if __name__ == '__main__':
+    main()
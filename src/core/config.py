@@ -14,3 +14,83 @@ JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=1)
 
 PREFIX_FOR_ACCESS_TOKEN = 'access'
 PREFIX_FOR_REFRESH_TOKEN = 'refresh'
+
+# Вероятностный фильтр отозванных access токенов перед проверкой в redis
+REVOCATION_FILTER_ENABLED = os.getenv('REVOCATION_FILTER_ENABLED', 'true').lower() == 'true'
+REVOCATION_FILTER_CAPACITY = int(os.getenv('REVOCATION_FILTER_CAPACITY', 100_000))
+REVOCATION_FILTER_ERROR_RATE = float(os.getenv('REVOCATION_FILTER_ERROR_RATE', 0.001))
+REVOCATION_FILTER_BUCKET = timedelta(minutes=int(os.getenv('REVOCATION_FILTER_BUCKET_MINUTES', 30)))
+REVOCATION_STREAM = os.getenv('REVOCATION_STREAM', 'revoked_access_tokens')
+
+# Production сервер (python server.py): процессы, потоки в каждом и время на завершение запросов при остановке
+SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', os.cpu_count() or 1))
+SERVER_THREADS = int(os.getenv('SERVER_THREADS', 4))
+SERVER_TIMEOUT = int(os.getenv('SERVER_TIMEOUT', 30))
+SERVER_GRACEFUL_TIMEOUT = int(os.getenv('SERVER_GRACEFUL_TIMEOUT', 30))
+SERVER_KEEPALIVE = int(os.getenv('SERVER_KEEPALIVE', 5))
+SERVER_MAX_REQUESTS = int(os.getenv('SERVER_MAX_REQUESTS', 0))
+
+# Пул процессов для хеширования паролей (0 воркеров - хешируем в текущем потоке)
+HASHING_WORKERS = int(os.getenv('HASHING_WORKERS', os.cpu_count() or 1))
+HASHING_QUEUE_SIZE = int(os.getenv('HASHING_QUEUE_SIZE', 64))
+HASHING_TIMEOUT = float(os.getenv('HASHING_TIMEOUT', 2))
+
+# Стоимость pbkdf2, подбирается командой `flask calibrate-hashing` под бюджет задержки
+PASSWORD_HASH_ROUNDS = int(os.getenv('PASSWORD_HASH_ROUNDS', 29000))
+PASSWORD_HASH_BUDGET_MS = float(os.getenv('PASSWORD_HASH_BUDGET_MS', 50))
+
+# Keyset пагинация списков
+PAGINATION_DEFAULT_LIMIT = int(os.getenv('PAGINATION_DEFAULT_LIMIT', 50))
+PAGINATION_MAX_LIMIT = int(os.getenv('PAGINATION_MAX_LIMIT', 500))
+PAGINATION_TOTAL_CACHE_TTL = timedelta(seconds=int(os.getenv('PAGINATION_TOTAL_CACHE_TTL', 60)))
+# Потоковая отдача списков: строки читаются и кодируются пачками
+PAGINATION_MAX_STREAM_LIMIT = int(os.getenv('PAGINATION_MAX_STREAM_LIMIT', 100_000))
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', 500))
+
+# Ограничение попыток входа скользящими окнами: лимит попыток (0 - окно выключено) и длина окна в секундах
+LOGIN_THROTTLE_ENABLED = os.getenv('LOGIN_THROTTLE_ENABLED', 'true').lower() == 'true'
+LOGIN_THROTTLE_LOGIN_LIMIT = int(os.getenv('LOGIN_THROTTLE_LOGIN_LIMIT', 10))
+LOGIN_THROTTLE_LOGIN_WINDOW = int(os.getenv('LOGIN_THROTTLE_LOGIN_WINDOW', 300))
+LOGIN_THROTTLE_IP_LIMIT = int(os.getenv('LOGIN_THROTTLE_IP_LIMIT', 100))
+LOGIN_THROTTLE_IP_WINDOW = int(os.getenv('LOGIN_THROTTLE_IP_WINDOW', 60))
+LOGIN_THROTTLE_GLOBAL_LIMIT = int(os.getenv('LOGIN_THROTTLE_GLOBAL_LIMIT', 1000))
+LOGIN_THROTTLE_GLOBAL_WINDOW = int(os.getenv('LOGIN_THROTTLE_GLOBAL_WINDOW', 1))
+
+# Сессии (устройства) пользователя: сколько одновременно может быть активных refresh токенов
+SESSIONS_MAX_PER_USER = int(os.getenv('SESSIONS_MAX_PER_USER', 10))
+
+# Кеш ролей пользователя для claims: в redis и короткоживущий локальный в воркере
+ROLE_CLAIMS_CACHE_TTL = timedelta(seconds=int(os.getenv('ROLE_CLAIMS_CACHE_TTL', 3600)))
+ROLE_CLAIMS_LOCAL_TTL = float(os.getenv('ROLE_CLAIMS_LOCAL_TTL', 5))
+ROLE_CLAIMS_LOCAL_SIZE = int(os.getenv('ROLE_CLAIMS_LOCAL_SIZE', 10_000))
+
+# LRU кеш проверенных access токенов: пропускает повторную проверку подписи
+VERIFIED_JWT_CACHE_ENABLED = os.getenv('VERIFIED_JWT_CACHE_ENABLED', 'false').lower() == 'true'
+VERIFIED_JWT_CACHE_MAX_ENTRIES = int(os.getenv('VERIFIED_JWT_CACHE_MAX_ENTRIES', 10_000))
+VERIFIED_JWT_CACHE_MAX_BYTES = int(os.getenv('VERIFIED_JWT_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+
+# Помесячные партиции login_history: сколько создавать заранее и сколько хранить
+LOGIN_HISTORY_PARTITIONS_AHEAD = int(os.getenv('LOGIN_HISTORY_PARTITIONS_AHEAD', 3))
+LOGIN_HISTORY_RETENTION_MONTHS = int(os.getenv('LOGIN_HISTORY_RETENTION_MONTHS', 12))
+
+# Массовое назначение/отзыв ролей
+BULK_ROLES_MAX_PAIRS = int(os.getenv('BULK_ROLES_MAX_PAIRS', 10_000))
+
+# Импорт пользователей из NDJSON/CSV
+USER_IMPORT_BATCH_SIZE = int(os.getenv('USER_IMPORT_BATCH_SIZE', 1000))
+
+# Трассировка: подробность спанов (route, service, low_level) и доля сэмплируемых запросов
+TRACING_LEVEL = os.getenv('TRACING_LEVEL', 'service')
+TRACING_SAMPLE_RATIO = float(os.getenv('TRACING_SAMPLE_RATIO', 0.1))
+# Экспорт спанов: список экспортеров через запятую (jaeger, console), пусто - не экспортировать
+TRACING_EXPORTERS = os.getenv('TRACING_EXPORTERS', 'jaeger')
+TRACING_JAEGER_AGENT_HOST = os.getenv('TRACING_JAEGER_AGENT_HOST', 'localhost')
+TRACING_JAEGER_AGENT_PORT = int(os.getenv('TRACING_JAEGER_AGENT_PORT', 6831))
+# Если задан, спаны отправляются в коллектор по http, а не агенту по udp
+TRACING_JAEGER_COLLECTOR_ENDPOINT = os.getenv('TRACING_JAEGER_COLLECTOR_ENDPOINT')
+# Очередь BatchSpanProcessor и какой спан терять при ее переполнении (oldest или newest)
+TRACING_MAX_QUEUE_SIZE = int(os.getenv('TRACING_MAX_QUEUE_SIZE', 2048))
+TRACING_MAX_EXPORT_BATCH_SIZE = int(os.getenv('TRACING_MAX_EXPORT_BATCH_SIZE', 512))
+TRACING_SCHEDULE_DELAY_MS = int(os.getenv('TRACING_SCHEDULE_DELAY_MS', 5000))
+TRACING_EXPORT_TIMEOUT_MS = int(os.getenv('TRACING_EXPORT_TIMEOUT_MS', 30000))
+TRACING_DROP_POLICY = os.getenv('TRACING_DROP_POLICY', 'oldest')
@@ -0,0 +1,116 @@
+import re
+from datetime import date
+
+from sqlalchemy import text
+
+from tracing import trace
+from tracing import TraceLevel
+
+
+def _add_months(day: date, months: int) -> date:
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def _partition_name(table_name: str, month: date) -> str:
+    return f'{table_name}_y{month.year}m{month.month:02d}'
+
+
+def _default_partition_name(table_name: str) -> str:
+    return f'{table_name}_default'
+
+
+def _table_exists(connection, name: str) -> bool:
+    return connection.execute(text('SELECT to_regclass(:name) IS NOT NULL'), {'name': name}).scalar()
+
+
+def _partition_key(connection, table_name: str) -> str:
+    """Колонка, по которой таблица разбита на партиции."""
+    return connection.execute(text(
+        'SELECT attribute.attname FROM pg_partitioned_table partitioned '
+        'JOIN pg_attribute attribute ON attribute.attrelid = partitioned.partrelid '
+        'AND attribute.attnum = partitioned.partattrs[0] '
+        'WHERE partitioned.partrelid = CAST(:table_name AS regclass)'
+    ), {'table_name': table_name}).scalar()
+
+
+def _create_partition(connection, table_name: str, name: str, key: str, start: date, end: date) -> None:
+    """Создает партицию месяца. Если записи этого месяца уже попали в партицию
+        по умолчанию, партицию на их диапазон создать нельзя: сначала создается
+        отдельная таблица, записи переносятся в нее, затем она присоединяется.
+    """
+    default = _default_partition_name(table_name)
+    bounds = {'start': start, 'end': end}
+    in_default = connection.execute(text(
+        f'SELECT EXISTS (SELECT 1 FROM {default} WHERE {key} >= :start AND {key} < :end)'
+    ), bounds).scalar()
+
+    if not in_default:
+        connection.execute(text(
+            f'CREATE TABLE {name} PARTITION OF {table_name} '
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        ))
+        return
+
+    connection.execute(text(f'CREATE TABLE {name} (LIKE {table_name} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+    connection.execute(text(
+        f'WITH moved AS (DELETE FROM {default} WHERE {key} >= :start AND {key} < :end RETURNING *) '
+        f'INSERT INTO {name} SELECT * FROM moved'
+    ), bounds)
+    connection.execute(text(
+        f'ALTER TABLE {table_name} ATTACH PARTITION {name} '
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+
+
+@trace(level=TraceLevel.LOW_LEVEL)
+def ensure_monthly_partitions(connection, table_name: str, months_ahead: int, today: date = None) -> list[str]:
+    """Создает партиции по месяцам от текущего месяца на months_ahead вперед и партицию по умолчанию.
+        Партиция по умолчанию - страховка на случай, если обслуживание не запускалось вовремя,
+        попавшие в нее записи переносятся в партицию своего месяца при ее создании.
+    """
+    current_month = (today or date.today()).replace(day=1)
+    connection.execute(text(
+        f'CREATE TABLE IF NOT EXISTS {_default_partition_name(table_name)} PARTITION OF {table_name} DEFAULT'
+    ))
+    key = _partition_key(connection, table_name)
+    created = []
+
+    for offset in range(months_ahead + 1):
+        start, end = _add_months(current_month, offset), _add_months(current_month, offset + 1)
+        name = _partition_name(table_name, start)
+        if not _table_exists(connection, name):
+            _create_partition(connection, table_name, name, key, start, end)
+        created.append(name)
+
+    return created
+
+
+@trace(level=TraceLevel.LOW_LEVEL)
+def drop_expired_partitions(connection, table_name: str, retention_months: int, today: date = None) -> list[str]:
+    """Удаляет партиции, все записи которых старше retention_months месяцев.
+        Вместо построчного DELETE партиция отсоединяется и удаляется целиком,
+        из партиции по умолчанию устаревшие записи удаляются построчно.
+    """
+    cutoff = _add_months((today or date.today()).replace(day=1), -retention_months)
+    pattern = re.compile(rf'^{table_name}_y(\d{{4}})m(\d{{2}})$')
+    partitions = connection.execute(text(
+        'SELECT child.relname FROM pg_inherits '
+        'JOIN pg_class parent ON pg_inherits.inhparent = parent.oid '
+        'JOIN pg_class child ON pg_inherits.inhrelid = child.oid '
+        'WHERE parent.relname = :table_name'
+    ), {'table_name': table_name}).scalars()
+
+    dropped = []
+    for name in partitions:
+        match = pattern.match(name)
+        if match and _add_months(date(int(match[1]), int(match[2]), 1), 1) <= cutoff:
+            connection.execute(text(f'ALTER TABLE {table_name} DETACH PARTITION {name}'))
+            connection.execute(text(f'DROP TABLE {name}'))
+            dropped.append(name)
+
+    default = _default_partition_name(table_name)
+    if _table_exists(connection, default):
+        key = _partition_key(connection, table_name)
+        connection.execute(text(f'DELETE FROM {default} WHERE {key} < :cutoff'), {'cutoff': cutoff})
+    return dropped
@@ -1,17 +1,134 @@
 import os
+import time
+import logging
+import threading
+from functools import lru_cache
+from typing import Optional
 
 from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.ext.declarative import declarative_base
 from dotenv import load_dotenv
 
+from db.replicas import Replica
+from db.replicas import ReplicaSet
+from db.replicas import RoutingSession
+from metrics import POOL_CHECKOUT_TIMEOUTS
+from metrics import POOL_CHECKOUT_WAIT
 from tracing import trace
+from tracing import TraceLevel
 
 load_dotenv()
 
-engine = create_engine(os.getenv('SQLALCHEMY_DATABASE_URI'), convert_unicode=True)
+logger = logging.getLogger(__name__)
+
+
+class TimedPoolMixin:
+    """Замеряет ожидание соединения из пула (включая открытие нового) и число ждущих потоков.
+        Ожидание дольше POSTGRES_POOL_SLOW_CHECKOUT_MS пишется в лог вместе с состоянием пула.
+    """
+    metrics_name = 'postgres'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waiting = 0
+        self._waiting_lock = threading.Lock()
+        self._slow_checkout = float(os.getenv('POSTGRES_POOL_SLOW_CHECKOUT_MS', 100)) / 1000
+
+    def _do_get(self):
+        with self._waiting_lock:
+            self.waiting += 1
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            POOL_CHECKOUT_TIMEOUTS.labels(self.metrics_name).inc()
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self._waiting_lock:
+                self.waiting -= 1
+            POOL_CHECKOUT_WAIT.labels(self.metrics_name).observe(waited)
+            if waited > self._slow_checkout:
+                logger.warning('Slow %s pool checkout: %.1f ms, %s', self.metrics_name, waited * 1000, self.status())
+
+    def recreate(self):
+        # dispose() пересоздает пул, имя для метрик у реплик задается на экземпляре
+        pool = super().recreate()
+        pool.metrics_name = self.metrics_name
+        return pool
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    metrics_name = 'postgres_async'
+
+
+def get_pool_options() -> dict:
+    """Настройки пула соединений из окружения, общие для синхронного и асинхронного движка."""
+    return {
+        'pool_size': int(os.getenv('POSTGRES_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('POSTGRES_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(os.getenv('POSTGRES_POOL_TIMEOUT', 5)),
+        'pool_recycle': int(os.getenv('POSTGRES_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.getenv('POSTGRES_POOL_PRE_PING', 'true').lower() == 'true',
+    }
+
+
+def get_statement_timeout() -> int:
+    """Ограничение времени одного запроса в мс, 0 - без ограничения."""
+    return int(os.getenv('POSTGRES_STATEMENT_TIMEOUT_MS', 5000))
+
+
+def create_db_engine(url: Optional[str] = None, pool_name: str = 'postgres'):
+    """Движок postgres (psycopg2) с настроенным пулом и statement_timeout на каждом соединении."""
+    db_engine = create_engine(
+        url or os.getenv('SQLALCHEMY_DATABASE_URI'),
+        convert_unicode=True,
+        poolclass=TimedQueuePool,
+        connect_args={'options': f'-c statement_timeout={get_statement_timeout()}'},
+        **get_pool_options(),
+    )
+    db_engine.pool.metrics_name = pool_name
+    return db_engine
+
+
+def create_replica_set() -> ReplicaSet:
+    """Реплики из POSTGRES_REPLICA_URIS (через запятую), без них все запросы идут на мастер."""
+    uris = [uri.strip() for uri in os.getenv('POSTGRES_REPLICA_URIS', '').split(',') if uri.strip()]
+    check_interval = float(os.getenv('POSTGRES_REPLICA_LAG_CHECK_INTERVAL', 1))
+    return ReplicaSet(
+        [
+            Replica(create_db_engine(uri, f'postgres_replica_{index}'), f'replica_{index}', check_interval)
+            for index, uri in enumerate(uris)
+        ],
+        max_lag=float(os.getenv('POSTGRES_REPLICA_MAX_LAG', 1)),
+    )
+
+
+engine = create_db_engine()
+replica_set = create_replica_set()
 db_session = scoped_session(
+    sessionmaker(
+        class_=RoutingSession,
+        autoflush=False,
+        bind=engine,
+        expire_on_commit=False,
+        replicas=replica_set,
+    )
+)
+# Только мастер: для чтений, результат которых кешируется и должен учитывать последние записи
+primary_session = scoped_session(
     sessionmaker(
         autoflush=False,
         bind=engine,
@@ -22,7 +139,85 @@ Base = declarative_base()
 Base.query = db_session.query_property()
 
 
-@trace
+@lru_cache(maxsize=None)
+def get_async_session_factory() -> sessionmaker:
+    """Фабрика сессий AsyncSession для асинхронного режима (драйвер asyncpg).
+        Движок создается при первом обращении, уже внутри event loop воркера.
+    """
+    url = make_url(os.getenv('SQLALCHEMY_DATABASE_URI')).set(drivername='postgresql+asyncpg')
+    async_engine = create_async_engine(
+        url,
+        poolclass=TimedAsyncAdaptedQueuePool,
+        connect_args={'server_settings': {'statement_timeout': str(get_statement_timeout())}},
+        **get_pool_options(),
+    )
+    return sessionmaker(
+        async_engine,
+        class_=AsyncSession,
+        autoflush=False,
+        expire_on_commit=False,
+    )
+
+
+def remove_sessions(exception=None) -> None:
+    """Закрывает сессии потока в конце запроса: соединения возвращаются в пулы,
+        а признак записи для маршрутизации на мастер сбрасывается.
+    """
+    db_session.remove()
+    primary_session.remove()
+
+
+def reinit_after_fork() -> None:
+    """Вызывается в воркере сразу после fork: соединения родителя не закрываются
+        и не используются, воркер открывает свои.
+    """
+    engine.dispose(close=False)
+    replica_set.dispose(close=False)
+    db_session.registry.clear()
+    primary_session.registry.clear()
+    get_async_session_factory.cache_clear()
+
+
+def get_pool_stats(pool=None) -> dict:
+    """Статистика пула соединений для мониторинга."""
+    # После dispose у движка новый пул, поэтому по умолчанию берется текущий
+    pool = pool or engine.pool
+    in_use, idle = pool.checkedout(), pool.checkedin()
+    return {
+        'max_connections': pool.size() + max(0, pool._max_overflow),
+        'created': in_use + idle,
+        'in_use': in_use,
+        'idle': idle,
+        'waiting': getattr(pool, 'waiting', 0),
+    }
+
+
+def get_async_pool_stats() -> dict:
+    """Статистика пула асинхронного движка, пусто, пока он не создан в этом процессе."""
+    if not get_async_session_factory.cache_info().currsize:
+        return {}
+    return get_pool_stats(get_async_session_factory().kw['bind'].sync_engine.pool)
+
+
+@trace(level=TraceLevel.LOW_LEVEL)
 def init_db():
     from models import users, roles
     Base.metadata.create_all(bind=engine)
+    maintain_login_history_partitions()
+
+
+@trace(level=TraceLevel.LOW_LEVEL)
+def maintain_login_history_partitions(drop_expired: bool = False) -> dict:
+    """Создает партиции login_history заранее.
+        Вышедшие за срок хранения партиции удаляются только при drop_expired=True:
+        это делает команда maintain-partitions, а не старт приложения.
+    """
+    from core import config
+    from db.partitions import drop_expired_partitions, ensure_monthly_partitions
+
+    with engine.begin() as connection:
+        created = ensure_monthly_partitions(connection, 'login_history', config.LOGIN_HISTORY_PARTITIONS_AHEAD)
+        dropped = []
+        if drop_expired:
+            dropped = drop_expired_partitions(connection, 'login_history', config.LOGIN_HISTORY_RETENTION_MONTHS)
+    return {'created': created, 'dropped': dropped}
@@ -0,0 +1,42 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryCounter:
+    """Собирает SQL запросы, выполненные внутри блока `with`."""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+
+@contextmanager
+def count_queries(bind=Engine):
+    """Считает запросы к БД: `with count_queries() as counter: ...; counter.count`.
+        По умолчанию считаются запросы ко всем engine, в том числе к репликам.
+    """
+    counter = QueryCounter()
+    event.listen(bind, 'before_cursor_execute', counter)
+    try:
+        yield counter
+    finally:
+        event.remove(bind, 'before_cursor_execute', counter)
+
+
+@contextmanager
+def assert_num_queries(expected: int, bind=Engine):
+    """Проверяет, что внутри блока выполнено ровно `expected` запросов. Для тестов эндпоинтов."""
+    with count_queries(bind) as counter:
+        yield counter
+
+    assert counter.count == expected, (
+        f'Ожидалось {expected} запросов, выполнено {counter.count}:\n' + '\n'.join(counter.statements)
+    )
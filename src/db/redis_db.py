@@ -1,13 +1,81 @@
 import os
+from functools import lru_cache
 
 from redis import Redis
+from redis import BlockingConnectionPool
+from redis import asyncio as aioredis
+from redis.connection import UnixDomainSocketConnection
 from dotenv import load_dotenv
 
 
 load_dotenv()
 
-redis_db = Redis(
-    host=os.getenv('REDIS_HOST'),
-    port=int(os.getenv('REDIS_PORT')),
-    db=int(os.getenv('REDIS_DB')),
-)
+
+def create_pool(
+        pool_class=BlockingConnectionPool,
+        unix_connection_class=UnixDomainSocketConnection,
+) -> BlockingConnectionPool:
+    """Создает пул соединений с redis по настройкам из окружения.
+        Если задан REDIS_UNIX_SOCKET, подключение идет через unix сокет.
+    """
+    options = {
+        'db': int(os.getenv('REDIS_DB')),
+        'max_connections': int(os.getenv('REDIS_MAX_CONNECTIONS', 50)),
+        'timeout': float(os.getenv('REDIS_POOL_TIMEOUT', 1)),
+        'socket_timeout': float(os.getenv('REDIS_SOCKET_TIMEOUT', 5)),
+        'health_check_interval': int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', 30)),
+    }
+    unix_socket = os.getenv('REDIS_UNIX_SOCKET')
+
+    if unix_socket:
+        return pool_class(
+            connection_class=unix_connection_class,
+            path=unix_socket,
+            **options,
+        )
+
+    return pool_class(
+        host=os.getenv('REDIS_HOST'),
+        port=int(os.getenv('REDIS_PORT')),
+        socket_connect_timeout=float(os.getenv('REDIS_SOCKET_CONNECT_TIMEOUT', 1)),
+        socket_keepalive=True,
+        **options,
+    )
+
+
+redis_pool = create_pool()
+redis_db = Redis(connection_pool=redis_pool)
+
+
+def create_async_client() -> aioredis.Redis:
+    """Клиент redis.asyncio с теми же настройками пула, для асинхронного режима.
+        Соединения привязаны к event loop, поэтому клиент создается внутри него.
+    """
+    pool = create_pool(aioredis.BlockingConnectionPool, aioredis.UnixDomainSocketConnection)
+    return aioredis.Redis(connection_pool=pool)
+
+
+def reinit_after_fork() -> None:
+    """Вызывается в воркере сразу после fork: пул забывает соединения родителя,
+        асинхронный клиент будет создан заново в event loop воркера.
+    """
+    redis_pool.reset()
+    get_async_client.cache_clear()
+
+
+def get_pool_stats(pool: BlockingConnectionPool = redis_pool) -> dict:
+    """Статистика пула соединений для мониторинга."""
+    created = len([conn for conn in pool._connections if conn is not None])
+    idle = len([conn for conn in list(pool.pool.queue) if conn is not None])
+    return {
+        'max_connections': pool.max_connections,
+        'created': created,
+        'in_use': created - idle,
+        'idle': idle,
+    }
+
+
+@lru_cache(maxsize=None)
+def get_async_client() -> aioredis.Redis:
+    """Общий для процесса асинхронный клиент: один пул на все асинхронные компоненты."""
+    return create_async_client()
@@ -0,0 +1,132 @@
+import math
+import time
+import itertools
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+from metrics import DB_QUERY_ROUTING
+from metrics import REPLICA_LAG
+
+# Отставание реплики в секундах. Если все полученное уже применено, реплика
+# не отстает, даже если последняя транзакция на мастере была давно. Если же
+# репликация не идет (WAL receiver не в статусе streaming), то "все полученное"
+# может быть сколь угодно старым: запрос возвращает NULL и реплика не используется.
+LAG_QUERY = text("""
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+""")
+
+
+class Replica:
+    """Движок реплики и последнее измеренное отставание.
+
+    Отставание измеряется не чаще раза в check_interval тем потоком, который
+    первым заметил устаревший замер, остальные потоки в это время используют
+    предыдущее значение. Ошибка замера делает реплику недоступной до следующего.
+    """
+
+    def __init__(self, engine, name: str, check_interval: float):
+        self.engine = engine
+        self.name = name
+        self.check_interval = check_interval
+        self.lag = math.inf
+        self._checked_at = -math.inf
+        self._lock = threading.Lock()
+
+    def current_lag(self) -> float:
+        if time.monotonic() - self._checked_at >= self.check_interval and self._lock.acquire(blocking=False):
+            try:
+                self.lag = self._measure_lag()
+                self._checked_at = time.monotonic()
+            finally:
+                self._lock.release()
+        return self.lag
+
+    def _measure_lag(self) -> float:
+        try:
+            with self.engine.connect() as connection:
+                lag = connection.execute(LAG_QUERY).scalar()
+            lag = math.inf if lag is None else float(lag)
+        except Exception:
+            lag = math.inf
+        REPLICA_LAG.labels(self.name).set(lag if math.isfinite(lag) else -1)
+        return lag
+
+
+class ReplicaSet:
+    """Реплики для чтения: по кругу выбирается та, что отстает не больше max_lag секунд."""
+
+    def __init__(self, replicas: list[Replica], max_lag: float):
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self._counter = itertools.count()
+
+    def choose(self):
+        """Движок реплики или None, если все реплики отстают или недоступны."""
+        if not self.replicas:
+            return None
+        start = next(self._counter)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if replica.current_lag() <= self.max_lag:
+                return replica.engine
+        return None
+
+    def dispose(self, close: bool = True) -> None:
+        for replica in self.replicas:
+            replica.engine.dispose(close=close)
+
+
+class RoutingSession(Session):
+    """Сессия, которая отправляет чтение на реплики, а запись - на мастер.
+
+    На мастер идут: flush и любые не-SELECT запросы, SELECT ... FOR UPDATE,
+    запросы внутри using_primary(), а также все чтения после записи через эту
+    сессию до конца запроса (чтение своей записи). Если подходящей реплики нет,
+    чтение тоже идет на мастер.
+    """
+
+    def __init__(self, *args, replicas: ReplicaSet = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replicas = replicas
+
+    @contextmanager
+    def using_primary(self):
+        """Все запросы внутри блока идут на мастер."""
+        previous = self.info.get('use_primary', False)
+        self.info['use_primary'] = True
+        try:
+            yield self
+        finally:
+            self.info['use_primary'] = previous
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        primary = super().get_bind(mapper, clause, **kwargs)
+        if self.replicas is None or not self.replicas.replicas:
+            return primary
+
+        if self._flushing or not isinstance(clause, Select) or clause._for_update_arg is not None:
+            self.info['wrote'] = True
+            DB_QUERY_ROUTING.labels('primary', 'write').inc()
+            return primary
+        if self.info.get('use_primary'):
+            DB_QUERY_ROUTING.labels('primary', 'forced').inc()
+            return primary
+        if self.info.get('wrote'):
+            DB_QUERY_ROUTING.labels('primary', 'read_after_write').inc()
+            return primary
+
+        replica = self.replicas.choose()
+        if replica is None:
+            DB_QUERY_ROUTING.labels('primary', 'replica_lag').inc()
+            return primary
+        DB_QUERY_ROUTING.labels('replica', 'read').inc()
+        return replica
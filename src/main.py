@@ -1,50 +1,42 @@
 import os
+import json
 
+import click
 from flask import Flask
 from flask import request
 from flasgger import Swagger
-from flask_jwt_extended import JWTManager
 from dotenv import load_dotenv
-from opentelemetry import trace
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.instrumentation.flask import FlaskInstrumentor
-from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
-from opentelemetry.exporter.jaeger.thrift import JaegerExporter
 
-from base.low_level import CacheRedis
+from base.hashing import calibrate_rounds
+from base.jwt_cache import CachingJWTManager
+from base.revocation import check_if_token_was_in_logout_request
 from api.v1.users import user_router
 from api.v1.auth import auth_router
 from api.v1.roles import role_router
 from db.postgres import init_db
+from db.postgres import maintain_login_history_partitions
+from db.postgres import remove_sessions
+from services.user_import import UserImportService
+from metrics import init_app as init_metrics
+from core import config
+from tracing import TraceLevel
+from tracing.export import configure_tracer
 
 load_dotenv()
 
 
-def configure_tracer() -> None:
-    trace.set_tracer_provider(TracerProvider())
-    trace.get_tracer_provider().add_span_processor(
-        BatchSpanProcessor(
-            JaegerExporter(
-                agent_host_name='localhost',
-                agent_port=6831,
-            )
-        )
-    )
-    trace.get_tracer_provider().add_span_processor(
-        BatchSpanProcessor(
-            ConsoleSpanExporter()
-        )
-    )
-
-
 def create_app():
     """Создание и инициализация приложения Flask."""
     app = Flask(__name__)
     app.config.from_pyfile(os.path.join('core', 'config.py'))
 
     swagger = Swagger(app)
-    jwt = JWTManager(app)
-    FlaskInstrumentor().instrument_app(app)
+    jwt = CachingJWTManager(app)
+    if TraceLevel[config.TRACING_LEVEL.upper()] >= TraceLevel.ROUTE:
+        from opentelemetry.instrumentation.flask import FlaskInstrumentor
+        FlaskInstrumentor().instrument_app(app)
+    init_metrics(app)
+    app.teardown_appcontext(remove_sessions)
 
     app.register_blueprint(user_router)
     app.register_blueprint(auth_router)
@@ -65,18 +57,62 @@ def main(app):
 
 configure_tracer()
 app, swagger, jwt = create_app()
-
-
-@jwt.token_in_blocklist_loader
-def check_if_token_was_in_logout_request(jwt_header: dict, jwt_payload: dict) -> bool:
-    """Проверяет, был ли токен в запросе на логаут."""
-    token_in_redis = CacheRedis().get_by_key(jwt_payload['jti'])
-    return token_in_redis is not None
+jwt.token_in_blocklist_loader(check_if_token_was_in_logout_request)
+
+
+@app.cli.command('calibrate-hashing')
+@click.option('--budget-ms', default=config.PASSWORD_HASH_BUDGET_MS, show_default=True, help='Бюджет на verify, мс.')
+@click.option('--percentile', default=99.0, show_default=True, help='Перцентиль задержки для бюджета.')
+@click.option('--samples', default=50, show_default=True, help='Число замеров на кандидата.')
+def calibrate_hashing(budget_ms: float, percentile: float, samples: int):
+    """Подбирает PASSWORD_HASH_ROUNDS под бюджет задержки на текущей машине."""
+    result = calibrate_rounds(budget_ms=budget_ms, percentile=percentile, samples=samples)
+    click.echo(
+        f"p{result['percentile']:g} verify: {result['latency_ms']} мс (медиана {result['median_ms']} мс) "
+        f"при {result['rounds']} раундах, сейчас {result['current_rounds']}."
+    )
+    click.echo(f"PASSWORD_HASH_ROUNDS={result['rounds']}")
+
+
+@app.cli.command('maintain-partitions')
+@click.option('--drop-expired/--keep-expired', default=True, show_default=True,
+              help='Удалять партиции старше LOGIN_HISTORY_RETENTION_MONTHS.')
+def maintain_partitions(drop_expired: bool):
+    """Создает будущие партиции login_history и удаляет устаревшие. Запускать по расписанию."""
+    result = maintain_login_history_partitions(drop_expired=drop_expired)
+    click.echo(f"Партиции: {', '.join(result['created'])}")
+    click.echo(f"Удалены: {', '.join(result['dropped']) or '-'}")
+
+
+@app.cli.command('import-users')
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'file_format', type=click.Choice(['ndjson', 'csv']), default='ndjson', show_default=True)
+@click.option('--batch-size', default=config.USER_IMPORT_BATCH_SIZE, show_default=True)
+@click.option('--errors', 'errors_file', type=click.File('w', encoding='utf-8'), default='-',
+              help='Куда писать ошибки по строкам (NDJSON).')
+def import_users(source, file_format: str, batch_size: int, errors_file):
+    """Импорт пользователей из NDJSON/CSV (SOURCE или - для stdin)."""
+    result = UserImportService().import_records(
+        UserImportService.read_records(source, file_format),
+        batch_size=batch_size,
+        on_error=lambda error: errors_file.write(json.dumps(error, ensure_ascii=False) + '\n'),
+        on_progress=lambda stats: click.echo(
+            f"обработано {stats['processed']}, импортировано {stats['imported']}, "
+            f"ошибок {stats['failed']}, {stats['rows_per_second']} строк/с",
+            err=True,
+        ),
+    )
+    click.echo(json.dumps(result), err=True)
 
 
 @app.before_request
 def check_if_exists_x_request_id_in_request_header():
-    """Проверяет, если ли заголовок X-Request-Id. Заголовок нужен для работы трассировки."""
+    """Проверяет, если ли заголовок X-Request-Id. Заголовок нужен для работы трассировки.
+        Сборщик метрик заголовок не передает, поэтому /metrics не проверяется.
+    """
+    if request.endpoint == 'metrics':
+        return
+
     request_id = request.headers.get('X-Request-Id')
 
     if not request_id:
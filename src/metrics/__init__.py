@@ -0,0 +1,228 @@
+import os
+import time
+import inspect
+from functools import wraps
+
+from flask import Flask
+from flask import Response
+from flask import g
+from flask import request
+
+from prometheus_client import CONTENT_TYPE_LATEST
+from prometheus_client import CollectorRegistry
+from prometheus_client import Counter
+from prometheus_client import Gauge
+from prometheus_client import Histogram
+from prometheus_client import REGISTRY
+from prometheus_client import generate_latest
+from prometheus_client import multiprocess
+
+# Метрики в формате prometheus. Если задан PROMETHEUS_MULTIPROC_DIR, значения
+# каждого воркера пишутся в файлы этого каталога и суммируются при чтении /metrics,
+# иначе (один процесс) используется реестр по умолчанию.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+REQUEST_LATENCY = Histogram(
+    'auth_http_request_duration_seconds',
+    'Время обработки http запроса.',
+    ['method', 'route', 'status'],
+    buckets=LATENCY_BUCKETS,
+)
+CACHE_LATENCY = Histogram(
+    'auth_cache_operation_duration_seconds',
+    'Время операции с кешем.',
+    ['operation'],
+    buckets=LATENCY_BUCKETS,
+)
+ORM_LATENCY = Histogram(
+    'auth_orm_operation_duration_seconds',
+    'Время операции с БД через ORM.',
+    ['operation'],
+    buckets=LATENCY_BUCKETS,
+)
+PASSWORD_HASHING_LATENCY = Histogram(
+    'auth_password_hashing_duration_seconds',
+    'Время хеширования или проверки пароля, включая ожидание в очереди пула.',
+    ['operation'],
+    buckets=LATENCY_BUCKETS,
+)
+LOGIN_ATTEMPTS = Counter(
+    'auth_login_attempts',
+    'Попытки входа по результату.',
+    ['result'],
+)
+LOGIN_THROTTLED = Counter(
+    'auth_login_throttled',
+    'Попытки входа, отклоненные ограничителем, по сработавшему окну.',
+    ['scope'],
+)
+POOL_CHECKOUT_WAIT = Histogram(
+    'auth_pool_checkout_wait_seconds',
+    'Ожидание соединения из пула postgres, включая открытие нового.',
+    ['pool'],
+    buckets=LATENCY_BUCKETS,
+)
+POOL_CHECKOUT_TIMEOUTS = Counter(
+    'auth_pool_checkout_timeouts',
+    'Соединение из пула не получено за pool_timeout.',
+    ['pool'],
+)
+DB_QUERY_ROUTING = Counter(
+    'auth_db_query_routing',
+    'Куда направлены запросы к postgres (primary или replica) и почему.',
+    ['target', 'reason'],
+)
+REPLICA_LAG = Gauge(
+    'auth_db_replica_lag_seconds',
+    'Последнее измеренное отставание реплики, -1 - реплика недоступна.',
+    ['replica'],
+    multiprocess_mode='max',
+)
+POOL_CONNECTIONS = Gauge(
+    'auth_pool_connections',
+    'Соединения в пулах redis и postgres (waiting - потоки в ожидании соединения).',
+    ['pool', 'state'],
+    multiprocess_mode='livesum',
+)
+COMPONENT_STATS = Gauge(
+    'auth_component_stats',
+    'Счетчики внутренних компонентов воркера: фильтр отзыва, кеш токенов, пул хеширования,'
+    ' ограничитель входа, экспорт спанов.',
+    ['component', 'name'],
+    multiprocess_mode='livesum',
+)
+
+
+def observe_methods(histogram: Histogram):
+    """Декоратор класса: замеряет время каждого публичного метода, определенного в классе.
+        Генераторы и контекстные менеджеры пропускаются: время их вызова ничего не говорит.
+    """
+    def decorator(cls):
+        for name, method in list(vars(cls).items()):
+            if name.startswith('_') or not inspect.isfunction(method):
+                continue
+            original = inspect.unwrap(method)
+            if inspect.isgeneratorfunction(original) or inspect.isasyncgenfunction(original):
+                continue
+            setattr(cls, name, _observed(method, histogram.labels(name)))
+        return cls
+
+    return decorator
+
+
+def _observed(method, metric):
+    if inspect.iscoroutinefunction(method):
+        @wraps(method)
+        async def async_inner(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                metric.observe(time.perf_counter() - started)
+
+        return async_inner
+
+    @wraps(method)
+    def inner(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            metric.observe(time.perf_counter() - started)
+
+    return inner
+
+
+def _set_stats(component: str, stats: dict) -> None:
+    # Доли между воркерами не суммируются, их считают в prometheus из счетчиков
+    for name, value in stats.items():
+        if isinstance(value, (int, float)) and not name.endswith('_rate'):
+            COMPONENT_STATS.labels(component, name).set(value)
+
+
+def _set_pool(pool: str, stats: dict) -> None:
+    for state, value in stats.items():
+        POOL_CONNECTIONS.labels(pool, state).set(value)
+
+
+def collect_process_stats() -> None:
+    """Переносит текущее состояние пулов и компонентов воркера в gauge метрики."""
+    from base.hashing import password_hasher
+    from base.jwt_cache import verified_token_cache
+    from base.revocation import revoked_tokens_filter
+    from base.throttling import async_login_throttle
+    from base.throttling import login_throttle
+    from db.postgres import get_async_pool_stats as get_postgres_async_pool_stats
+    from db.postgres import get_pool_stats as get_postgres_pool_stats
+    from db.postgres import replica_set
+    from db.redis_db import get_pool_stats as get_redis_pool_stats
+    from tracing.export import get_export_stats
+
+    _set_pool('redis', get_redis_pool_stats())
+    _set_pool('postgres', get_postgres_pool_stats())
+    _set_pool('postgres_async', get_postgres_async_pool_stats())
+    for replica in replica_set.replicas:
+        _set_pool(replica.engine.pool.metrics_name, get_postgres_pool_stats(replica.engine.pool))
+    _set_stats('password_hashing', password_hasher.stats())
+    _set_stats('revoked_tokens_filter', revoked_tokens_filter.stats())
+    _set_stats('verified_token_cache', verified_token_cache.stats())
+    _set_stats('login_throttle', login_throttle.stats())
+    _set_stats('async_login_throttle', async_login_throttle.stats())
+    for exporter, stats in get_export_stats().items():
+        _set_stats(f'span_export_{exporter}', stats)
+
+
+def init_app(app: Flask, stats_interval: float = 1.0) -> None:
+    """Подключает замер времени запросов и эндпоинт /metrics.
+        Состояние пулов обновляется не чаще раза в stats_interval секунд на воркер.
+    """
+    last_collected = [0.0]
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None and request.url_rule is not None:
+            REQUEST_LATENCY.labels(
+                request.method, request.url_rule.rule, response.status_code,
+            ).observe(time.perf_counter() - started)
+
+        now = time.monotonic()
+        if now - last_collected[0] >= stats_interval:
+            last_collected[0] = now
+            collect_process_stats()
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        """Метрики в формате prometheus
+        ---
+        tags:
+          - metrics
+        responses:
+          200:
+            description: Метрики всех воркеров в текстовом формате prometheus
+        """
+        collect_process_stats()
+        data, content_type = render_metrics()
+        return Response(data, content_type=content_type)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Метрики в текстовом формате prometheus, в многопроцессном режиме - по всем воркерам."""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int) -> None:
+    """Удаляет live gauge метрики завершившегося воркера (вызывается мастер процессом)."""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
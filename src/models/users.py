@@ -1,7 +1,8 @@
 import uuid
 import datetime
 
-from sqlalchemy import Column, String, ForeignKey, DateTime, Table
+from sqlalchemy import Column, String, ForeignKey, DateTime, Table, Index
+from sqlalchemy import text
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID
 
@@ -10,8 +11,8 @@ from db.postgres import Base
 roles_users = Table(
     'roles_users',
     Base.metadata,
-    Column('user_id', ForeignKey('users.id', ondelete="CASCADE")),
-    Column('role_id', ForeignKey('roles.id')),
+    Column('user_id', ForeignKey('users.id', ondelete="CASCADE"), primary_key=True),
+    Column('role_id', ForeignKey('roles.id'), primary_key=True),
     keep_existing=True
 )
 
@@ -31,13 +32,19 @@ class User(Base):
 
 
 class LoginHistory(Base):
-    """Модель для логирования входов в аккаунт пользователя."""
+    """Модель для логирования входов в аккаунт пользователя.
+        Таблица разбита на помесячные партиции по auth_datetime, поэтому он входит в первичный ключ.
+    """
     __tablename__ = 'login_history'
+    __table_args__ = (
+        Index('ix_login_history_user_id_auth_datetime', 'user_id', text('auth_datetime DESC')),
+        {'postgresql_partition_by': 'RANGE (auth_datetime)'},
+    )
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False, unique=True)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False)
     user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
     user_agent = Column(String, nullable=False)
-    auth_datetime = Column(DateTime, default=datetime.datetime.now, nullable=False)
+    auth_datetime = Column(DateTime, primary_key=True, default=datetime.datetime.now, nullable=False)
 
     def __repr__(self):
         return f'<LoginHistory: {self.user_agent}>'
@@ -0,0 +1,23 @@
+from typing import Optional
+
+from pydantic import validator
+from pydantic.main import BaseModel
+from pydantic.fields import Field
+
+from core import config
+
+
+class PaginationParamsSchema(BaseModel):
+    """Схема query параметров keyset пагинации."""
+    cursor: Optional[str] = None
+    stream: bool = False
+    limit: int = Field(config.PAGINATION_DEFAULT_LIMIT, ge=1)
+    with_total: bool = False
+
+    @validator('limit')
+    def validate_limit(cls, limit, values):
+        """При потоковой отдаче память не зависит от размера страницы, поэтому лимит выше."""
+        max_limit = config.PAGINATION_MAX_STREAM_LIMIT if values.get('stream') else config.PAGINATION_MAX_LIMIT
+        if limit > max_limit:
+            raise ValueError(f'limit не может быть больше {max_limit}')
+        return limit
@@ -1,8 +1,12 @@
+from typing import Optional
 from uuid import UUID
 
+from pydantic import root_validator
 from pydantic.main import BaseModel
 from pydantic.fields import Field
 
+from core import config
+
 
 class BaseRoleSchema(BaseModel):
     """Базовая схема для ролей в системе."""
@@ -23,3 +27,40 @@ class RoleSchema(BaseRoleSchema):
 
     class Config:
         orm_mode = True
+
+
+class RoleAssignmentSchema(BaseModel):
+    """Пара пользователь - роль."""
+    user_id: UUID
+    role_id: UUID
+
+
+class UserMatchSchema(BaseModel):
+    """Условия выбора пользователей для массовой операции с ролью."""
+    login_prefix: Optional[str] = None
+    email_domain: Optional[str] = None
+    has_role_id: Optional[UUID] = None
+    all_users: bool = False
+
+    @root_validator
+    def validate_not_empty(cls, values):
+        """Пустой фильтр означал бы всех пользователей, это нужно указать явно."""
+        criteria = ('login_prefix', 'email_domain', 'has_role_id')
+        if not values.get('all_users') and all(values.get(name) is None for name in criteria):
+            raise ValueError('Укажите условия выбора пользователей или all_users.')
+        return values
+
+
+class BulkRolesSchema(BaseModel):
+    """Схема массового назначения/отзыва ролей: либо список пар, либо роль и условия выбора пользователей."""
+    pairs: Optional[list[RoleAssignmentSchema]] = Field(None, min_items=1, max_items=config.BULK_ROLES_MAX_PAIRS)
+    role_id: Optional[UUID] = None
+    users: Optional[UserMatchSchema] = None
+
+    @root_validator
+    def validate_mode(cls, values):
+        has_pairs = values.get('pairs') is not None
+        has_filter = values.get('role_id') is not None and values.get('users') is not None
+        if has_pairs == has_filter:
+            raise ValueError('Нужно передать либо pairs, либо role_id вместе с users.')
+        return values
@@ -0,0 +1,86 @@
+from datetime import date
+from datetime import datetime
+from functools import lru_cache
+from json import dumps
+from json.encoder import encode_basestring_ascii
+from typing import Callable
+from uuid import UUID
+
+from pydantic.fields import SHAPE_LIST
+from pydantic.fields import SHAPE_SINGLETON
+from pydantic.main import BaseModel
+from werkzeug.http import http_date
+
+# Сериализаторы для данных, прочитанных из собственной БД. Валидация pydantic
+# для них не нужна, поэтому схема компилируется в функцию, которая напрямую
+# читает атрибуты строки. Результат совпадает с schema.from_orm(obj).dict()
+# и с тем, как flask кодирует этот словарь в JSON.
+
+
+def _is_model(type_) -> bool:
+    return isinstance(type_, type) and issubclass(type_, BaseModel)
+
+
+def _compile(source: str, name: str, namespace: dict) -> Callable:
+    exec(compile(source, f'<serializer {name}>', 'exec'), namespace)  # noqa: S102
+    return namespace[name]
+
+
+@lru_cache(maxsize=None)
+def compile_serializer(schema: type[BaseModel]) -> Callable[[object], dict]:
+    """Компилирует схему в функцию obj -> dict без валидации."""
+    namespace, items = {}, []
+
+    for index, (name, field) in enumerate(schema.__fields__.items()):
+        value = f'obj.{name}'
+        if _is_model(field.type_):
+            namespace[f'nested_{index}'] = compile_serializer(field.type_)
+            if field.shape == SHAPE_LIST:
+                value = f'None if {value} is None else [nested_{index}(item) for item in {value}]'
+            elif field.shape == SHAPE_SINGLETON:
+                value = f'None if {value} is None else nested_{index}({value})'
+        items.append(f'{name!r}: {value}')
+
+    source = 'def serialize(obj):\n    return {' + ', '.join(items) + '}\n'
+    return _compile(source, 'serialize', namespace)
+
+
+def _value_encoder(type_) -> str:
+    """Выражение, кодирующее значение `value` в JSON так же, как это делает flask."""
+    if type_ is str:
+        return 'encode_str(value)'
+    if type_ is UUID:
+        return '\'"\' + str(value) + \'"\''
+    if type_ in (datetime, date):
+        return '\'"\' + http_date(value) + \'"\''
+    return 'dumps(value)'
+
+
+@lru_cache(maxsize=None)
+def compile_json_encoder(schema: type[BaseModel]) -> Callable[[object], str]:
+    """Компилирует схему в функцию obj -> JSON строка без промежуточного словаря."""
+    namespace = {'encode_str': encode_basestring_ascii, 'http_date': http_date, 'dumps': dumps}
+    lines, parts = [], []
+
+    # flask по умолчанию сортирует ключи (JSON_SORT_KEYS), делаем так же
+    for index, (name, field) in enumerate(sorted(schema.__fields__.items())):
+        lines.append(f'    value = obj.{name}')
+        if _is_model(field.type_):
+            namespace[f'nested_{index}'] = compile_json_encoder(field.type_)
+            if field.shape == SHAPE_LIST:
+                encoded = f"'[' + ', '.join([nested_{index}(item) for item in value]) + ']'"
+            else:
+                encoded = f'nested_{index}(value)'
+        elif field.shape == SHAPE_SINGLETON:
+            encoded = _value_encoder(field.type_)
+        else:
+            encoded = 'dumps(value)'
+        lines.append(f"    part_{index} = 'null' if value is None else {encoded}")
+        parts.append(f"'{encode_basestring_ascii(name)}: ' + part_{index}")
+
+    source = (
+        'def encode(obj):\n'
+        + '\n'.join(lines)
+        + "\n    return '{' + ', '.join((" + ', '.join(parts) + ",)) + '}'\n"
+    )
+    return _compile(source, 'encode', namespace)
@@ -1,9 +1,10 @@
 from datetime import datetime
+from typing import ClassVar, Optional
 from uuid import UUID
 
 from pydantic import BaseModel, validator, Field
 
-from tracing import trace
+from .pagination import PaginationParamsSchema
 from .roles import RoleSchema
 
 
@@ -17,7 +18,6 @@ class PasswordSchemaMixin(BaseModel):
     """Миксин для поля password, который используется в нескольких схемах."""
     password: str
 
-    @trace
     @validator('password')
     def validate_password(cls, password):
         """Валидация для пароля пользователя."""
@@ -60,3 +60,33 @@ class LoginHistorySchema(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+class ListUsersParamsSchema(PaginationParamsSchema):
+    """Схема query параметров для списка пользователей: fields=login,email&include=roles."""
+    fields: Optional[list[str]] = None
+    include: Optional[list[str]] = None
+
+    allowed_fields: ClassVar[frozenset] = frozenset({'id', 'login', 'email'})
+    allowed_include: ClassVar[frozenset] = frozenset({'roles'})
+
+    @validator('fields', 'include', pre=True)
+    def split_comma_separated(cls, value):
+        """Параметры приходят строкой через запятую."""
+        if isinstance(value, str):
+            return [item.strip() for item in value.split(',') if item.strip()]
+        return value
+
+    @validator('fields')
+    def validate_fields(cls, fields):
+        unknown = set(fields) - cls.allowed_fields
+        if unknown:
+            raise ValueError(f'Недопустимые поля: {", ".join(sorted(unknown))}')
+        return fields
+
+    @validator('include')
+    def validate_include(cls, include):
+        unknown = set(include) - cls.allowed_include
+        if unknown:
+            raise ValueError(f'Недопустимые связи: {", ".join(sorted(unknown))}')
+        return include
@@ -0,0 +1,17 @@
+from functools import lru_cache
+
+from pydantic import create_model
+from pydantic.main import BaseModel
+
+
+@lru_cache(maxsize=128)
+def get_sparse_schema(schema: type[BaseModel], fields: frozenset) -> type[BaseModel]:
+    """Создает (и кеширует) схему только с нужными полями исходной схемы.
+        Используется для sparse fieldsets, чтобы from_orm не трогал лишние атрибуты модели.
+    """
+    definitions = {
+        name: (field.outer_type_, ... if field.required else field.default)
+        for name, field in schema.__fields__.items()
+        if name in fields
+    }
+    return create_model(f'Sparse{schema.__name__}', __config__=schema.__config__, **definitions)
@@ -0,0 +1,105 @@
+"""Production сервер: gunicorn, несколько процессов и потоков в каждом.
+
+Приложение загружается один раз в мастер процессе (preload) и наследуется
+воркерами через fork. Все, что держит сокеты или потоки (пулы postgres и redis,
+экспорт спанов), воркер пересоздает сразу после fork. Фильтр отозванных токенов
+и пул хеширования сами пересоздаются в процессе с новым pid.
+
+При SIGTERM воркеры перестают принимать соединения, дожидаются текущих запросов
+(не дольше SERVER_GRACEFUL_TIMEOUT), отправляют накопленные спаны и закрывают пулы.
+
+Запуск из каталога src: python server.py
+Для разработки остается `python main.py` (flask dev server с перезагрузкой).
+"""
+import os
+import glob
+
+from gunicorn.app.base import BaseApplication
+
+from core import config
+
+
+def prepare_metrics_dir() -> None:
+    """Метрики прошлого запуска в каталоге multiprocess больше не нужны.
+        Вызывается до загрузки приложения: каталог должен существовать при импорте метрик.
+    """
+    directory = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, '*.db')):
+            os.remove(path)
+
+
+def post_fork(server, worker) -> None:
+    """Воркер: собственные соединения и экспортеры вместо унаследованных от мастера."""
+    from db import postgres
+    from db import redis_db
+    from tracing import export
+
+    postgres.reinit_after_fork()
+    redis_db.reinit_after_fork()
+    export.reinit_after_fork()
+
+
+def worker_exit(server, worker) -> None:
+    """Воркер: текущие запросы уже завершены, отправляем спаны и закрываем пулы."""
+    from base.hashing import password_hasher
+    from db.postgres import engine
+    from db.postgres import replica_set
+    from db.redis_db import redis_pool
+    from tracing.export import shutdown_tracer
+
+    shutdown_tracer()
+    password_hasher.shutdown()
+    engine.dispose()
+    replica_set.dispose()
+    redis_pool.disconnect()
+
+
+def child_exit(server, worker) -> None:
+    """Мастер: live gauge метрики завершившегося воркера больше не суммируются."""
+    from metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
+
+
+class AuthServer(BaseApplication):
+    """gunicorn с настройками из core.config вместо конфигурационного файла."""
+
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+        prepare_metrics_dir()
+
+    def load(self):
+        from main import app
+        from db.postgres import init_db
+
+        init_db()
+        return app
+
+
+def get_options() -> dict:
+    return {
+        'bind': f"{os.getenv('APP_HOST', '0.0.0.0')}:{os.getenv('APP_PORT', '4000')}",
+        'workers': config.SERVER_WORKERS,
+        'worker_class': 'gthread',
+        'threads': config.SERVER_THREADS,
+        'timeout': config.SERVER_TIMEOUT,
+        'graceful_timeout': config.SERVER_GRACEFUL_TIMEOUT,
+        'keepalive': config.SERVER_KEEPALIVE,
+        'max_requests': config.SERVER_MAX_REQUESTS,
+        'max_requests_jitter': config.SERVER_MAX_REQUESTS // 10,
+        'preload_app': True,
+        'post_fork': post_fork,
+        'worker_exit': worker_exit,
+        'child_exit': child_exit,
+    }
+
+
+if __name__ == '__main__':
+    AuthServer(get_options()).run()
@@ -1,28 +1,75 @@
-from typing import Union
-from datetime import timedelta
+import math
+import time
+from typing import Optional, Union
+from http import HTTPStatus
 
+from werkzeug.exceptions import HTTPException
+
+from .mixins import AsyncValidateUserMixin
 from .mixins import ValidateUserMixin
+from base.abstract import AbstractAsyncCache
+from base.abstract import AbstractAsyncORM
+from base.abstract import AbstractTokenizer
 from base.base import BaseAuthService
+from base.jwt_cache import verified_token_cache
+from base.revocation import revoked_tokens_filter
+from base.low_level import AsyncCacheRedis
+from base.low_level import AsyncJwtTokenizer
+from base.low_level import AsyncSqlalchemyORM
+from base.role_claims import async_role_claims_cache
+from base.role_claims import role_claims_cache
+from base.throttling import async_login_throttle
+from base.throttling import login_throttle
+from models.users import LoginHistory
+from metrics import LOGIN_ATTEMPTS
 from tracing import trace
 
 
+def _count_failed_login(error: HTTPException) -> None:
+    """Неверные данные входа - failure, перегрузка и ошибки сервиса - error."""
+    # abort_error передает готовый ответ, поэтому код берется из него, а не из error.code
+    status = error.get_response().status_code
+    LOGIN_ATTEMPTS.labels('failure' if status < HTTPStatus.INTERNAL_SERVER_ERROR else 'error').inc()
+
+
+def _remaining_lifetime(expires_at: int) -> int:
+    """Сколько секунд токену осталось жить (не меньше секунды, setex не принимает 0)."""
+    return max(1, math.ceil(expires_at - time.time()))
+
+
 class AuthService(BaseAuthService, ValidateUserMixin):
     """Логика для аутентификации пользователя."""
+    revoked_tokens = revoked_tokens_filter
+    role_claims = role_claims_cache
+    token_cache = verified_token_cache
+    throttle = login_throttle
 
     @trace
-    def login_user(self, login: str, password: str, user_agent: str) -> Union[dict, None]:
+    def login_user(self, login: str, password: str, user_agent: str, ip: Optional[str] = None) -> Union[dict, None]:
         """
-        Проверка существования юзера, пароля,
+        Проверка лимита попыток, существования юзера, пароля,
         затем выдача пары access & refresh токена.
+        Роли для claims читаются тем же запросом, что и юзер, и кладутся в кеш для refresh.
         """
-        valid_user = self._get_validated_user(
-            {'login': login},
-            password,
-        )
+        self.throttle.check(login, ip)
+        read_started = time.monotonic()
+        try:
+            valid_user = self._get_validated_user(
+                {'login': login},
+                password,
+                relations={'roles': 'joined'},
+            )
+        except HTTPException as error:
+            _count_failed_login(error)
+            raise
+        LOGIN_ATTEMPTS.labels('success').inc()
 
+        roles = sorted(role.name for role in valid_user.roles)
+        self.role_claims.remember(valid_user.id, roles, read_started)
         tokens = self.tokenizer.get_tokens(
             identity=valid_user.id,
-            additional_claims={'roles': [role.name for role in valid_user.roles]},
+            additional_claims={'roles': roles},
+            user_agent=user_agent,
         )
 
         self._add_new_entry_to_login_history(
@@ -33,26 +80,124 @@ class AuthService(BaseAuthService, ValidateUserMixin):
         return tokens
 
     @trace
-    def logout_user(self, jti: str, time: timedelta):
+    def logout_user(self, jti: str, expires_at: int, sub: str, session_id: Optional[str] = None):
         """
         Добавляет access токен в редис, чтобы знать,
         что этот токен уже устарел т.к. был в запросе на логаут.
+        Ключ живет ровно до exp токена. Вместе с ним удаляется сессия токена,
+        так что ее refresh токен больше не обменять на новые.
         """
-        self.cache_db.set_with_expiry(jti, '', time)
+        remaining = _remaining_lifetime(expires_at)
+        with self.cache_db.pipeline() as pipe:
+            pipe.setex(name=jti, value='', time=remaining)
+            self.revoked_tokens.revoke(jti, pipe)
+            self.tokenizer.revoke_session(sub, session_id, pipe)
+            pipe.execute()
+        self.token_cache.evict_jti(jti)
         return {
             'success': True,
-            'expiry_time': time.seconds,
+            'expiry_time': remaining,
         }
 
     @trace
-    def refresh_tokens(self, sub: str, refresh_token: str, additional_claims: dict):
+    def logout_all(self, sub: str):
+        """
+        Выход со всех устройств: отметка not-before отзывает все выданные
+        пользователю access токены, а удаление сессий - refresh токены.
+        """
+        with self.cache_db.pipeline() as pipe:
+            self.revoked_tokens.revoke_user(sub, pipe)
+            self.tokenizer.revoke_all_sessions(sub, pipe)
+            pipe.execute()
+        return {'success': True}
+
+    @trace
+    def refresh_tokens(self, sub: str, refresh_payload: dict):
         """
         Обновляет токены пользователя, взамен на старый refresh токен.
         Поддерживается одноразовость refresh токена,
-        чтобы им можно было воспользоваться только один раз
+        чтобы им можно было воспользоваться только один раз.
+        Роли берутся актуальные, а не из старого токена.
         """
         return self.tokenizer.refresh_tokens(
             sub,
-            refresh_token,
-            additional_claims,
+            refresh_payload,
+            {'roles': self.role_claims.get_roles(sub)},
+        )
+
+
+class AsyncAuthService(AsyncValidateUserMixin):
+    """Логика аутентификации для асинхронного режима, повторяет AuthService."""
+    revoked_tokens = revoked_tokens_filter
+    role_claims = async_role_claims_cache
+    token_cache = verified_token_cache
+    throttle = async_login_throttle
+
+    def __init__(
+            self,
+            tokenizer: AbstractTokenizer = AsyncJwtTokenizer(),
+            cache_db: AbstractAsyncCache = AsyncCacheRedis(),
+            orm: AbstractAsyncORM = AsyncSqlalchemyORM(),
+    ):
+        self.tokenizer = tokenizer
+        self.cache_db = cache_db
+        self.orm = orm
+
+    @trace
+    async def login_user(
+            self, login: str, password: str, user_agent: str, ip: Optional[str] = None,
+    ) -> Union[dict, None]:
+        await self.throttle.check(login, ip)
+        read_started = time.monotonic()
+        try:
+            valid_user = await self._get_validated_user(
+                {'login': login},
+                password,
+                relations={'roles': 'joined'},
+            )
+        except HTTPException as error:
+            _count_failed_login(error)
+            raise
+        LOGIN_ATTEMPTS.labels('success').inc()
+
+        roles = sorted(role.name for role in valid_user.roles)
+        await self.role_claims.remember(valid_user.id, roles, read_started)
+        tokens = await self.tokenizer.get_tokens(
+            identity=valid_user.id,
+            additional_claims={'roles': roles},
+            user_agent=user_agent,
+        )
+
+        await self.orm.add_obj(LoginHistory(user_id=valid_user.id, user_agent=user_agent))
+
+        return tokens
+
+    @trace
+    async def logout_user(self, jti: str, expires_at: int, sub: str, session_id: Optional[str] = None):
+        remaining = _remaining_lifetime(expires_at)
+        async with self.cache_db.pipeline() as pipe:
+            pipe.setex(name=jti, value='', time=remaining)
+            self.revoked_tokens.revoke(jti, pipe)
+            await self.tokenizer.revoke_session(sub, session_id, pipe)
+            await pipe.execute()
+        self.token_cache.evict_jti(jti)
+        return {
+            'success': True,
+            'expiry_time': remaining,
+        }
+
+    @trace
+    async def logout_all(self, sub: str):
+        async with self.cache_db.pipeline() as pipe:
+            self.revoked_tokens.revoke_user(sub, pipe)
+            await self.tokenizer.revoke_all_sessions(sub, pipe)
+            await pipe.execute()
+        return {'success': True}
+
+    @trace
+    async def refresh_tokens(self, sub: str, refresh_payload: dict):
+        return await self.tokenizer.refresh_tokens(
+            sub,
+            refresh_payload,
+            {'roles': await self.role_claims.get_roles(sub)},
         )
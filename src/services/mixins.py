@@ -1,31 +1,52 @@
 from abc import ABC
-from typing import Union
+from typing import Iterator, Optional, Union
 from uuid import UUID
 
-from passlib.hash import pbkdf2_sha256
+from flask import json
 
+from base.hashing import password_hasher
 from base.low_level import SqlalchemyORM
 from base.low_level import CacheRedis
 from base.abstract import AbstractORM
 from base.abstract import AbstractCache
+from base.abstract import Relations
 from models.users import User
+from schemas.serializers import compile_json_encoder
+from schemas.serializers import compile_serializer
+from schemas.utils import get_sparse_schema
+from services.pagination import decode_cursor
+from services.pagination import encode_cursor
 from services.utils import abort_error
+from services.utils import StreamingJsonResponse
 from tracing import trace
+from core import config
 
 
 class ValidateUserMixin:
     """Миксин для валидации пользователя по паролю."""
-    validate_algorithm = pbkdf2_sha256
+    password_hasher = password_hasher
 
     @trace
-    def _get_validated_user(self, filter_by: dict, password: str) -> Union[User, None]:
-        """Проверка существования пользователя, проверка пароля."""
-        user = User.query.filter_by(**filter_by).first()
+    def _get_validated_user(
+            self,
+            filter_by: dict,
+            password: str,
+            upgrade_hash: bool = True,
+            relations: Relations = None,
+    ) -> Union[User, None]:
+        """Проверка существования пользователя, проверка пароля.
+            Если хеш пароля создан с устаревшей стоимостью, он прозрачно пересчитывается.
+            relations - связи, которые нужно загрузить тем же запросом.
+            Пользователь читается с мастера: на реплике может быть еще старый хеш
+            (например, сразу после смены пароля), а от результата зависят записи.
+        """
+        with self.orm.using_primary():
+            user = self.orm.get_one_by_filter(User, filter_by, relations=relations)
 
         if not user:
             abort_error('Пользователь не найден.')
 
-        is_password_valid = self.validate_algorithm.verify(
+        is_password_valid, new_hash = self.password_hasher.verify_and_update(
             password,
             user.password,
         )
@@ -33,13 +54,49 @@ class ValidateUserMixin:
         if not is_password_valid:
             abort_error('Пароль неверный.')
 
+        if new_hash and upgrade_hash:
+            self.orm.update_by_filter(User, {'id': user.id}, {'password': new_hash})
+            user.password = new_hash
+
+        return user
+
+
+class AsyncValidateUserMixin:
+    """Миксин для валидации пользователя по паролю в асинхронных сервисах."""
+    password_hasher = password_hasher
+
+    @trace
+    async def _get_validated_user(
+            self,
+            filter_by: dict,
+            password: str,
+            upgrade_hash: bool = True,
+            relations: Relations = None,
+    ) -> Union[User, None]:
+        """То же, что ValidateUserMixin._get_validated_user, pbkdf2 считается вне event loop."""
+        user = await self.orm.get_one_by_filter(User, filter_by, relations=relations)
+
+        if not user:
+            abort_error('Пользователь не найден.')
+
+        is_password_valid, new_hash = await self.password_hasher.verify_and_update_async(
+            password,
+            user.password,
+        )
+
+        if not is_password_valid:
+            abort_error('Пароль неверный.')
+
+        if new_hash and upgrade_hash:
+            await self.orm.update_by_filter(User, {'id': user.id}, {'password': new_hash})
+            user.password = new_hash
+
         return user
 
 
 class SqlalchemyORMMixin:
     """Миксин для подмешивания orm sqlalchemy."""
 
-    @trace
     def __init__(self, orm: AbstractORM = SqlalchemyORM()):
         super().__init__()
         self.orm = orm
@@ -48,7 +105,6 @@ class SqlalchemyORMMixin:
 class CacheRedisMixin:
     """Миксин для помешивания редиса."""
 
-    @trace
     def __init__(self, cache_db: AbstractCache = CacheRedis()):
         super().__init__()
         self.cache_db = cache_db
@@ -68,15 +124,138 @@ class GetModelMixin(SqlalchemyORMMixin):
         return obj
 
 
-class ListModelMixin(SqlalchemyORMMixin):
+class ListModelMixin(CacheRedisMixin, SqlalchemyORMMixin):
+    ordering = ('id',)
+    # Связи, которые сериализует полная схема: грузятся заранее, чтобы не было N+1
+    load_relations: Relations = None
+
+    @trace
+    def list_all(
+            self,
+            fields: Optional[list] = None,
+            include: Optional[list] = None,
+            cursor: Optional[str] = None,
+            limit: int = config.PAGINATION_DEFAULT_LIMIT,
+            with_total: bool = False,
+            stream: bool = False,
+    ):
+        """Страница списка объектов. Если заданы fields или include, из БД грузятся
+            и сериализуются только эти поля и связи (id отдается всегда).
+        """
+        if fields is None and include is None:
+            return self.paginate(
+                self.model,
+                self.schema,
+                self.ordering,
+                cursor,
+                limit,
+                with_total,
+                stream=stream,
+                relations=self.load_relations,
+            )
+
+        relations = self.model.__mapper__.relationships.keys()
+        fields = fields or [name for name in self.schema.__fields__ if name not in relations]
+        fields = list({'id', *fields})
+        include = include or []
+        return self.paginate(
+            self.model,
+            get_sparse_schema(self.schema, frozenset(fields + include)),
+            self.ordering,
+            cursor,
+            limit,
+            with_total,
+            stream=stream,
+            fields=list({*fields, *[name.lstrip('-') for name in self.ordering]}),
+            relations=include,
+        )
 
     @trace
-    def list_all(self):
-        objects = self.orm.get_all(self.model)
-        return {
+    def paginate(
+            self,
+            model,
+            schema,
+            ordering: tuple,
+            cursor: Optional[str],
+            limit: int,
+            with_total: bool = False,
+            filter_: Optional[dict] = None,
+            fields: Optional[list] = None,
+            relations: Relations = None,
+            stream: bool = False,
+    ) -> Union[dict, StreamingJsonResponse]:
+        """Keyset пагинация: отдает страницу и курсор следующей страницы.
+            В режиме stream строки читаются с серверного курсора и кодируются по мере отправки.
+        """
+        page_kwargs = {
+            'after': decode_cursor(model, cursor, ordering),
+            'filter_': filter_,
+            'fields': fields,
+            'relations': relations,
+        }
+        total = self._get_approximate_total(model, filter_) if with_total else None
+
+        if stream:
+            objects = self.orm.iter_page(model, ordering, limit, **page_kwargs)
+            return StreamingJsonResponse(self._stream_page(objects, schema, ordering, limit, total))
+
+        objects, has_next = self.orm.get_page(model, ordering, limit, **page_kwargs)
+        response = {
             'count': len(objects),
-            'source': [self.schema.from_orm(obj).dict() for obj in objects],
+            'source': list(map(compile_serializer(schema), objects)),
+            'next_cursor': encode_cursor(objects[-1], ordering) if has_next else None,
         }
+        if with_total:
+            response['total'] = total
+
+        return response
+
+    @staticmethod
+    def _stream_page(objects: Iterator, schema, ordering: tuple, limit: int, total: Optional[int]) -> Iterator[str]:
+        """Кодирует страницу в тот же конверт, что и обычный ответ, но частями.
+            count и next_cursor известны только в конце, поэтому идут после source.
+        """
+        encode = compile_json_encoder(schema)
+        count, last_obj, has_next, chunk = 0, None, False, []
+
+        yield '{"source": ['
+        try:
+            for obj in objects:
+                if count == limit:
+                    has_next = True
+                    break
+                chunk.append(encode(obj))
+                count, last_obj = count + 1, obj
+                if len(chunk) == config.STREAM_CHUNK_SIZE:
+                    yield ('' if count == len(chunk) else ', ') + ', '.join(chunk)
+                    chunk = []
+            if chunk:
+                yield ('' if count == len(chunk) else ', ') + ', '.join(chunk)
+        finally:
+            # Закрывает серверный курсор и сессию, в том числе если клиент отключился
+            objects.close()
+
+        tail = {
+            'count': count,
+            'next_cursor': encode_cursor(last_obj, ordering) if has_next else None,
+        }
+        if total is not None:
+            tail['total'] = total
+        yield '], ' + json.dumps(tail)[1:]
+
+    @trace
+    def _get_approximate_total(self, model, filter_: Optional[dict] = None) -> int:
+        """Общее количество записей, кешируется отдельно и поэтому может немного отставать."""
+        filter_part = ','.join(f'{key}={value}' for key, value in sorted((filter_ or {}).items()))
+        key = f'total:{model.__tablename__}:{filter_part}'
+
+        cached = self.cache_db.get_by_key(key)
+        if cached is not None:
+            return int(cached)
+
+        total = self.orm.count(model, filter_)
+        self.cache_db.set_with_expiry(key, total, config.PAGINATION_TOTAL_CACHE_TTL)
+        return total
 
 
 class CreateModelMixin(SqlalchemyORMMixin):
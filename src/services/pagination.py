@@ -0,0 +1,41 @@
+import json
+import base64
+import binascii
+from uuid import UUID
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.dialects.postgresql import UUID as PostgresUUID
+
+from services.utils import abort_error
+
+
+def encode_cursor(obj, ordering: tuple) -> str:
+    """Непрозрачный курсор: значения ключа сортировки последней записи страницы."""
+    values = [getattr(obj, name.lstrip('-')) for name in ordering]
+    raw = json.dumps([value.isoformat() if isinstance(value, datetime) else str(value) for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(model, cursor: Optional[str], ordering: tuple) -> Optional[dict]:
+    """Разбирает курсор обратно в значения ключа с типами колонок модели."""
+    if not cursor:
+        return None
+
+    names = [name.lstrip('-') for name in ordering]
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(names):
+            raise ValueError
+        return {name: _parse_value(model, name, value) for name, value in zip(names, values)}
+    except (ValueError, TypeError, AttributeError, binascii.Error):
+        abort_error('Некорректный курсор.')
+
+
+def _parse_value(model, name: str, value: str):
+    column_type = getattr(model, name).type
+    if isinstance(column_type, PostgresUUID):
+        return UUID(value)
+    if column_type.python_type is datetime:
+        return datetime.fromisoformat(value)
+    return column_type.python_type(value)
@@ -1,5 +1,7 @@
+from base.role_claims import role_claims_cache
 from schemas.roles import RoleSchema
 from models.roles import Role
+from tracing import trace
 from . import mixins
 
 
@@ -13,3 +15,20 @@ class RoleService(
     """Бизнес логика для работы с ролями."""
     model = Role
     schema = RoleSchema
+    role_claims = role_claims_cache
+
+    @trace
+    def update(self, update_data: dict, obj_id):
+        """Обновляет роль и сбрасывает кеш ролей ее пользователей, т.к. имя роли есть в claims."""
+        user_ids = self.orm.get_related_values(Role, 'users', 'id', {'id': obj_id})
+        response = super().update(update_data, obj_id)
+        self.role_claims.invalidate(*user_ids)
+        return response
+
+    @trace
+    def delete(self, obj_id):
+        """Удаляет роль и сбрасывает кеш ролей ее пользователей."""
+        user_ids = self.orm.get_related_values(Role, 'users', 'id', {'id': obj_id})
+        response = super().delete(obj_id)
+        self.role_claims.invalidate(*user_ids)
+        return response
@@ -0,0 +1,128 @@
+import csv
+import json
+import time
+import uuid
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Optional, TextIO
+
+from pydantic.error_wrappers import ValidationError
+
+from base.hashing import password_hasher
+from base.low_level import SqlalchemyORM
+from base.abstract import AbstractORM
+from core import config
+from models.users import User
+from schemas.users import BaseUserSchema
+from schemas.users import CreateUserSchema
+from tracing import trace
+
+
+class UserImportService:
+    """Потоковый импорт пользователей из NDJSON/CSV.
+
+    Строки читаются и валидируются по одной, пароли пачки хешируются на всех
+    ядрах, а пачка пишется в БД одним INSERT. Вместо пароля строка может
+    содержать готовый хеш passlib в поле password_hash.
+    """
+
+    def __init__(self, orm: AbstractORM = SqlalchemyORM(), hasher=password_hasher):
+        self.orm = orm
+        self.hasher = hasher
+
+    @staticmethod
+    def read_records(stream: TextIO, file_format: str) -> Iterator[tuple[int, Optional[dict]]]:
+        """Отдает (номер строки, запись). Нечитаемая строка отдается как None."""
+        if file_format == 'csv':
+            for line_number, record in enumerate(csv.DictReader(stream), start=2):
+                yield line_number, {key: value for key, value in record.items() if value != ''}
+            return
+
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_number, record if isinstance(record, dict) else None
+
+    def _validate(self, record: Optional[dict]) -> tuple[Optional[dict], Optional[list]]:
+        """Валидирует запись, возвращает поля пользователя или ошибки."""
+        if record is None:
+            return None, [{'msg': 'Некорректная строка.'}]
+
+        try:
+            if 'password_hash' in record:
+                user = BaseUserSchema(**record).dict()
+                if not self.hasher.identify(record['password_hash']):
+                    return None, [{'loc': ['password_hash'], 'msg': 'Неподдерживаемый формат хеша.'}]
+                user['password_hash'] = record['password_hash']
+            else:
+                user = CreateUserSchema(**record).dict()
+        except ValidationError as err:
+            return None, json.loads(err.json())
+        return user, None
+
+    @trace
+    def _import_batch(self, batch: list[tuple[int, dict]]) -> tuple[int, list[dict]]:
+        """Хеширует пароли пачки и пишет ее одним запросом. Возвращает число вставленных и ошибки."""
+        to_hash = [user['password'] for _, user in batch if 'password_hash' not in user]
+        hashes = iter(self.hasher.hash_many(to_hash))
+
+        rows = []
+        for _, user in batch:
+            password = user.pop('password_hash', None) or next(hashes)
+            rows.append({'id': uuid.uuid4(), 'login': user['login'], 'email': user.get('email'), 'password': password})
+
+        inserted = set(self.orm.bulk_insert_ignore_conflicts(User, rows, returning='login'))
+        errors = [
+            {'line': line_number, 'login': user['login'], 'errors': [{'msg': 'Логин или email уже заняты.'}]}
+            for line_number, user in batch
+            if user['login'] not in inserted
+        ]
+        return len(inserted), errors
+
+    @trace
+    def import_records(
+            self,
+            records: Iterable[tuple[int, Optional[dict]]],
+            batch_size: int = config.USER_IMPORT_BATCH_SIZE,
+            on_error: Callable[[dict], None] = lambda error: None,
+            on_progress: Callable[[dict], None] = lambda stats: None,
+    ) -> dict:
+        """Импортирует записи пачками, ошибки по строкам и прогресс отдает в колбэки."""
+        started = time.perf_counter()
+        stats = {'processed': 0, 'imported': 0, 'failed': 0}
+        records = iter(records)
+
+        while True:
+            chunk = list(islice(records, batch_size))
+            if not chunk:
+                break
+
+            batch, seen_logins = [], set()
+            for line_number, record in chunk:
+                user, errors = self._validate(record)
+                if user is not None and user['login'] in seen_logins:
+                    errors = [{'msg': 'Логин повторяется в файле.'}]
+                if errors:
+                    stats['failed'] += 1
+                    on_error({'line': line_number, 'login': (record or {}).get('login'), 'errors': errors})
+                    continue
+                seen_logins.add(user['login'])
+                batch.append((line_number, user))
+
+            if batch:
+                imported, errors = self._import_batch(batch)
+                stats['imported'] += imported
+                stats['failed'] += len(errors)
+                for error in errors:
+                    on_error(error)
+
+            stats['processed'] += len(chunk)
+            elapsed = time.perf_counter() - started
+            stats['seconds'] = round(elapsed, 2)
+            stats['rows_per_second'] = round(stats['processed'] / elapsed, 1) if elapsed else 0.0
+            on_progress(dict(stats))
+
+        return stats
@@ -1,12 +1,27 @@
-from typing import Union
+from typing import Optional, Union
 from uuid import UUID
 
-from passlib.hash import pbkdf2_sha256
-
 from tracing import trace
+from core import config
+from base.abstract import AbstractAsyncCache
+from base.abstract import AbstractAsyncORM
+from base.abstract import AbstractCache
+from base.low_level import AsyncCacheRedis
+from base.low_level import AsyncSqlalchemyORM
+from base.low_level import CacheRedis
+from base.revocation import revoked_tokens_filter
+from base.sessions import async_session_store
+from base.sessions import session_store
+from base.role_claims import role_claims_cache
+from schemas.serializers import compile_serializer
+from services.pagination import decode_cursor
+from services.pagination import encode_cursor
+from models.roles import Role
 from models.users import User
 from models.users import LoginHistory
 from models.users import roles_users
+from schemas.roles import BulkRolesSchema
+from schemas.roles import UserMatchSchema
 from schemas.users import CreateUserSchema
 from schemas.users import LoginHistorySchema
 from schemas.users import ChangePasswordSchema
@@ -16,44 +31,206 @@ from . import mixins
 
 class UserService(
     mixins.ValidateUserMixin,
+    mixins.GetModelMixin,
     mixins.CreateModelMixin,
     mixins.ListModelMixin,
 ):
     """Бизнес-логика для пользователей."""
     model = User
     schema = UserSchema
+    load_relations = {'roles': 'selectin'}
+    role_claims = role_claims_cache
+    revoked_tokens = revoked_tokens_filter
+    sessions = session_store
+    cache_db: AbstractCache = CacheRedis()
 
     @trace
     def create(self, user_data: CreateUserSchema) -> Union[str, dict]:
         """Хешируем пароль пользователя и создаем."""
-        user_data.password = pbkdf2_sha256.hash(user_data.password)
+        user_data.password = self.password_hasher.hash(user_data.password)
         return super().create(user_data.dict())
 
     @trace
     def change_user_password(self, user_id: UUID, data: ChangePasswordSchema) -> Union[str, dict]:
-        """Обновление пароля пользователя."""
-        valid_user = self._get_validated_user({'id': user_id}, data.current_password)
-        valid_user.password = pbkdf2_sha256.hash(data.password)
+        """Обновление пароля пользователя. Все выданные ранее токены и сессии отзываются."""
+        valid_user = self._get_validated_user(
+            {'id': user_id},
+            data.current_password,
+            upgrade_hash=False,
+            relations={'roles': 'joined'},
+        )
+        valid_user.password = self.password_hasher.hash(data.password)
+        response = self.orm.add_obj(valid_user, self.schema)
 
-        return self.orm.add_obj(valid_user, self.schema)
+        with self.cache_db.pipeline() as pipe:
+            self.revoked_tokens.revoke_user(user_id, pipe)
+            self.sessions.revoke_all(user_id, pipe)
+            pipe.execute()
+        return response
 
     @trace
-    def get_login_history_of_user(self, user_id: UUID) -> dict:
-        """Получение истории входа пользователя."""
-        login_history = self.orm.get_all_by_filter(LoginHistory, {'user_id': user_id})
-        return {
-            'count': len(login_history),
-            'source': [LoginHistorySchema.from_orm(lh).dict() for lh in login_history]
-        }
+    def get_login_history_of_user(
+            self,
+            user_id: UUID,
+            cursor: Optional[str] = None,
+            limit: int = config.PAGINATION_DEFAULT_LIMIT,
+            with_total: bool = False,
+            stream: bool = False,
+    ) -> dict:
+        """Получение истории входа пользователя, от новых записей к старым."""
+        return self.paginate(
+            LoginHistory,
+            LoginHistorySchema,
+            ('-auth_datetime', '-id'),
+            cursor,
+            limit,
+            with_total,
+            filter_={'user_id': user_id},
+            stream=stream,
+        )
 
     @trace
     def assign_role_to_user(self, role_id, user_id):
         """Добавляет роль пользователя через m2m таблицу, чтобы не делать доп запросов."""
         self.orm.add_to_many_to_many(roles_users, {'role_id': role_id, 'user_id': user_id})
+        self.role_claims.invalidate(user_id)
         return {'success': True}
 
     @trace
     def delete_role_from_user(self, role_id, user_id):
         """Удаляет роль у пользователя с помощью 3 таблицы для m2m, чтобы не делать доп запросов."""
         self.orm.remove_from_many_to_many(roles_users, ('role_id', role_id), ('user_id', user_id))
+        self.role_claims.invalidate(user_id)
         return {'success': True}
+
+    @trace
+    def bulk_assign_roles(self, data: BulkRolesSchema) -> dict:
+        """Массовое назначение ролей одним запросом в БД и одним сбросом кеша ролей."""
+        if data.pairs is None:
+            return self._change_roles_by_filter(data, self.orm.add_to_many_to_many_by_filter)
+
+        pairs = list(dict.fromkeys((pair.user_id, pair.role_id) for pair in data.pairs))
+        inserted = self.orm.bulk_add_to_many_to_many(
+            roles_users,
+            [{'user_id': user_id, 'role_id': role_id} for user_id, role_id in pairs],
+        )
+        changed = {(row['user_id'], row['role_id']) for row in inserted}
+        return self._pairs_response(pairs, changed, 'assigned', 'already_assigned')
+
+    @trace
+    def bulk_revoke_roles(self, data: BulkRolesSchema) -> dict:
+        """Массовый отзыв ролей одним запросом в БД и одним сбросом кеша ролей."""
+        if data.pairs is None:
+            return self._change_roles_by_filter(data, self.orm.remove_from_many_to_many_by_filter)
+
+        pairs = list(dict.fromkeys((pair.user_id, pair.role_id) for pair in data.pairs))
+        deleted = self.orm.bulk_remove_from_many_to_many(
+            roles_users,
+            [{'user_id': user_id, 'role_id': role_id} for user_id, role_id in pairs],
+        )
+        changed = {(row['user_id'], row['role_id']) for row in deleted}
+        return self._pairs_response(pairs, changed, 'revoked', 'not_assigned')
+
+    def _pairs_response(self, pairs: list, changed: set, changed_status: str, unchanged_status: str) -> dict:
+        """Результат по каждой паре. Для неизмененных пар отдельно проверяется, существуют ли пользователь и роль."""
+        self.role_claims.invalidate(*{user_id for user_id, _ in changed})
+
+        unchanged = [pair for pair in pairs if pair not in changed]
+        existing_users, existing_roles = set(), set()
+        if unchanged:
+            existing_users = self.orm.get_existing_ids(User, list({user_id for user_id, _ in unchanged}))
+            existing_roles = self.orm.get_existing_ids(Role, list({role_id for _, role_id in unchanged}))
+
+        results = []
+        for user_id, role_id in pairs:
+            if (user_id, role_id) in changed:
+                status = changed_status
+            elif user_id not in existing_users:
+                status = 'user_not_found'
+            elif role_id not in existing_roles:
+                status = 'role_not_found'
+            else:
+                status = unchanged_status
+            results.append({'user_id': user_id, 'role_id': role_id, 'status': status})
+
+        return {'count': len(changed), 'results': results}
+
+    def _change_roles_by_filter(self, data: BulkRolesSchema, change) -> dict:
+        """Назначение/отзыв роли всем пользователям, подходящим под условия."""
+        self.get_by_id(data.role_id, Role)
+        user_ids = change(
+            roles_users,
+            User,
+            self._build_user_criteria(data.users),
+            'user_id',
+            {'role_id': data.role_id},
+        )
+        self.role_claims.invalidate(*user_ids)
+        return {'count': len(user_ids)}
+
+    @staticmethod
+    def _build_user_criteria(users: UserMatchSchema) -> list:
+        criteria = []
+        if users.login_prefix is not None:
+            criteria.append(User.login.startswith(users.login_prefix, autoescape=True))
+        if users.email_domain is not None:
+            criteria.append(User.email.endswith(f'@{users.email_domain}', autoescape=True))
+        if users.has_role_id is not None:
+            criteria.append(User.roles.any(Role.id == users.has_role_id))
+        return criteria
+
+
+class AsyncUserService(mixins.AsyncValidateUserMixin):
+    """Операции с пользователями для асинхронного режима: регистрация, смена пароля, история входов.
+        Потоковая отдача и общее количество записей есть только в синхронном UserService.
+    """
+    schema = UserSchema
+    revoked_tokens = revoked_tokens_filter
+    sessions = async_session_store
+
+    def __init__(self, orm: AbstractAsyncORM = AsyncSqlalchemyORM(), cache_db: AbstractAsyncCache = AsyncCacheRedis()):
+        self.orm = orm
+        self.cache_db = cache_db
+
+    @trace
+    async def create(self, user_data: CreateUserSchema) -> dict:
+        user_data.password = await self.password_hasher.hash_async(user_data.password)
+        return await self.orm.add_obj(User(**user_data.dict()), self.schema)
+
+    @trace
+    async def change_user_password(self, user_id: UUID, data: ChangePasswordSchema) -> dict:
+        valid_user = await self._get_validated_user(
+            {'id': user_id},
+            data.current_password,
+            upgrade_hash=False,
+            relations={'roles': 'selectin'},
+        )
+        valid_user.password = await self.password_hasher.hash_async(data.password)
+        response = await self.orm.add_obj(valid_user, self.schema)
+
+        async with self.cache_db.pipeline() as pipe:
+            self.revoked_tokens.revoke_user(user_id, pipe)
+            await self.sessions.revoke_all(user_id, pipe)
+            await pipe.execute()
+        return response
+
+    @trace
+    async def get_login_history_of_user(
+            self,
+            user_id: UUID,
+            cursor: Optional[str] = None,
+            limit: int = config.PAGINATION_DEFAULT_LIMIT,
+    ) -> dict:
+        ordering = ('-auth_datetime', '-id')
+        objects, has_next = await self.orm.get_page(
+            LoginHistory,
+            ordering,
+            limit,
+            after=decode_cursor(LoginHistory, cursor, ordering),
+            filter_={'user_id': user_id},
+        )
+        return {
+            'count': len(objects),
+            'source': list(map(compile_serializer(LoginHistorySchema), objects)),
+            'next_cursor': encode_cursor(objects[-1], ordering) if has_next else None,
+        }
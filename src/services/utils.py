@@ -1,21 +1,18 @@
 import json
 from http import HTTPStatus
-from typing import Union
+from typing import Iterable, Optional, Union
 
 from flask import abort
+from flask import stream_with_context
 from flask.wrappers import ResponseBase
 
-from tracing import trace
 
-
-@trace
-def abort_error(message: str, status: int = HTTPStatus.BAD_REQUEST):
+def abort_error(message: str, status: int = HTTPStatus.BAD_REQUEST, headers: Optional[dict] = None):
     raise abort(
-        JsonResponse({'detail': message}, status=status),
+        JsonResponse({'detail': message}, status=status, headers=headers),
     )
 
 
-@trace
 def get_token_from_header(request):
     return request.headers.get('Authorization').removeprefix('Bearer ')
 
@@ -24,7 +21,14 @@ class JsonResponse(ResponseBase):
     default_mimetype = 'application/json'
     json_module = json
 
-    @trace
     def __init__(self, response: Union[dict, list], status: int = None, *args, **kwargs):
         response = self.json_module.dumps(response)
         super().__init__(response, status, *args, **kwargs)
+
+
+class StreamingJsonResponse(ResponseBase):
+    """Ответ, тело которого отдается частями (chunked) по мере кодирования."""
+    default_mimetype = 'application/json'
+
+    def __init__(self, chunks: Iterable[str], status: int = None, *args, **kwargs):
+        super().__init__(stream_with_context(chunks), status, *args, **kwargs)
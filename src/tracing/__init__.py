@@ -1,12 +1,64 @@
-from opentelemetry import trace
+import inspect
+from enum import IntEnum
+from functools import wraps
 
+from opentelemetry import trace as otel_trace
 
-trace_manager = trace.get_tracer(__name__)
+from core import config
 
 
-def trace(function):
-    def inner(*args, **kwargs):
-        with trace_manager.start_as_current_span(function.__name__):
-            return function(*args, **kwargs)
+trace_manager = otel_trace.get_tracer(__name__)
 
-    return inner
+
+class TraceLevel(IntEnum):
+    """Подробность трассировки: каждый уровень включает спаны предыдущих."""
+    OFF = 0
+    ROUTE = 1
+    SERVICE = 2
+    LOW_LEVEL = 3
+
+
+def _configured_level() -> TraceLevel:
+    return TraceLevel[config.TRACING_LEVEL.upper()]
+
+
+def trace(function=None, *, level: TraceLevel = TraceLevel.SERVICE, name: str = None):
+    """Оборачивает функцию в спан.
+
+    Если уровень выключен настройкой TRACING_LEVEL, функция возвращается
+    без обертки. Спан создается только внутри записываемого родительского
+    спана, поэтому для несэмплированных запросов обертка стоит одну проверку.
+    """
+    def decorator(func):
+        if level > _configured_level():
+            return func
+
+        span_name = name or func.__qualname__
+        attributes = {
+            'code.function': func.__name__,
+            'code.namespace': func.__module__,
+            'trace.level': level.name.lower(),
+        }
+
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_inner(*args, **kwargs):
+                if not otel_trace.get_current_span().is_recording():
+                    return await func(*args, **kwargs)
+                with trace_manager.start_as_current_span(span_name, attributes=attributes):
+                    return await func(*args, **kwargs)
+
+            return async_inner
+
+        @wraps(func)
+        def inner(*args, **kwargs):
+            if not otel_trace.get_current_span().is_recording():
+                return func(*args, **kwargs)
+            with trace_manager.start_as_current_span(span_name, attributes=attributes):
+                return func(*args, **kwargs)
+
+        return inner
+
+    if function is not None:
+        return decorator(function)
+    return decorator
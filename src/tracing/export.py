@@ -0,0 +1,127 @@
+"""Настройка провайдера трассировки и экспорта спанов.
+
+SDK и экспортеры импортируются только здесь и только если трассировка
+включена, поэтому при TRACING_LEVEL=off они не загружаются вовсе.
+"""
+from typing import Optional
+
+from core import config
+
+_processors = []
+
+
+def _jaeger_exporter():
+    from opentelemetry.exporter.jaeger.thrift import JaegerExporter
+
+    if config.TRACING_JAEGER_COLLECTOR_ENDPOINT:
+        return JaegerExporter(collector_endpoint=config.TRACING_JAEGER_COLLECTOR_ENDPOINT)
+    return JaegerExporter(
+        agent_host_name=config.TRACING_JAEGER_AGENT_HOST,
+        agent_port=config.TRACING_JAEGER_AGENT_PORT,
+    )
+
+
+def _console_exporter():
+    from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+
+    return ConsoleSpanExporter()
+
+
+EXPORTERS = {
+    'jaeger': _jaeger_exporter,
+    'console': _console_exporter,
+}
+
+
+def _batch_processor_class():
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+    class CountingBatchSpanProcessor(BatchSpanProcessor):
+        """BatchSpanProcessor со счетчиками и выбором, какой спан терять при полной очереди.
+
+        Стандартный процессор при переполнении молча вытесняет самый старый спан,
+        с drop_policy='newest' вместо этого отбрасывается только что завершенный.
+        """
+
+        def __init__(self, span_exporter, name: str, drop_policy: str = 'oldest', **kwargs):
+            super().__init__(span_exporter, **kwargs)
+            self.name = name
+            self.drop_policy = drop_policy
+            self.counters = {'queued': 0, 'dropped': 0}
+
+        def on_end(self, span) -> None:
+            if self.done or not span.context.trace_flags.sampled:
+                return
+            if len(self.queue) >= self.max_queue_size:
+                self.counters['dropped'] += 1
+                if self.drop_policy == 'newest':
+                    return
+            self.counters['queued'] += 1
+            super().on_end(span)
+
+        def stats(self) -> dict:
+            return {
+                **self.counters,
+                'queue_depth': len(self.queue),
+                'max_queue_size': self.max_queue_size,
+            }
+
+    return CountingBatchSpanProcessor
+
+
+def configure_tracer(level: Optional[str] = None) -> None:
+    """Настраивает провайдер трассировки и экспорт по настройкам TRACING_*.
+        Решение о сэмплировании принимается для корневого спана запроса и наследуется дочерними.
+    """
+    level = (level or config.TRACING_LEVEL).lower()
+    exporters = [name.strip() for name in config.TRACING_EXPORTERS.split(',') if name.strip()]
+    if level == 'off' or not exporters:
+        return
+
+    from opentelemetry import trace
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.sampling import ParentBased
+    from opentelemetry.sdk.trace.sampling import TraceIdRatioBased
+
+    unknown = set(exporters) - set(EXPORTERS)
+    if unknown:
+        raise ValueError(f'Неизвестные экспортеры спанов: {", ".join(sorted(unknown))}')
+    if config.TRACING_DROP_POLICY not in ('oldest', 'newest'):
+        raise ValueError('TRACING_DROP_POLICY должен быть oldest или newest')
+
+    provider = TracerProvider(sampler=ParentBased(TraceIdRatioBased(config.TRACING_SAMPLE_RATIO)))
+    processor_class = _batch_processor_class()
+    for name in exporters:
+        processor = processor_class(
+            EXPORTERS[name](),
+            name=name,
+            drop_policy=config.TRACING_DROP_POLICY,
+            max_queue_size=config.TRACING_MAX_QUEUE_SIZE,
+            max_export_batch_size=config.TRACING_MAX_EXPORT_BATCH_SIZE,
+            schedule_delay_millis=config.TRACING_SCHEDULE_DELAY_MS,
+            export_timeout_millis=config.TRACING_EXPORT_TIMEOUT_MS,
+        )
+        provider.add_span_processor(processor)
+        _processors.append(processor)
+    trace.set_tracer_provider(provider)
+
+
+def get_export_stats() -> dict:
+    """Счетчики процессоров экспорта по имени экспортера, пусто если трассировка выключена."""
+    return {processor.name: processor.stats() for processor in _processors}
+
+
+def reinit_after_fork() -> None:
+    """Вызывается в воркере сразу после fork. Поток процессора перезапускает
+        сам sdk, здесь воркер получает собственные экспортеры и счетчики.
+    """
+    for processor in _processors:
+        processor.span_exporter = EXPORTERS[processor.name]()
+        processor.counters = dict.fromkeys(processor.counters, 0)
+
+
+def shutdown_tracer() -> None:
+    """Отправляет накопленные в очередях спаны и останавливает процессоры."""
+    for processor in _processors:
+        processor.shutdown()
+    _processors.clear()
@@ -0,0 +1,99 @@
+"""Общие фикстуры тестов.
+
+Код приложения импортируется из каталога src, настройки по умолчанию берутся
+из src/.env.example (переменные окружения имеют приоритет). Тесты, которым
+нужны postgres или redis, пропускаются, если сервер недоступен.
+"""
+import os
+import sys
+import uuid
+
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path.insert(0, SRC_DIR)
+
+
+def _load_env_defaults() -> None:
+    with open(os.path.join(SRC_DIR, '.env.example'), encoding='utf-8') as env_file:
+        for line in env_file:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                key, _, value = line.partition('=')
+                os.environ.setdefault(key, value)
+
+
+# Без экспорта спанов, пула процессов хеширования и с дешевым pbkdf2
+os.environ.setdefault('TRACING_LEVEL', 'off')
+os.environ.setdefault('HASHING_WORKERS', '0')
+os.environ.setdefault('PASSWORD_HASH_ROUNDS', '1000')
+_load_env_defaults()
+
+
+@pytest.fixture(scope='session')
+def redis_client():
+    from redis.exceptions import RedisError
+    from db.redis_db import redis_db
+
+    try:
+        redis_db.ping()
+    except RedisError:
+        pytest.skip('redis недоступен')
+    return redis_db
+
+
+@pytest.fixture(scope='session')
+def postgres():
+    from sqlalchemy.exc import OperationalError
+    from db.postgres import engine
+    from db.postgres import init_db
+
+    try:
+        engine.connect().close()
+    except OperationalError:
+        pytest.skip('postgres недоступен')
+    init_db()
+    return engine
+
+
+@pytest.fixture(scope='session')
+def app(redis_client, postgres):
+    from main import app
+
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    client.environ_base['HTTP_X_REQUEST_ID'] = str(uuid.uuid4())
+    return client
+
+
+@pytest.fixture
+def make_user(app):
+    """Создает пользователя с уникальным логином, возвращает (id, login, password)."""
+    from services.users import UserService
+    from schemas.users import CreateUserSchema
+
+    def make_user(password: str = 'Passw0rd!'):
+        login = f'u{uuid.uuid4().hex[:15]}'
+        with app.app_context():
+            user = UserService().create(CreateUserSchema(login=login, password=password))
+        return user['id'], login, password
+
+    return make_user
+
+
+@pytest.fixture(autouse=True)
+def isolated_login_throttle(monkeypatch):
+    """Все запросы тестового клиента идут с одного адреса: счетчики
+        ограничителя входа у каждого теста свои, иначе повторные прогоны упираются в лимит.
+    """
+    from base.throttling import async_login_throttle
+    from base.throttling import login_throttle
+
+    prefix = f'login_throttle_test:{uuid.uuid4().hex}'
+    monkeypatch.setattr(login_throttle, 'key_prefix', prefix)
+    monkeypatch.setattr(async_login_throttle, 'key_prefix', prefix)
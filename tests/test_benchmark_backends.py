@@ -0,0 +1,34 @@
+import uuid
+
+from base.abstract import AbstractORM
+from benchmarks.backends import InMemoryORM
+from models.roles import Role
+from models.users import User
+from models.users import roles_users
+from schemas.roles import BulkRolesSchema
+from schemas.users import CreateUserSchema
+from services.users import UserService
+
+
+def test_in_memory_orm_implements_abstract_orm():
+    # Новый абстрактный метод AbstractORM без реализации здесь сломает создание объекта
+    assert isinstance(InMemoryORM(), AbstractORM)
+
+
+def test_user_service_on_in_memory_orm(redis_client):
+    orm = InMemoryORM()
+    service = UserService()
+    service.orm = orm
+    user = service.create(CreateUserSchema(login='bench_user', password='Passw0rd!'))
+    role = Role(name='admin')
+    orm.add_obj(role)
+    missing = uuid.uuid4()
+
+    result = service.bulk_assign_roles(BulkRolesSchema(pairs=[
+        {'user_id': user['id'], 'role_id': role.id},
+        {'user_id': missing, 'role_id': role.id},
+    ]))
+
+    assert [item['status'] for item in result['results']] == ['assigned', 'user_not_found']
+    assert orm.get_all(roles_users) == [{'user_id': user['id'], 'role_id': role.id}]
+    assert orm.get_by_id(User, user['id']).login == 'bench_user'
@@ -0,0 +1,146 @@
+import uuid
+from http import HTTPStatus
+
+import pytest
+from sqlalchemy import insert
+from sqlalchemy import select
+
+from base.role_claims import role_claims_cache
+from models.roles import Role
+from models.users import roles_users
+
+BULK_URL = '/api/v1/users/roles/bulk'
+
+
+@pytest.fixture
+def make_role(postgres):
+    def make_role() -> uuid.UUID:
+        role_id = uuid.uuid4()
+        with postgres.begin() as connection:
+            connection.execute(insert(Role.__table__), {'id': role_id, 'name': f'role_{role_id.hex[:12]}'})
+        return role_id
+
+    return make_role
+
+
+@pytest.fixture
+def auth_headers(client, make_user):
+    _, login, password = make_user()
+    response = client.post('/api/v1/login', data={'username': login, 'password': password})
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+
+def user_roles(postgres, user_id) -> set:
+    with postgres.connect() as connection:
+        return set(connection.execute(select(roles_users.c.role_id).where(roles_users.c.user_id == user_id)).scalars())
+
+
+def statuses(response) -> list:
+    return [(item['user_id'], item['role_id'], item['status']) for item in response.get_json()['results']]
+
+
+def pair(user_id, role_id) -> dict:
+    return {'user_id': str(user_id), 'role_id': str(role_id)}
+
+
+def test_assign_pairs(client, auth_headers, postgres, make_user, make_role):
+    user_id, role_id, missing = make_user()[0], make_role(), uuid.uuid4()
+    client.post(BULK_URL, json={'pairs': [pair(user_id, role_id)]}, headers=auth_headers)
+
+    response = client.post(BULK_URL, headers=auth_headers, json={'pairs': [
+        pair(user_id, role_id),
+        pair(user_id, role_id),
+        pair(missing, role_id),
+        pair(user_id, missing),
+    ]})
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.get_json()['count'] == 0
+    # Повторы схлопываются, порядок пар сохраняется
+    assert statuses(response) == [
+        (str(user_id), str(role_id), 'already_assigned'),
+        (str(missing), str(role_id), 'user_not_found'),
+        (str(user_id), str(missing), 'role_not_found'),
+    ]
+    assert user_roles(postgres, user_id) == {role_id}
+
+
+def test_assign_and_revoke_pairs(client, auth_headers, postgres, make_user, make_role):
+    user_id, first, second = make_user()[0], make_role(), make_role()
+
+    response = client.post(BULK_URL, json={'pairs': [pair(user_id, first), pair(user_id, second)]}, headers=auth_headers)
+    assert response.get_json()['count'] == 2
+    assert {status for *_, status in statuses(response)} == {'assigned'}
+    assert user_roles(postgres, user_id) == {first, second}
+
+    response = client.delete(BULK_URL, json={'pairs': [pair(user_id, first)]}, headers=auth_headers)
+    assert statuses(response) == [(str(user_id), str(first), 'revoked')]
+
+    response = client.delete(BULK_URL, headers=auth_headers, json={'pairs': [
+        pair(user_id, first),
+        pair(uuid.uuid4(), first),
+        pair(user_id, uuid.uuid4()),
+    ]})
+    assert response.get_json()['count'] == 0
+    assert [status for *_, status in statuses(response)] == ['not_assigned', 'user_not_found', 'role_not_found']
+    assert user_roles(postgres, user_id) == {second}
+
+
+def test_filter_mode(client, auth_headers, postgres, make_user, make_role):
+    role_id, marker = make_role(), make_role()
+    matched = [make_user()[0] for _ in range(2)]
+    other = make_user()[0]
+    client.post(BULK_URL, json={'pairs': [pair(user_id, marker) for user_id in matched]}, headers=auth_headers)
+    users = {'has_role_id': str(marker)}
+
+    response = client.post(BULK_URL, json={'role_id': str(role_id), 'users': users}, headers=auth_headers)
+    assert response.get_json() == {'count': 2}
+    assert all(role_id in user_roles(postgres, user_id) for user_id in matched)
+    assert role_id not in user_roles(postgres, other)
+    # Уже назначенные роли не считаются
+    response = client.post(BULK_URL, json={'role_id': str(role_id), 'users': users}, headers=auth_headers)
+    assert response.get_json() == {'count': 0}
+
+    response = client.delete(BULK_URL, json={'role_id': str(role_id), 'users': users}, headers=auth_headers)
+    assert response.get_json() == {'count': 2}
+    assert all(user_roles(postgres, user_id) == {marker} for user_id in matched)
+
+
+def test_filter_mode_unknown_role(client, auth_headers):
+    response = client.post(
+        BULK_URL, json={'role_id': str(uuid.uuid4()), 'users': {'all_users': True}}, headers=auth_headers,
+    )
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+@pytest.mark.parametrize('method', ['post', 'delete'])
+@pytest.mark.parametrize('body', [
+    {'pairs': []},
+    {},
+    {'role_id': str(uuid.uuid4())},
+    {'role_id': str(uuid.uuid4()), 'users': {}},
+    {'pairs': [{'user_id': 'not-uuid', 'role_id': str(uuid.uuid4())}]},
+    {'pairs': [pair(uuid.uuid4(), uuid.uuid4())], 'role_id': str(uuid.uuid4()), 'users': {'all_users': True}},
+])
+def test_invalid_payload(client, auth_headers, method, body):
+    response = getattr(client, method)(BULK_URL, json=body, headers=auth_headers)
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_changes_invalidate_role_cache_of_affected_users(client, auth_headers, redis_client, make_user, make_role):
+    changed, unchanged, role_id = make_user()[0], make_user()[0], make_role()
+    role_claims_cache.get_roles(changed)
+    role_claims_cache.get_roles(unchanged)
+
+    client.post(BULK_URL, json={'pairs': [pair(changed, role_id), pair(unchanged, uuid.uuid4())]}, headers=auth_headers)
+
+    assert redis_client.get(f'user_roles:{changed}') is None
+    assert redis_client.get(f'user_roles:{unchanged}') is not None
+    assert role_claims_cache.get_roles(changed) == [f'role_{role_id.hex[:12]}']
+
+    role_claims_cache.get_roles(changed)
+    client.delete(BULK_URL, json={'role_id': str(role_id), 'users': {'all_users': True}}, headers=auth_headers)
+    assert redis_client.get(f'user_roles:{changed}') is None
+    assert role_claims_cache.get_roles(changed) == []
@@ -0,0 +1,34 @@
+from http import HTTPStatus
+
+import pytest
+from prometheus_client import REGISTRY
+
+
+def login_attempts(result: str) -> float:
+    return REGISTRY.get_sample_value('auth_login_attempts_total', {'result': result}) or 0.0
+
+
+def test_login_success(client, make_user):
+    _, login, password = make_user()
+    before = login_attempts('success')
+
+    response = client.post('/api/v1/login', data={'username': login, 'password': password})
+
+    assert response.status_code == HTTPStatus.OK
+    assert {'access_token', 'refresh_token'} <= response.get_json().keys()
+    assert login_attempts('success') == before + 1
+
+
+@pytest.mark.parametrize('wrong', ['login', 'password'])
+def test_failed_login_is_bad_request(client, make_user, wrong):
+    _, login, password = make_user()
+    data = {'username': login, 'password': password}
+    data['username' if wrong == 'login' else 'password'] += '_wrong'
+    failures, errors = login_attempts('failure'), login_attempts('error')
+
+    response = client.post('/api/v1/login', data=data)
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert 'detail' in response.get_json()
+    assert login_attempts('failure') == failures + 1
+    assert login_attempts('error') == errors
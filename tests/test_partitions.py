@@ -0,0 +1,134 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from db.partitions import drop_expired_partitions
+from db.partitions import ensure_monthly_partitions
+
+TABLE = 'partitions_test_events'
+
+
+@pytest.fixture
+def connection(postgres):
+    """Соединение с открытой транзакцией и партиционированной таблицей, все откатывается в конце."""
+    with postgres.connect() as connection:
+        transaction = connection.begin()
+        connection.execute(text(
+            f'CREATE TABLE {TABLE} (id int NOT NULL, created_at timestamp NOT NULL, '
+            'PRIMARY KEY (id, created_at)) PARTITION BY RANGE (created_at)'
+        ))
+        yield connection
+        transaction.rollback()
+
+
+def insert_rows(connection, *created_at: str) -> None:
+    for index, value in enumerate(created_at):
+        connection.execute(
+            text(f'INSERT INTO {TABLE} (id, created_at) VALUES (:id, :created_at)'),
+            {'id': index, 'created_at': value},
+        )
+
+
+def rows_by_partition(connection) -> dict:
+    rows = connection.execute(text(
+        f'SELECT tableoid::regclass::text, count(*) FROM {TABLE} GROUP BY 1'
+    ))
+    return dict(rows.all())
+
+
+def test_lapsed_maintenance_moves_rows_out_of_default(connection):
+    ensure_monthly_partitions(connection, TABLE, months_ahead=1, today=date(2024, 1, 15))
+    # Обслуживание не запускалось: записи марта и апреля попали в партицию по умолчанию
+    insert_rows(connection, '2024-03-05', '2024-03-31 23:59:59', '2024-04-01')
+    assert rows_by_partition(connection) == {f'{TABLE}_default': 3}
+
+    created = ensure_monthly_partitions(connection, TABLE, months_ahead=1, today=date(2024, 3, 1))
+
+    assert created == [f'{TABLE}_y2024m03', f'{TABLE}_y2024m04']
+    assert rows_by_partition(connection) == {f'{TABLE}_y2024m03': 2, f'{TABLE}_y2024m04': 1}
+    # Перенесенная партиция получила индекс первичного ключа родителя
+    insert_rows(connection, '2024-03-06')
+    with pytest.raises(IntegrityError):
+        insert_rows(connection, '2024-03-06')
+
+
+def test_ensure_is_idempotent(connection):
+    first = ensure_monthly_partitions(connection, TABLE, months_ahead=2, today=date(2024, 1, 1))
+    second = ensure_monthly_partitions(connection, TABLE, months_ahead=2, today=date(2024, 1, 1))
+
+    assert first == second == [f'{TABLE}_y2024m01', f'{TABLE}_y2024m02', f'{TABLE}_y2024m03']
+
+
+def test_drop_expired_trims_default_partition(connection):
+    ensure_monthly_partitions(connection, TABLE, months_ahead=0, today=date(2024, 1, 1))
+    insert_rows(connection, '2023-06-01', '2023-12-31', '2024-01-10')
+
+    dropped = drop_expired_partitions(connection, TABLE, retention_months=1, today=date(2024, 1, 20))
+
+    assert dropped == []
+    assert rows_by_partition(connection) == {f'{TABLE}_default': 1, f'{TABLE}_y2024m01': 1}
+
+
+def partitions(connection) -> list:
+    return connection.execute(text(
+        'SELECT child.relname FROM pg_inherits '
+        'JOIN pg_class parent ON pg_inherits.inhparent = parent.oid '
+        'JOIN pg_class child ON pg_inherits.inhrelid = child.oid '
+        'WHERE parent.relname = :table_name ORDER BY 1'
+    ), {'table_name': TABLE}).scalars().all()
+
+
+def test_drop_expired_partitions(connection):
+    ensure_monthly_partitions(connection, TABLE, months_ahead=3, today=date(2023, 1, 1))
+    ensure_monthly_partitions(connection, TABLE, months_ahead=1, today=date(2023, 5, 1))
+    insert_rows(connection, '2023-01-15', '2023-02-15', '2023-03-15', '2023-05-15')
+
+    dropped = drop_expired_partitions(connection, TABLE, retention_months=2, today=date(2023, 5, 10))
+
+    assert dropped == [f'{TABLE}_y2023m01', f'{TABLE}_y2023m02']
+    assert partitions(connection) == [
+        f'{TABLE}_default', f'{TABLE}_y2023m03', f'{TABLE}_y2023m04', f'{TABLE}_y2023m05', f'{TABLE}_y2023m06',
+    ]
+    # Удаленные партиции не остались отдельными таблицами после DETACH
+    assert connection.execute(text(f"SELECT to_regclass('{TABLE}_y2023m01')")).scalar() is None
+    assert rows_by_partition(connection) == {f'{TABLE}_y2023m03': 1, f'{TABLE}_y2023m05': 1}
+
+
+@pytest.fixture
+def expired_login_history_partition(postgres):
+    name = 'login_history_y2000m01'
+    with postgres.begin() as connection:
+        connection.execute(text(
+            f"CREATE TABLE {name} PARTITION OF login_history FOR VALUES FROM ('2000-01-01') TO ('2000-02-01')"
+        ))
+    yield name
+    with postgres.begin() as connection:
+        connection.execute(text(f'DROP TABLE IF EXISTS {name}'))
+
+
+def login_history_partition_exists(postgres, name: str) -> bool:
+    with postgres.connect() as connection:
+        return connection.execute(text(f"SELECT to_regclass('{name}')")).scalar() is not None
+
+
+def test_startup_keeps_expired_partitions(postgres, expired_login_history_partition):
+    from db.postgres import init_db
+
+    init_db()
+
+    assert login_history_partition_exists(postgres, expired_login_history_partition)
+
+
+def test_maintain_command_drops_expired_partitions(app, postgres, expired_login_history_partition):
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=['maintain-partitions', '--keep-expired'])
+    assert result.exit_code == 0
+    assert login_history_partition_exists(postgres, expired_login_history_partition)
+
+    result = runner.invoke(args=['maintain-partitions'])
+    assert result.exit_code == 0, result.output
+    assert expired_login_history_partition in result.output
+    assert not login_history_partition_exists(postgres, expired_login_history_partition)
@@ -0,0 +1,90 @@
+"""Число SQL запросов на эндпоинт не должно зависеть от числа строк и связей (N+1)."""
+import math
+import uuid
+
+import pytest
+from sqlalchemy import insert
+
+from db.postgres import replica_set
+from db.query_counter import assert_num_queries
+from models.roles import Role
+from models.users import roles_users
+
+USERS = 5
+ROLES_PER_USER = 3
+
+
+@pytest.fixture(autouse=True)
+def measured_replica_lag(monkeypatch):
+    """Замер отставания реплик не относится к эндпоинту: делаем его заранее и не повторяем при подсчете."""
+    for replica in replica_set.replicas:
+        replica.current_lag()
+        monkeypatch.setattr(replica, 'check_interval', math.inf)
+
+
+@pytest.fixture
+def user_with_roles(postgres, make_user):
+    """USERS пользователей, у каждого ROLES_PER_USER ролей. Возвращает последнего."""
+    role_ids = [uuid.uuid4() for _ in range(ROLES_PER_USER)]
+    with postgres.begin() as connection:
+        connection.execute(insert(Role.__table__), [
+            {'id': role_id, 'name': f'role_{role_id.hex[:12]}'} for role_id in role_ids
+        ])
+    for _ in range(USERS):
+        user = make_user()
+        with postgres.begin() as connection:
+            connection.execute(insert(roles_users), [
+                {'user_id': user[0], 'role_id': role_id} for role_id in role_ids
+            ])
+    return user
+
+
+@pytest.fixture
+def auth_headers(client, user_with_roles):
+    _, login, password = user_with_roles
+    response = client.post('/api/v1/login', data={'username': login, 'password': password})
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+
+def test_login(client, user_with_roles, redis_client):
+    user_id, login, password = user_with_roles
+
+    # Пользователь вместе с ролями (кеш ролей пуст) и запись в историю входов
+    with assert_num_queries(2):
+        assert client.post('/api/v1/login', data={'username': login, 'password': password}).status_code == 200
+    assert redis_client.get(f'user_roles:{user_id}') is not None
+    # Роли уже в кеше, запросов столько же
+    with assert_num_queries(2):
+        assert client.post('/api/v1/login', data={'username': login, 'password': password}).status_code == 200
+
+
+@pytest.mark.parametrize('query', [
+    'limit=5',
+    'limit=50',
+    'limit=50&stream=true',
+    'limit=50&fields=login&include=roles',
+])
+def test_user_listing_loads_roles_in_one_query(client, auth_headers, query):
+    with assert_num_queries(2):
+        response = client.get(f'/api/v1/users?{query}', headers=auth_headers)
+        response.get_data()
+
+    assert response.status_code == 200
+
+
+def test_user_listing_without_relations(client, auth_headers):
+    with assert_num_queries(1):
+        assert client.get('/api/v1/users?fields=login&limit=50', headers=auth_headers).status_code == 200
+
+
+def test_role_listing(client, auth_headers):
+    with assert_num_queries(1):
+        assert client.get('/api/v1/roles?limit=50', headers=auth_headers).status_code == 200
+
+
+def test_login_history_listing(client, auth_headers, user_with_roles):
+    with assert_num_queries(1):
+        response = client.get(f'/api/v1/users/{user_with_roles[0]}/login-history', headers=auth_headers)
+
+    assert response.status_code == 200
+    assert response.get_json()['count'] == 1
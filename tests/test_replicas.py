@@ -0,0 +1,116 @@
+import math
+import os
+import uuid
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import scoped_session
+from sqlalchemy.orm import sessionmaker
+from werkzeug.exceptions import HTTPException
+
+from base.hashing import password_hasher
+from base.low_level import SqlalchemyORM
+from db.postgres import create_db_engine
+from db.replicas import Replica
+from db.replicas import ReplicaSet
+from db.replicas import RoutingSession
+from models.users import User
+from services.mixins import ValidateUserMixin
+
+STALE_SCHEMA = 'replica_test_stale'
+
+
+class Validator(ValidateUserMixin):
+
+    def __init__(self, orm):
+        self.orm = orm
+
+
+@pytest.fixture
+def stale_replica(postgres):
+    """Реплика с устаревшими данными: та же БД, но таблица users из отдельной схемы.
+        Сервер не в режиме восстановления, поэтому отставание 0 и реплика выбирается для чтения.
+    """
+    with postgres.begin() as connection:
+        connection.execute(text(f'DROP SCHEMA IF EXISTS {STALE_SCHEMA} CASCADE'))
+        connection.execute(text(f'CREATE SCHEMA {STALE_SCHEMA}'))
+        connection.execute(text(f'CREATE TABLE {STALE_SCHEMA}.users (LIKE public.users INCLUDING ALL)'))
+    engine = create_db_engine(postgres.url.render_as_string(hide_password=False))
+    engine = engine.execution_options(schema_translate_map={None: STALE_SCHEMA})
+    yield Replica(engine, 'stale', check_interval=0)
+    engine.dispose()
+    with postgres.begin() as connection:
+        connection.execute(text(f'DROP SCHEMA {STALE_SCHEMA} CASCADE'))
+
+
+@pytest.fixture
+def orm(postgres, stale_replica):
+    session = scoped_session(sessionmaker(
+        class_=RoutingSession,
+        autoflush=False,
+        bind=postgres,
+        expire_on_commit=False,
+        replicas=ReplicaSet([stale_replica], max_lag=1),
+    ))
+    yield SqlalchemyORM(session)
+    session.remove()
+
+
+def insert_user(connection, schema: str, user_id, login: str, password: str) -> None:
+    connection.execute(
+        text(f'INSERT INTO {schema}.users (id, login, password) VALUES (:id, :login, :password)'),
+        {'id': user_id, 'login': login, 'password': password_hasher.hash(password)},
+    )
+
+
+@pytest.fixture
+def changed_password(postgres):
+    """Пользователь сменил пароль: на мастере новый хеш, на реплике еще старый."""
+    user_id, login = uuid.uuid4(), f'r{uuid.uuid4().hex[:15]}'
+    with postgres.begin() as connection:
+        insert_user(connection, 'public', user_id, login, 'NewPassw0rd')
+        insert_user(connection, STALE_SCHEMA, user_id, login, 'OldPassw0rd')
+    yield user_id, login
+    with postgres.begin() as connection:
+        connection.execute(text('DELETE FROM public.users WHERE id = :id'), {'id': user_id})
+
+
+def test_reads_go_to_replica(orm, changed_password):
+    user_id, _ = changed_password
+    user = orm.get_by_id(User, user_id)
+
+    assert password_hasher.verify_and_update('OldPassw0rd', user.password)[0]
+
+
+def test_validated_user_is_read_from_primary(orm, changed_password):
+    _, login = changed_password
+    validator = Validator(orm)
+
+    user = validator._get_validated_user({'login': login}, 'NewPassw0rd', upgrade_hash=False)
+
+    assert user.login == login
+    with pytest.raises(HTTPException):
+        validator._get_validated_user({'login': login}, 'OldPassw0rd', upgrade_hash=False)
+
+
+def test_missing_row_on_replica_is_read_from_primary(orm, postgres):
+    user_id = uuid.uuid4()
+    with postgres.begin() as connection:
+        insert_user(connection, 'public', user_id, f'r{uuid.uuid4().hex[:15]}', 'Passw0rd')
+    try:
+        assert orm.get_by_id(User, user_id).id == user_id
+    finally:
+        with postgres.begin() as connection:
+            connection.execute(text('DELETE FROM public.users WHERE id = :id'), {'id': user_id})
+
+
+def test_primary_has_no_lag(postgres):
+    assert Replica(postgres, 'primary', check_interval=0).current_lag() == 0
+
+
+@pytest.mark.skipif(not os.getenv('POSTGRES_REPLICA_URIS'), reason='реплики не настроены')
+def test_streaming_replica_lag_is_finite(postgres):
+    from db.postgres import replica_set
+
+    for replica in replica_set.replicas:
+        assert math.isfinite(replica.current_lag())
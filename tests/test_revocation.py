@@ -0,0 +1,205 @@
+import time
+import uuid
+from http import HTTPStatus
+
+import pytest
+
+from base.jwt_cache import VerifiedTokenCache
+from base.low_level import CacheRedis
+from base.revocation import RevokedTokensFilter
+from base.revocation import check_if_token_was_in_logout_request
+
+
+def wait_until(predicate, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'фильтр не синхронизировался'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def stream(redis_client):
+    stream = f'revoked_tokens_test:{uuid.uuid4().hex}'
+    yield stream
+    redis_client.delete(stream)
+
+
+@pytest.fixture
+def make_filter(redis_client, stream):
+    """Фильтр отдельного воркера на общем для теста потоке, уже синхронизированный."""
+    def make_filter() -> RevokedTokensFilter:
+        revoked = RevokedTokensFilter(redis=redis_client, stream=stream, enabled=True)
+        revoked.might_be_revoked('warm-up')
+        wait_until(lambda: revoked.stats()['synced'])
+        return revoked
+
+    return make_filter
+
+
+def payload(jti: str, sub: str = 'user', issued_at_ms: int = None) -> dict:
+    issued_at_ms = int(time.time() * 1000) if issued_at_ms is None else issued_at_ms
+    return {'jti': jti, 'sub': sub, 'iat': issued_at_ms // 1000, 'iat_ms': issued_at_ms}
+
+
+def test_unsynced_filter_sends_checks_to_redis(redis_client, stream):
+    revoked = RevokedTokensFilter(redis=redis_client, stream=stream, enabled=True)
+    revoked._ensure_started = lambda: None
+
+    assert revoked.might_be_revoked('jti-1')
+    assert revoked.stats()['bypassed'] == 1
+
+
+def test_disabled_filter_always_sends_checks_to_redis(redis_client, stream):
+    revoked = RevokedTokensFilter(redis=redis_client, stream=stream, enabled=False)
+
+    assert revoked.might_be_revoked('jti-1')
+    revoked.revoke('jti-1')
+    assert redis_client.exists(stream) == 0
+
+
+def test_revoked_jti_reaches_other_workers(make_filter):
+    first, second = make_filter(), make_filter()
+
+    assert not second.might_be_revoked('jti-1')
+    first.revoke('jti-1')
+
+    assert first.might_be_revoked('jti-1')
+    wait_until(lambda: 'jti-1' in second.bloom)
+    assert second.might_be_revoked('jti-1')
+
+
+def test_new_worker_loads_earlier_revocations(make_filter):
+    make_filter().revoke('jti-1')
+
+    assert make_filter().might_be_revoked('jti-1')
+
+
+def test_malformed_entry_sends_checks_to_redis_until_it_is_gone(redis_client, stream, make_filter):
+    revoked = make_filter()
+    # Отметка not-before без nbf: синхронизация падает не на ошибке redis
+    entry_id = redis_client.xadd(stream, {'sub': 'user'})
+
+    wait_until(lambda: not revoked.stats()['synced'])
+    assert revoked.might_be_revoked('jti-1')
+    assert revoked.check_user_locally('user', 0) is None
+
+    redis_client.xdel(stream, entry_id)
+    wait_until(lambda: revoked.stats()['synced'])
+    assert not revoked.might_be_revoked('jti-1')
+
+
+def test_loader_skips_redis_for_tokens_never_revoked(make_filter):
+    revoked = make_filter()
+    cache_db = CacheRedis()
+    cache_db.get_by_key = lambda key: pytest.fail('фильтр должен был ответить без redis')
+
+    assert not check_if_token_was_in_logout_request({}, payload('jti-1'), revoked, cache_db, VerifiedTokenCache())
+
+
+def test_loader_confirms_revocation_in_redis(redis_client, make_filter):
+    revoked = make_filter()
+    jti = f'jti-{uuid.uuid4().hex}'
+    redis_client.setex(jti, 60, '')
+    revoked.revoke(jti)
+
+    assert check_if_token_was_in_logout_request({}, payload(jti), revoked, CacheRedis(), VerifiedTokenCache())
+    redis_client.delete(jti)
+
+
+def test_loader_counts_false_positives(make_filter):
+    revoked = make_filter()
+    # В фильтре есть, а в redis нет - так выглядит ложное срабатывание
+    revoked.revoke('jti-1')
+
+    assert not check_if_token_was_in_logout_request({}, payload('jti-1'), revoked, CacheRedis(), VerifiedTokenCache())
+    assert revoked.stats()['false_positives'] == 1
+
+
+def login(client, login: str, password: str) -> dict:
+    tokens = client.post('/api/v1/login', data={'username': login, 'password': password}).get_json()
+    return {'Authorization': f"Bearer {tokens['access_token']}"}
+
+
+def test_logout_revokes_access_token(client, make_user):
+    _, user_login, password = make_user()
+    headers = login(client, user_login, password)
+
+    assert client.post('/api/v1/logout', headers=headers).status_code == HTTPStatus.OK
+    assert client.post('/api/v1/logout', headers=headers).status_code == HTTPStatus.UNAUTHORIZED
+
+
+def test_revoke_user_rejects_earlier_tokens(redis_client, make_filter):
+    first, second = make_filter(), make_filter()
+    sub = str(uuid.uuid4())
+
+    stamp = first.revoke_user(sub)
+
+    # Сравнение с точностью до миллисекунды, а не секунды iat
+    assert first.is_user_revoked(sub, stamp - 1)
+    assert not first.is_user_revoked(sub, stamp)
+    wait_until(lambda: second.check_user_locally(sub, stamp - 1))
+    redis_client.delete(first.not_before_key(sub))
+
+
+def test_unsynced_filter_reads_not_before_from_redis(redis_client, stream, make_filter):
+    sub = str(uuid.uuid4())
+    stamp = make_filter().revoke_user(sub)
+    revoked = RevokedTokensFilter(redis=redis_client, stream=stream, enabled=False)
+
+    assert revoked.check_user_locally(sub, stamp - 1) is None
+    assert revoked.is_user_revoked(sub, stamp - 1)
+    assert not revoked.is_user_revoked(sub, stamp)
+    redis_client.delete(revoked.not_before_key(sub))
+
+
+def test_loader_rejects_tokens_issued_before_not_before(redis_client, make_filter):
+    revoked = make_filter()
+    sub = str(uuid.uuid4())
+    stamp = revoked.revoke_user(sub)
+
+    assert check_if_token_was_in_logout_request(
+        {}, payload('jti-1', sub, stamp - 1), revoked, CacheRedis(), VerifiedTokenCache(),
+    )
+    redis_client.delete(revoked.not_before_key(sub))
+
+
+def test_tokens_without_iat_ms_are_revoked_within_the_same_second(redis_client, make_filter):
+    revoked = make_filter()
+    sub = str(uuid.uuid4())
+    stamp = revoked.revoke_user(sub)
+    token = {'jti': 'jti-1', 'sub': sub, 'iat': stamp // 1000}
+
+    assert check_if_token_was_in_logout_request({}, token, revoked, CacheRedis(), VerifiedTokenCache())
+    redis_client.delete(revoked.not_before_key(sub))
+
+
+def test_stream_entries_in_seconds_are_applied(redis_client, stream, make_filter):
+    revoked = make_filter()
+    stamp = int(time.time())
+    redis_client.xadd(stream, {'sub': 'user', 'nbf': stamp})
+
+    wait_until(lambda: revoked.check_user_locally('user', stamp * 1000 - 1))
+    assert not revoked.check_user_locally('user', stamp * 1000)
+
+
+def test_logout_all_revokes_every_access_token(client, make_user):
+    _, user_login, password = make_user()
+    phone, laptop = login(client, user_login, password), login(client, user_login, password)
+
+    assert client.post('/api/v1/logout/all', headers=phone).status_code == HTTPStatus.OK
+    assert client.post('/api/v1/logout', headers=laptop).status_code == HTTPStatus.UNAUTHORIZED
+    assert client.post('/api/v1/logout', headers=login(client, user_login, password)).status_code == HTTPStatus.OK
+
+
+def test_password_change_revokes_access_tokens(client, make_user):
+    user_id, user_login, password = make_user()
+    headers = login(client, user_login, password)
+
+    response = client.post(
+        f'/api/v1/users/{user_id}/new-password',
+        data={'current_password': password, 'password': 'N3wPassw0rd!'},
+        headers=headers,
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert client.post('/api/v1/logout', headers=headers).status_code == HTTPStatus.UNAUTHORIZED
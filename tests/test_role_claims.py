@@ -0,0 +1,178 @@
+import asyncio
+import json
+import time
+import uuid
+
+import pytest
+
+from base.low_level import AsyncCacheRedis
+from base.low_level import CacheRedis
+from base.role_claims import AsyncRoleClaimsCache
+from base.role_claims import RoleClaimsCache
+from db.redis_db import create_async_client
+
+
+class RolesTable:
+    """Роли пользователей вместо БД. on_read вызывается после чтения,
+        как если бы роли изменили, пока ответ БД шел к воркеру.
+    """
+
+    def __init__(self, roles: list, on_read=None):
+        self.roles = roles
+        self.on_read = on_read
+        self.reads = 0
+
+    def get_related_values(self, model, relation: str, column: str, filter_: dict) -> list:
+        self.reads += 1
+        roles = list(self.roles)
+        if self.on_read is not None:
+            on_read, self.on_read = self.on_read, None
+            on_read()
+        return roles
+
+
+class AsyncRolesTable(RolesTable):
+
+    async def get_related_values(self, model, relation: str, column: str, filter_: dict) -> list:
+        self.reads += 1
+        roles = list(self.roles)
+        if self.on_read is not None:
+            on_read, self.on_read = self.on_read, None
+            await on_read()
+        return roles
+
+
+def async_cache_db() -> AsyncCacheRedis:
+    """Свой клиент: общий привязан к event loop, а каждый asyncio.run создает новый."""
+    return AsyncCacheRedis(client_factory=create_async_client)
+
+
+@pytest.fixture
+def user_id(redis_client):
+    user_id = uuid.uuid4()
+    yield user_id
+    redis_client.delete(f'user_roles:{user_id}', f'user_roles_version:{user_id}')
+
+
+def test_roles_are_cached(redis_client, user_id):
+    table = RolesTable(['user', 'admin'])
+    cache = RoleClaimsCache(cache_db=CacheRedis(), orm=table, local_ttl=0)
+
+    assert cache.get_roles(user_id) == ['admin', 'user']
+    assert cache.get_roles(user_id) == ['admin', 'user']
+    assert table.reads == 1
+    assert json.loads(redis_client.get(f'user_roles:{user_id}')) == ['admin', 'user']
+
+
+def test_invalidate_drops_cached_roles(redis_client, user_id):
+    table = RolesTable(['user'])
+    cache = RoleClaimsCache(cache_db=CacheRedis(), orm=table)
+    cache.get_roles(user_id)
+
+    table.roles = ['user', 'admin']
+    cache.invalidate(user_id)
+
+    assert redis_client.get(f'user_roles:{user_id}') is None
+    assert cache.get_roles(user_id) == ['admin', 'user']
+
+
+def test_invalidate_during_fill_is_not_overwritten(redis_client, user_id):
+    cache = RoleClaimsCache(cache_db=CacheRedis(), orm=None, local_ttl=60)
+
+    def revoke_admin():
+        table.roles = ['user']
+        cache.invalidate(user_id)
+
+    table = RolesTable(['admin', 'user'], on_read=revoke_admin)
+    cache.orm = table
+
+    # Этот запрос прочитал роли до сброса и отдает их, но не кеширует
+    assert cache.get_roles(user_id) == ['admin', 'user']
+    assert redis_client.get(f'user_roles:{user_id}') is None
+    assert cache.get_roles(user_id) == ['user']
+    assert table.reads == 2
+
+
+def test_async_invalidate_during_fill_is_not_overwritten(redis_client, user_id):
+    cache = AsyncRoleClaimsCache(cache_db=async_cache_db(), orm=None, local_ttl=60)
+
+    async def revoke_admin():
+        table.roles = ['user']
+        await cache.invalidate(user_id)
+
+    table = AsyncRolesTable(['admin', 'user'], on_read=revoke_admin)
+    cache.orm = table
+
+    async def scenario():
+        first = await cache.get_roles(user_id)
+        cached = redis_client.get(f'user_roles:{user_id}')
+        return first, cached, await cache.get_roles(user_id)
+
+    assert asyncio.run(scenario()) == (['admin', 'user'], None, ['user'])
+    assert table.reads == 2
+
+
+def test_remember_fills_empty_cache(redis_client, user_id):
+    cache = RoleClaimsCache(cache_db=CacheRedis(), orm=RolesTable([]), local_ttl=0)
+
+    cache.remember(user_id, ['admin', 'user'], time.monotonic())
+
+    assert json.loads(redis_client.get(f'user_roles:{user_id}')) == ['admin', 'user']
+    assert cache.get_roles(user_id) == ['admin', 'user']
+    assert cache.orm.reads == 0
+
+
+def test_remember_does_not_overwrite_cached_roles(redis_client, user_id):
+    cache = RoleClaimsCache(cache_db=CacheRedis(), orm=RolesTable(['user']), local_ttl=0)
+    cache.get_roles(user_id)
+
+    cache.remember(user_id, ['admin'], time.monotonic())
+
+    assert json.loads(redis_client.get(f'user_roles:{user_id}')) == ['user']
+
+
+def test_remember_skips_roles_read_before_invalidate(redis_client, user_id):
+    cache = RoleClaimsCache(cache_db=CacheRedis(), orm=RolesTable(['user']), local_ttl=60)
+
+    read_started = time.monotonic()
+    cache.invalidate(user_id)
+    cache.remember(user_id, ['admin', 'user'], read_started)
+
+    assert redis_client.get(f'user_roles:{user_id}') is None
+    assert cache.get_roles(user_id) == ['user']
+
+
+def test_remember_after_earlier_invalidate(redis_client, user_id):
+    cache = RoleClaimsCache(cache_db=CacheRedis(), orm=RolesTable([]), local_ttl=0)
+    cache.remember_margin = 0
+    cache.invalidate(user_id)
+    time.sleep(0.05)
+
+    cache.remember(user_id, ['user'], time.monotonic())
+
+    assert json.loads(redis_client.get(f'user_roles:{user_id}')) == ['user']
+
+
+def test_invalidate_versions_increase(redis_client, user_id):
+    cache = RoleClaimsCache(cache_db=CacheRedis(), orm=RolesTable([]))
+    versions = []
+    for _ in range(3):
+        cache.invalidate(user_id)
+        versions.append(int(redis_client.get(f'user_roles_version:{user_id}')))
+
+    assert versions == sorted(set(versions))
+    assert versions[0] >= int(time.time() * 1000) - 5000
+
+
+def test_async_remember_skips_roles_read_before_invalidate(redis_client, user_id):
+    cache = AsyncRoleClaimsCache(cache_db=async_cache_db(), orm=AsyncRolesTable(['user']), local_ttl=60)
+
+    async def scenario():
+        read_started = time.monotonic()
+        await cache.invalidate(user_id)
+        await cache.remember(user_id, ['admin', 'user'], read_started)
+        cached = redis_client.get(f'user_roles:{user_id}')
+        await cache.remember(user_id, ['user'], time.monotonic() + cache.remember_margin + 1)
+        return cached, json.loads(redis_client.get(f'user_roles:{user_id}'))
+
+    assert asyncio.run(scenario()) == (None, ['user'])
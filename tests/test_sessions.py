@@ -0,0 +1,91 @@
+import time
+import uuid
+from http import HTTPStatus
+
+import pytest
+
+from base.sessions import SessionStore
+
+
+@pytest.fixture
+def store(redis_client):
+    return SessionStore(redis=redis_client, max_per_user=2)
+
+
+@pytest.fixture
+def user_id(redis_client):
+    user_id = uuid.uuid4()
+    yield user_id
+    redis_client.delete(f'sessions:{user_id}')
+
+
+def put_session(redis_client, store, user_id, session_id: str, refresh_jti: str, expires_at: int, created_at: int):
+    redis_client.hset(
+        f'sessions:{user_id}', session_id, f'{store.digest(refresh_jti)}:{expires_at}:{created_at}:agent',
+    )
+
+
+def sessions(redis_client, user_id) -> set:
+    return {field.decode() for field in redis_client.hkeys(f'sessions:{user_id}')}
+
+
+def test_rotate_with_current_token(store, user_id):
+    store.create(user_id, 'phone', 'jti-1', 'agent')
+
+    assert store.rotate(user_id, 'phone', 'jti-1', 'jti-2')
+    assert store.rotate(user_id, 'phone', 'jti-2', 'jti-3')
+
+
+def test_rotate_rejects_reused_token(store, user_id):
+    store.create(user_id, 'phone', 'jti-1')
+    store.rotate(user_id, 'phone', 'jti-1', 'jti-2')
+
+    assert not store.rotate(user_id, 'phone', 'jti-1', 'jti-3')
+    # Отказ не меняет сессию: действующий токен по-прежнему принимается
+    assert store.rotate(user_id, 'phone', 'jti-2', 'jti-3')
+
+
+def test_rotate_rejects_unknown_and_revoked_sessions(store, user_id):
+    store.create(user_id, 'phone', 'jti-1')
+    store.create(user_id, 'laptop', 'jti-2')
+
+    assert not store.rotate(user_id, 'tablet', 'jti-1', 'jti-3')
+    store.revoke(user_id, 'phone')
+    assert not store.rotate(user_id, 'phone', 'jti-1', 'jti-3')
+    store.revoke_all(user_id)
+    assert not store.rotate(user_id, 'laptop', 'jti-2', 'jti-3')
+
+
+def test_rotate_rejects_expired_session(redis_client, store, user_id):
+    now = int(time.time())
+    put_session(redis_client, store, user_id, 'phone', 'jti-1', expires_at=now - 1, created_at=now - 100)
+
+    assert not store.rotate(user_id, 'phone', 'jti-1', 'jti-2')
+
+
+def test_create_evicts_expired_then_oldest_sessions(redis_client, store, user_id):
+    now = int(time.time())
+    put_session(redis_client, store, user_id, 'expired', 'jti-1', expires_at=now - 1, created_at=now - 10)
+    put_session(redis_client, store, user_id, 'oldest', 'jti-2', expires_at=now + 100, created_at=now - 300)
+    put_session(redis_client, store, user_id, 'older', 'jti-3', expires_at=now + 100, created_at=now - 200)
+
+    store.create(user_id, 'new', 'jti-4')
+
+    assert sessions(redis_client, user_id) == {'older', 'new'}
+    assert redis_client.ttl(f'sessions:{user_id}') > 0
+
+
+def test_create_within_limit_keeps_sessions(redis_client, store, user_id):
+    store.create(user_id, 'phone', 'jti-1')
+    store.create(user_id, 'laptop', 'jti-2')
+
+    assert sessions(redis_client, user_id) == {'phone', 'laptop'}
+
+
+def test_refresh_token_is_single_use(client, make_user):
+    _, login, password = make_user()
+    tokens = client.post('/api/v1/login', data={'username': login, 'password': password}).get_json()
+    refresh = {'Authorization': f"Bearer {tokens['refresh_token']}"}
+
+    assert client.post('/api/v1/refresh', headers=refresh).status_code == HTTPStatus.OK
+    assert client.post('/api/v1/refresh', headers=refresh).status_code == HTTPStatus.BAD_REQUEST
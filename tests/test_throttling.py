@@ -0,0 +1,113 @@
+import math
+import time
+import uuid
+from http import HTTPStatus
+
+import pytest
+from redis import Redis
+from werkzeug.exceptions import HTTPException
+
+from base.throttling import LoginThrottle
+
+
+def make_throttle(redis, login=(0, 60), ip=(0, 60), global_=(0, 60)) -> LoginThrottle:
+    throttle = LoginThrottle(redis=redis, enabled=True, limits={'login': login, 'ip': ip, 'global': global_})
+    # Свои ключи у каждого теста, в том числе для общего окна
+    throttle.key_prefix = f'login_throttle_test:{uuid.uuid4().hex}'
+    return throttle
+
+
+def retry_after(throttle: LoginThrottle, login: str, ip: str = None) -> int:
+    with pytest.raises(HTTPException) as error:
+        throttle.check(login, ip)
+    response = error.value.get_response()
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    return int(response.headers['Retry-After'])
+
+
+def test_login_window_allows_up_to_limit(redis_client):
+    throttle = make_throttle(redis_client, login=(3, 60))
+
+    for _ in range(3):
+        throttle.check('alice', '10.0.0.1')
+
+    assert 1 <= retry_after(throttle, 'alice', '10.0.0.1') <= 120
+    # Другой логин считается отдельно
+    throttle.check('bob', '10.0.0.1')
+    assert throttle.stats()['allowed'] == 4
+    assert throttle.stats()['throttled'] == 1
+
+
+def test_denied_attempts_are_not_counted(redis_client):
+    throttle = make_throttle(redis_client, login=(2, 60))
+    throttle.check('alice', None)
+    throttle.check('alice', None)
+
+    first = retry_after(throttle, 'alice', None)
+    for _ in range(5):
+        retry_after(throttle, 'alice', None)
+
+    assert retry_after(throttle, 'alice', None) <= first
+
+
+def test_ip_and_global_windows(redis_client):
+    throttle = make_throttle(redis_client, ip=(2, 60), global_=(3, 60))
+
+    throttle.check('alice', '10.0.0.1')
+    throttle.check('bob', '10.0.0.1')
+    retry_after(throttle, 'carol', '10.0.0.1')
+    throttle.check('carol', '10.0.0.2')
+    # Общее окно исчерпано для всех адресов
+    retry_after(throttle, 'dave', '10.0.0.3')
+
+
+def set_previous_window(redis, throttle: LoginThrottle, login: str, window: int, attempts: int) -> float:
+    """Записывает попытки в предыдущее окно, возвращает долю прошедшего текущего окна."""
+    now = time.time()
+    number = int(now // window)
+    redis.set(f'{throttle.key_prefix}:login:{throttle._login_digest(login)}:{number - 1}', attempts, ex=window)
+    return (now - number * window) / window
+
+
+def test_previous_window_is_weighted(redis_client):
+    window, limit = 3600, 10
+    throttle = make_throttle(redis_client, login=(limit, window))
+
+    # Доля предыдущего окна, которая еще в скользящем окне, сама исчерпывает лимит
+    elapsed = set_previous_window(redis_client, throttle, 'alice', window, 0)
+    set_previous_window(redis_client, throttle, 'alice', window, math.ceil(limit / (1 - elapsed)) + limit)
+    assert 1 <= retry_after(throttle, 'alice', None) <= 2 * window
+
+    # Полное предыдущее окно весит меньше лимита, если текущее уже началось
+    set_previous_window(redis_client, throttle, 'bob', window, limit)
+    throttle.check('bob', None)
+
+
+def test_disabled_windows_are_skipped(redis_client):
+    throttle = make_throttle(redis_client)
+
+    for _ in range(100):
+        throttle.check('alice', '10.0.0.1')
+    assert throttle.stats()['allowed'] == 0
+
+
+def test_redis_errors_do_not_block_login():
+    throttle = LoginThrottle(redis=Redis(port=1, socket_connect_timeout=0.1), enabled=True)
+
+    throttle.check('alice', '10.0.0.1')
+
+    assert throttle.stats()['errors'] == 1
+
+
+def test_login_endpoint_returns_retry_after(client, make_user):
+    from core import config
+
+    _, login, _ = make_user()
+    for _ in range(config.LOGIN_THROTTLE_LOGIN_LIMIT):
+        response = client.post('/api/v1/login', data={'username': login, 'password': 'wrong'})
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+
+    response = client.post('/api/v1/login', data={'username': login, 'password': 'wrong'})
+
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert int(response.headers['Retry-After']) >= 1